@@ -0,0 +1,26 @@
+"""add inventory batch version
+
+Revision ID: a41c7e2f9b10
+Revises: 6738310db19b
+Create Date: 2026-10-18 09:12:40.221583
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a41c7e2f9b10'
+down_revision: Union[str, None] = '6738310db19b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('inventory_batches', sa.Column('version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    op.drop_column('inventory_batches', 'version')
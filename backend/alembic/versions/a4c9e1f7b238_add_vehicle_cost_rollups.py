@@ -0,0 +1,80 @@
+"""add vehicle cost rollups
+
+Revision ID: a4c9e1f7b238
+Revises: f2b6d8e14a57
+Create Date: 2026-10-18 16:40:27.518903
+
+The rollups of every tenant are filled from the existing fuel logs,
+maintenance logs and expenses (same grouping as
+services.fleet_costs.backfill_statement).
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+BACKFILL_SQL = """
+INSERT INTO vehicle_cost_rollups (
+    id, tenant_id, vehicle_id, month,
+    fuel_cost, fuel_liters, fuel_count, distance_km, distance_liters,
+    maintenance_cost, maintenance_count, expense_cost, expense_count, updated_at
+)
+SELECT gen_random_uuid(), tenant_id, vehicle_id, month,
+       sum(fuel_cost), sum(fuel_liters), sum(fuel_count), sum(distance_km), sum(distance_liters),
+       sum(maintenance_cost), sum(maintenance_count), sum(expense_cost), sum(expense_count), now()
+FROM (
+    SELECT tenant_id, vehicle_id, CAST(date_trunc('month', date) AS DATE) AS month,
+           total_cost AS fuel_cost, liters AS fuel_liters, 1 AS fuel_count,
+           coalesce(distance_traveled, 0) AS distance_km,
+           CASE WHEN distance_traveled IS NOT NULL THEN liters ELSE 0 END AS distance_liters,
+           0 AS maintenance_cost, 0 AS maintenance_count, 0 AS expense_cost, 0 AS expense_count
+    FROM vehicle_fuel_logs
+    UNION ALL
+    SELECT tenant_id, vehicle_id, CAST(date_trunc('month', date) AS DATE),
+           0, 0, 0, 0, 0, total_cost, 1, 0, 0
+    FROM vehicle_maintenance_logs
+    UNION ALL
+    SELECT tenant_id, vehicle_id, CAST(date_trunc('month', date) AS DATE),
+           0, 0, 0, 0, 0, 0, 0, amount, 1
+    FROM vehicle_expenses
+) AS cost_sources
+GROUP BY tenant_id, vehicle_id, month
+"""
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4c9e1f7b238'
+down_revision: Union[str, None] = 'f2b6d8e14a57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'vehicle_cost_rollups',
+        sa.Column('id', sa.UUID(), nullable=False),
+        sa.Column('tenant_id', sa.UUID(), nullable=False),
+        sa.Column('vehicle_id', sa.UUID(), nullable=False),
+        sa.Column('month', sa.Date(), nullable=False),
+        sa.Column('fuel_cost', sa.Float(), nullable=False),
+        sa.Column('fuel_liters', sa.Float(), nullable=False),
+        sa.Column('fuel_count', sa.Integer(), nullable=False),
+        sa.Column('distance_km', sa.Float(), nullable=False),
+        sa.Column('distance_liters', sa.Float(), nullable=False),
+        sa.Column('maintenance_cost', sa.Float(), nullable=False),
+        sa.Column('maintenance_count', sa.Integer(), nullable=False),
+        sa.Column('expense_cost', sa.Float(), nullable=False),
+        sa.Column('expense_count', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['tenant_id'], ['tenants.id'], ),
+        sa.ForeignKeyConstraint(['vehicle_id'], ['vehicles.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('vehicle_id', 'month', name='uq_vehicle_cost_rollups_vehicle_month')
+    )
+    op.create_index('ix_vehicle_cost_rollups_tenant_month', 'vehicle_cost_rollups', ['tenant_id', 'month'], unique=False)
+    op.execute(BACKFILL_SQL)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_vehicle_cost_rollups_tenant_month', table_name='vehicle_cost_rollups')
+    op.drop_table('vehicle_cost_rollups')
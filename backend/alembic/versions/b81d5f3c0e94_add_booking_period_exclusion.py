@@ -0,0 +1,53 @@
+"""add booking period exclusion constraints
+
+Revision ID: b81d5f3c0e94
+Revises: a4c9e1f7b238
+Create Date: 2026-10-18 17:52:44.061387
+
+Active bookings (PENDING, APPROVED, IN_USE) that overlap for the same
+vehicle or driver must be cancelled or rescheduled before upgrading,
+otherwise adding the constraints fails.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b81d5f3c0e94'
+down_revision: Union[str, None] = 'a4c9e1f7b238'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ACTIVE_WHERE = "status IN ('PENDING', 'APPROVED', 'IN_USE')"
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+    op.add_column(
+        'vehicle_bookings',
+        sa.Column(
+            'period',
+            postgresql.TSRANGE(),
+            sa.Computed("tsrange(start_datetime, end_datetime, '[)')", persisted=True),
+            nullable=True
+        )
+    )
+    op.create_exclude_constraint(
+        'excl_vehicle_bookings_vehicle_period', 'vehicle_bookings',
+        ('vehicle_id', '='), ('period', '&&'),
+        using='gist', where=ACTIVE_WHERE
+    )
+    op.create_exclude_constraint(
+        'excl_vehicle_bookings_driver_period', 'vehicle_bookings',
+        ('driver_id', '='), ('period', '&&'),
+        using='gist', where=ACTIVE_WHERE
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint('excl_vehicle_bookings_driver_period', 'vehicle_bookings', type_='exclude')
+    op.drop_constraint('excl_vehicle_bookings_vehicle_period', 'vehicle_bookings', type_='exclude')
+    op.drop_column('vehicle_bookings', 'period')
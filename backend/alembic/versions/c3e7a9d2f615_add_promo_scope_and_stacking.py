@@ -0,0 +1,38 @@
+"""add promo product scope and stacking
+
+Revision ID: c3e7a9d2f615
+Revises: b81d5f3c0e94
+Create Date: 2026-10-18 18:41:09.527316
+
+pos_promos is created by the application at startup; the columns are only
+added when the table already exists.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3e7a9d2f615'
+down_revision: Union[str, None] = 'b81d5f3c0e94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_promos() -> bool:
+    return sa.inspect(op.get_bind()).has_table('pos_promos')
+
+
+def upgrade() -> None:
+    if not _has_promos():
+        return
+    op.add_column('pos_promos', sa.Column('product_ids', sa.JSON(), nullable=True))
+    op.add_column('pos_promos', sa.Column('is_stackable', sa.Boolean(), nullable=True, server_default=sa.false()))
+
+
+def downgrade() -> None:
+    if not _has_promos():
+        return
+    op.drop_column('pos_promos', 'is_stackable')
+    op.drop_column('pos_promos', 'product_ids')
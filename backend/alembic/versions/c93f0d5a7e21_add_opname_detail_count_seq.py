@@ -0,0 +1,28 @@
+"""add opname detail count seq
+
+Revision ID: c93f0d5a7e21
+Revises: a41c7e2f9b10
+Create Date: 2026-10-18 10:03:17.584102
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c93f0d5a7e21'
+down_revision: Union[str, None] = 'a41c7e2f9b10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('stock_opname_details', sa.Column('count_device', sa.String(64), nullable=True))
+    op.add_column('stock_opname_details', sa.Column('count_seq', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('stock_opname_details', 'count_seq')
+    op.drop_column('stock_opname_details', 'count_device')
@@ -0,0 +1,45 @@
+"""add employee face embedding
+
+Revision ID: d51b8e3a6f02
+Revises: c93f0d5a7e21
+Create Date: 2026-10-18 11:24:41.310275
+
+"""
+from typing import Sequence, Union
+import json
+import struct
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd51b8e3a6f02'
+down_revision: Union[str, None] = 'c93f0d5a7e21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('employees', sa.Column('face_embedding', sa.LargeBinary(), nullable=True))
+
+    # Backfill float32 bytes from the JSON encodings (placeholders are skipped)
+    conn = op.get_bind()
+    rows = conn.execute(sa.text(
+        "SELECT id, face_encoding FROM employees WHERE face_encoding LIKE '[%'"
+    )).fetchall()
+    for row in rows:
+        try:
+            values = json.loads(row.face_encoding)
+        except ValueError:
+            continue
+        if len(values) != 128:
+            continue
+        conn.execute(
+            sa.text("UPDATE employees SET face_embedding = :embedding WHERE id = :id"),
+            {"embedding": struct.pack('<128f', *values), "id": row.id}
+        )
+
+
+def downgrade() -> None:
+    op.drop_column('employees', 'face_embedding')
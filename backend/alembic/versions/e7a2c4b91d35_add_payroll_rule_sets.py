@@ -0,0 +1,41 @@
+"""add payroll rule sets
+
+Revision ID: e7a2c4b91d35
+Revises: d51b8e3a6f02
+Create Date: 2026-10-18 13:02:55.847120
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a2c4b91d35'
+down_revision: Union[str, None] = 'd51b8e3a6f02'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'payroll_rule_sets',
+        sa.Column('id', sa.UUID(), nullable=False),
+        sa.Column('tenant_id', sa.UUID(), nullable=False),
+        sa.Column('rules', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('updated_by', sa.UUID(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['tenant_id'], ['tenants.id'], ),
+        sa.ForeignKeyConstraint(['updated_by'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_payroll_rule_sets_tenant_id'), 'payroll_rule_sets', ['tenant_id'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_payroll_rule_sets_tenant_id'), table_name='payroll_rule_sets')
+    op.drop_table('payroll_rule_sets')
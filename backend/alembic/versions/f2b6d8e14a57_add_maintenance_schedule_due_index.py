@@ -0,0 +1,31 @@
+"""add maintenance schedule due index
+
+Revision ID: f2b6d8e14a57
+Revises: e7a2c4b91d35
+Create Date: 2026-10-18 14:21:09.314552
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b6d8e14a57'
+down_revision: Union[str, None] = 'e7a2c4b91d35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_maintenance_schedules_tenant_active_due',
+        'maintenance_schedules',
+        ['tenant_id', 'is_active', 'next_due'],
+        unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_maintenance_schedules_tenant_active_due', table_name='maintenance_schedules')
@@ -0,0 +1,121 @@
+"""
+Stress benchmark: many coroutines hammering ONE hot InventoryBatch.
+
+Modes:
+  atomic      - conditional UPDATE ... WHERE qty >= n RETURNING (services.batch_stock)
+  optimistic  - ORM read-modify-write guarded by the version column + run_with_retry
+
+Checks that the batch never oversells (final qty == start - successes * qty, never < 0)
+and reports throughput and latency. The batch quantity is restored afterwards.
+
+Run with: docker compose exec backend_api python -m benchmarks.bench_batch_contention --batch-id <uuid>
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.exc import DBAPIError
+from database import DATABASE_URL
+import models
+from services.batch_stock import decrement_batch, run_with_retry, InsufficientStockError
+
+
+async def atomic_take(db: AsyncSession, batch_id: uuid.UUID, qty: float) -> bool:
+    async def op():
+        await decrement_batch(db, batch_id, qty)
+        await db.commit()
+    try:
+        await run_with_retry(db, op)
+        return True
+    except InsufficientStockError:
+        await db.rollback()
+        return False
+
+
+async def optimistic_take(db: AsyncSession, batch_id: uuid.UUID, qty: float) -> bool:
+    async def op():
+        db.expunge_all()
+        batch = await db.get(models.InventoryBatch, batch_id)
+        if batch.quantity_on_hand < qty:
+            raise InsufficientStockError("Insufficient quantity in batch")
+        batch.quantity_on_hand -= qty
+        await db.commit()
+    try:
+        await run_with_retry(db, op, attempts=20, base_delay=0.005)
+        return True
+    except (InsufficientStockError, StaleDataError, DBAPIError):
+        await db.rollback()
+        return False
+
+
+async def main(args):
+    engine = create_async_engine(DATABASE_URL, pool_size=args.pool, max_overflow=0)
+    Session = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    batch_id = uuid.UUID(args.batch_id)
+
+    async with Session() as db:
+        batch = await db.get(models.InventoryBatch, batch_id)
+        if not batch:
+            raise SystemExit(f"Batch {batch_id} not found")
+        original_qty = batch.quantity_on_hand
+        await db.execute(
+            update(models.InventoryBatch)
+            .where(models.InventoryBatch.id == batch_id)
+            .values(quantity_on_hand=args.start_qty)
+        )
+        await db.commit()
+
+    take = atomic_take if args.mode == "atomic" else optimistic_take
+    latencies = []
+
+    async def worker():
+        async with Session() as db:
+            started = time.perf_counter()
+            ok = await take(db, batch_id, args.qty)
+            latencies.append(time.perf_counter() - started)
+            return ok
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(worker() for _ in range(args.workers)))
+    elapsed = time.perf_counter() - started
+
+    async with Session() as db:
+        batch = await db.get(models.InventoryBatch, batch_id)
+        final_qty = batch.quantity_on_hand
+        await db.execute(
+            update(models.InventoryBatch)
+            .where(models.InventoryBatch.id == batch_id)
+            .values(quantity_on_hand=original_qty)
+        )
+        await db.commit()
+    await engine.dispose()
+
+    successes = sum(results)
+    expected_final = args.start_qty - successes * args.qty
+    latencies.sort()
+    print(f"mode={args.mode} workers={args.workers} pool={args.pool}")
+    print(f"successes={successes} rejected={args.workers - successes} elapsed={elapsed:.2f}s "
+          f"throughput={args.workers / elapsed:.0f} req/s")
+    print(f"latency p50={statistics.median(latencies) * 1000:.1f}ms "
+          f"p95={latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f}ms")
+    print(f"start={args.start_qty} final={final_qty} expected={expected_final}")
+
+    if final_qty < 0 or abs(final_qty - expected_final) > 1e-6:
+        raise SystemExit("FAIL: batch oversold or lost an update")
+    print("OK: no oversell, no lost updates")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-id", required=True)
+    parser.add_argument("--mode", choices=["atomic", "optimistic"], default="atomic")
+    parser.add_argument("--workers", type=int, default=500)
+    parser.add_argument("--pool", type=int, default=20)
+    parser.add_argument("--qty", type=float, default=1.0)
+    parser.add_argument("--start-qty", type=float, default=300.0)
+    asyncio.run(main(parser.parse_args()))
@@ -16,6 +16,10 @@ from connections.kafka_utils import get_kafka_producer, close_kafka_producer
 from consumers.finance_consumer import start_finance_consumer
 import asyncio
 from connections.worker import consume_lab_data
+from services.biometric_pool import shutdown_biometric_pool
+from services.maintenance_scheduler import run_maintenance_scheduler
+from services.gps_history import run_history_flusher
+from services.promo_redemptions import run_usage_flusher
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -32,12 +36,25 @@ async def lifespan(app: FastAPI):
     # In production, this should be a separate service.
     worker_task = asyncio.create_task(consume_lab_data())
     asyncio.create_task(start_finance_consumer())
+    # Preventive maintenance work orders (one leader per tick across replicas)
+    scheduler_task = asyncio.create_task(run_maintenance_scheduler())
+    # Buffered GPS history writes to MongoDB
+    history_task = asyncio.create_task(run_history_flusher())
+    # Promo usage counts from Redis to pos_promos
+    usage_task = asyncio.create_task(run_usage_flusher())
     
     yield
     
+    scheduler_task.cancel()
+    # Cancelling the flusher writes what is still buffered
+    history_task.cancel()
+    usage_task.cancel()
+    await asyncio.gather(history_task, usage_task, return_exceptions=True)
+    
     # Cleanup
     await close_mongo_connection()
     await close_kafka_producer()
+    shutdown_biometric_pool()
 
 app = FastAPI(title="Mini ERP API", version="1.0.0", lifespan=lifespan)
 
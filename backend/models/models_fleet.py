@@ -2,8 +2,8 @@
 Fleet Management Module Models
 Handles vehicle registration, bookings, fuel tracking, maintenance, expenses, and reminders
 """
-from sqlalchemy import Column, String, Text, Float, Integer, Boolean, DateTime, Date, ForeignKey, Enum
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, String, Text, Float, Integer, Boolean, DateTime, Date, ForeignKey, Enum, Index, UniqueConstraint, Computed, DDL, event
+from sqlalchemy.dialects.postgresql import UUID, TSRANGE, ExcludeConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
@@ -202,9 +202,25 @@ class Vehicle(Base):
 
 # ==================== BOOKINGS ====================
 
+# Bookings that hold their vehicle and driver for their time window
+ACTIVE_BOOKING_STATUSES = ('PENDING', 'APPROVED', 'IN_USE')
+_ACTIVE_BOOKING_WHERE = "status IN ('PENDING', 'APPROVED', 'IN_USE')"
+
+
 class VehicleBooking(Base):
     """Vehicle usage scheduling"""
     __tablename__ = "vehicle_bookings"
+    __table_args__ = (
+        # No two active bookings of a vehicle (or a driver) overlap in time
+        ExcludeConstraint(
+            ('vehicle_id', '='), ('period', '&&'),
+            name='excl_vehicle_bookings_vehicle_period', using='gist', where=_ACTIVE_BOOKING_WHERE
+        ),
+        ExcludeConstraint(
+            ('driver_id', '='), ('period', '&&'),
+            name='excl_vehicle_bookings_driver_period', using='gist', where=_ACTIVE_BOOKING_WHERE
+        ),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id"), nullable=False, index=True)
@@ -230,6 +246,7 @@ class VehicleBooking(Base):
     # Time
     start_datetime = Column(DateTime, nullable=False)
     end_datetime = Column(DateTime, nullable=False)
+    period = Column(TSRANGE, Computed("tsrange(start_datetime, end_datetime, '[)')", persisted=True))
     actual_start = Column(DateTime, nullable=True)
     actual_end = Column(DateTime, nullable=True)
     
@@ -261,6 +278,14 @@ class VehicleBooking(Base):
     driver = relationship("FleetDriver")
 
 
+# The exclusion constraints compare UUIDs with =, which GiST only supports
+# through btree_gist; create_all at startup must be able to build them too.
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS btree_gist").execute_if(dialect="postgresql")
+)
+
 
 # ==================== FUEL LOGS ====================
 
@@ -378,6 +403,37 @@ class VehicleExpense(Base):
     vehicle = relationship("Vehicle", back_populates="expenses")
 
 
+# ==================== COST ROLLUPS ====================
+
+class VehicleCostRollup(Base):
+    """Monthly cost totals per vehicle, kept up to date on fuel, maintenance and expense writes (services.fleet_costs)"""
+    __tablename__ = "vehicle_cost_rollups"
+    __table_args__ = (
+        UniqueConstraint('vehicle_id', 'month', name='uq_vehicle_cost_rollups_vehicle_month'),
+        Index('ix_vehicle_cost_rollups_tenant_month', 'tenant_id', 'month'),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id"), nullable=False)
+    vehicle_id = Column(UUID(as_uuid=True), ForeignKey("vehicles.id"), nullable=False)
+    month = Column(Date, nullable=False)  # First day of the month
+    
+    # Fuel
+    fuel_cost = Column(Float, default=0, nullable=False)
+    fuel_liters = Column(Float, default=0, nullable=False)
+    fuel_count = Column(Integer, default=0, nullable=False)
+    distance_km = Column(Float, default=0, nullable=False)  # Sum of distance_traveled
+    distance_liters = Column(Float, default=0, nullable=False)  # Liters of the fills with a distance (efficiency basis)
+    
+    # Maintenance and other expenses
+    maintenance_cost = Column(Float, default=0, nullable=False)
+    maintenance_count = Column(Integer, default=0, nullable=False)
+    expense_cost = Column(Float, default=0, nullable=False)
+    expense_count = Column(Integer, default=0, nullable=False)
+    
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
 # ==================== REMINDERS ====================
 
 class VehicleReminder(Base):
@@ -167,7 +167,8 @@ class Employee(Base):
     # Photos & Biometrics
     profile_photo_url = Column(String(500), nullable=True)  # Cloudinary URL
     id_card_photo_url = Column(String(500), nullable=True)  # Cloudinary URL
-    face_encoding = Column(Text, nullable=True)  # JSON encoded face embedding
+    face_encoding = Column(Text, nullable=True)  # Legacy JSON face embedding / simplified-mode placeholder
+    face_embedding = Column(LargeBinary, nullable=True)  # 128 x float32 face embedding (services.face_index)
     fingerprint_data = Column(Text, nullable=True)  # Encoded fingerprint template
     fingerprint_id = Column(String(100), nullable=True)  # Browser fingerprint ID for check-in
     
@@ -500,6 +501,20 @@ class Payslip(Base):
     employee = relationship("Employee", back_populates="payslips")
 
 
+class PayrollRuleSet(Base):
+    """Tenant payroll rules (tax brackets, contribution caps, allowances) - see services.payroll_rules"""
+    __tablename__ = "payroll_rule_sets"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id"), nullable=False, unique=True, index=True)
+    rules = Column(JSONB, nullable=False)
+    version = Column(Integer, nullable=False, default=1)  # Bumped on every change (plan cache key)
+    updated_by = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=True)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
 # ==================== PERFORMANCE ====================
 
 class KPI(Base):
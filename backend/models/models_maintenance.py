@@ -2,7 +2,7 @@
 Maintenance Module Models
 Handles asset management, work orders, maintenance schedules, and cost tracking
 """
-from sqlalchemy import Column, String, Text, Float, Integer, Boolean, DateTime, Date, ForeignKey
+from sqlalchemy import Column, String, Text, Float, Integer, Boolean, DateTime, Date, ForeignKey, Index
 from sqlalchemy.dialects.postgresql import UUID, JSON
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -177,3 +177,8 @@ class MaintenanceSchedule(Base):
     
     # Relationships
     asset = relationship("Asset", back_populates="schedules")
+    
+    # Due-schedule scans (services.maintenance_scheduler)
+    __table_args__ = (
+        Index('ix_maintenance_schedules_tenant_active_due', 'tenant_id', 'is_active', 'next_due'),
+    )
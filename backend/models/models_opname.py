@@ -9,6 +9,7 @@ from database import Base
 
 class OpnameStatus(str, enum.Enum):
     DRAFT = "DRAFT"            # Legacy - old records (backward compatibility)
+    SNAPSHOTTING = "Snapshotting"  # Stock snapshot still running in the background
     SCHEDULED = "Scheduled"    # Opname scheduled, not started
     IN_PROGRESS = "In Progress"  # Counting in progress
     COUNTING_DONE = "Counting Done"  # Counting complete, pending review
@@ -98,7 +99,7 @@ class StockOpname(Base):
     
     opname_number = Column(String(50), nullable=True)  # Auto-generated: OPN-YYYYMMDD-001
     date = Column(DateTime, default=datetime.utcnow)
-    status = Column(String(50), default="Scheduled")  # Scheduled, In Progress, Counting Done, Reviewed, Approved, Posted, Cancelled
+    status = Column(String(50), default="Scheduled")  # Snapshotting, Scheduled, In Progress, Counting Done, Reviewed, Approved, Posted, Cancelled
     notes = Column(Text, nullable=True)
     
     # Progress tracking
@@ -164,6 +165,10 @@ class StockOpnameDetail(Base):
     # Flag for recount
     needs_recount = Column(Boolean, default=False)
     recount_reason = Column(String(255), nullable=True)
+    
+    # Offline sync - last applied client sequence number per counting device
+    count_device = Column(String(64), nullable=True)
+    count_seq = Column(Integer, nullable=True)
 
     opname = relationship("StockOpname", back_populates="details")
     product = relationship("Product")
@@ -4,7 +4,7 @@ POS Models - Transaction, TransactionLog, Promo for Point of Sale system
 import uuid
 import enum
 from datetime import datetime
-from sqlalchemy import Column, String, DateTime, Float, Integer, Boolean, Text, ForeignKey, Enum as SQLEnum, JSON
+from sqlalchemy import Column, String, DateTime, Float, Integer, Boolean, Text, ForeignKey, Enum as SQLEnum, JSON, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -126,6 +126,8 @@ class Promo(Base, TenantMixin):
     # Conditions
     min_order = Column(Float, default=0)  # Minimum order amount
     max_discount = Column(Float, nullable=True)  # Maximum discount cap
+    product_ids = Column(JSON, nullable=True)  # Products the promo applies to (null = whole order)
+    is_stackable = Column(Boolean, default=False)  # Can be combined with other stackable promos
     
     # Validity
     start_date = Column(DateTime, nullable=True)
@@ -141,3 +143,18 @@ class Promo(Base, TenantMixin):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     created_by = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=True)
+
+
+class PromoRedemption(Base, TenantMixin):
+    """One use of a promo by a sale (per-customer redemption index)"""
+    __tablename__ = "pos_promo_redemptions"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    promo_id = Column(UUID(as_uuid=True), ForeignKey("pos_promos.id", ondelete="CASCADE"), nullable=False)
+    customer_id = Column(UUID(as_uuid=True), ForeignKey("sales_customers.id"), nullable=True)
+    transaction_id = Column(UUID(as_uuid=True), ForeignKey("pos_transactions.id"), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_pos_promo_redemptions_promo_customer", "promo_id", "customer_id"),
+    )
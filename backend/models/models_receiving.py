@@ -78,6 +78,12 @@ class InventoryBatch(Base):
     # QR Code data
     qr_code_data = Column(String, nullable=True)
 
+    # Optimistic concurrency token - bumped on every quantity change
+    version = Column(Integer, nullable=False, server_default="0")
+
     product = relationship("Product")
     location = relationship("Location")
     goods_receipt = relationship("GoodsReceipt")
+
+    # ORM writes check the version (raises StaleDataError on a lost update)
+    __mapper_args__ = {"version_id_col": version}
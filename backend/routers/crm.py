@@ -22,6 +22,7 @@ from models.models_crm import (
 )
 from models.models_pos import Promo, PromoType
 from auth import get_current_user
+from services import pos_pricing
 
 router = APIRouter(
     prefix="/crm",
@@ -1169,6 +1170,8 @@ class PromoCreate(BaseModel):
     value: float = 0
     min_order: float = 0
     max_discount: Optional[float] = None
+    product_ids: Optional[List[str]] = None
+    is_stackable: bool = False
     start_date: Optional[datetime] = None
     end_date: Optional[datetime] = None
     is_active: bool = True
@@ -1185,6 +1188,8 @@ class PromoResponse(BaseModel):
     value: float
     min_order: float = 0
     max_discount: Optional[float] = None
+    product_ids: Optional[List[str]] = None
+    is_stackable: bool = False
     start_date: Optional[datetime] = None
     end_date: Optional[datetime] = None
     is_active: bool = True
@@ -1218,6 +1223,8 @@ async def list_promos(
             value=p.value,
             min_order=p.min_order or 0,
             max_discount=p.max_discount,
+            product_ids=p.product_ids,
+            is_stackable=bool(p.is_stackable),
             start_date=p.start_date,
             end_date=p.end_date,
             is_active=p.is_active,
@@ -1250,6 +1257,8 @@ async def create_promo(
         value=payload.value,
         min_order=payload.min_order,
         max_discount=payload.max_discount,
+        product_ids=payload.product_ids,
+        is_stackable=payload.is_stackable,
         start_date=payload.start_date,
         end_date=payload.end_date,
         is_active=payload.is_active,
@@ -1260,6 +1269,7 @@ async def create_promo(
     db.add(promo)
     await db.commit()
     await db.refresh(promo)
+    await pos_pricing.invalidate_pricing(current_user.tenant_id)
     
     return PromoResponse(
         id=promo.id,
@@ -1270,6 +1280,8 @@ async def create_promo(
         value=promo.value,
         min_order=promo.min_order or 0,
         max_discount=promo.max_discount,
+        product_ids=promo.product_ids,
+        is_stackable=bool(promo.is_stackable),
         start_date=promo.start_date,
         end_date=promo.end_date,
         is_active=promo.is_active,
@@ -1309,6 +1321,8 @@ async def update_promo(
     promo.value = payload.value
     promo.min_order = payload.min_order
     promo.max_discount = payload.max_discount
+    promo.product_ids = payload.product_ids
+    promo.is_stackable = payload.is_stackable
     promo.start_date = payload.start_date
     promo.end_date = payload.end_date
     promo.is_active = payload.is_active
@@ -1317,6 +1331,7 @@ async def update_promo(
     
     await db.commit()
     await db.refresh(promo)
+    await pos_pricing.invalidate_pricing(current_user.tenant_id)
     
     return PromoResponse(
         id=promo.id,
@@ -1327,6 +1342,8 @@ async def update_promo(
         value=promo.value,
         min_order=promo.min_order or 0,
         max_discount=promo.max_discount,
+        product_ids=promo.product_ids,
+        is_stackable=bool(promo.is_stackable),
         start_date=promo.start_date,
         end_date=promo.end_date,
         is_active=promo.is_active,
@@ -1355,5 +1372,6 @@ async def delete_promo(
     
     await db.delete(promo)
     await db.commit()
+    await pos_pricing.invalidate_pricing(current_user.tenant_id)
     
     return {"message": "Promo deleted", "id": str(promo_id)}
@@ -10,7 +10,8 @@ from datetime import datetime
 import database
 import models
 import schemas
-from services.inventory_ledger import record_movement
+from services.inventory_ledger import publish_movements
+from services.fefo_allocator import allocate_pick_list, AllocationError
 from auth import get_current_user
 
 router = APIRouter(
@@ -166,7 +167,8 @@ async def ship_delivery(
             models.DeliveryOrder.id == do_id,
             models.DeliveryOrder.tenant_id == current_user.tenant_id
         )\
-        .options(selectinload(models.DeliveryOrder.items))
+        .options(selectinload(models.DeliveryOrder.items))\
+        .with_for_update(of=models.DeliveryOrder)  # Two clicks on "Ship" must not deduct twice
     result = await db.execute(query)
     do = result.scalar_one_or_none()
 
@@ -175,35 +177,33 @@ async def ship_delivery(
     if do.status != models.DeliveryStatus.DRAFT:
         raise HTTPException(status_code=400, detail="DO already shipped or delivered")
 
-    # Deduct Stock & Record Ledger
-    for item in do.items:
-        if item.batch_id:
-            # Lock Batch
-            batch = await db.get(models.InventoryBatch, item.batch_id)
-            if not batch:
-                raise HTTPException(status_code=400, detail=f"Batch {item.batch_id} not found")
-            
-            if batch.quantity_on_hand < item.quantity:
-                raise HTTPException(status_code=400, detail=f"Insufficient stock in batch {batch.batch_number}")
-            
-            # Deduct
-            batch.quantity_on_hand -= item.quantity
-
-            # Ledger
-            await record_movement(
+    # Deduct Stock & Record Ledger - one locked FEFO allocation for the whole DO.
+    # Lines with a batch_id are pinned to that batch, the rest are picked FEFO.
+    if do.items:
+        try:
+            result = await allocate_pick_list(
                 db,
-                product_id=item.product_id,
-                location_id=batch.location_id,
-                quantity_change=-item.quantity,
+                lines=[
+                    {"product_id": item.product_id, "quantity": item.quantity, "batch_id": item.batch_id}
+                    for item in do.items
+                ],
                 movement_type=models.MovementType.OUT_DELIVERY,
-                batch_id=batch.id,
+                tenant_id=current_user.tenant_id,
                 reference_id=str(do.id),
                 notes=f"Shipped via DO {do.so_id or 'Direct'}"
             )
+        except AllocationError as e:
+            await db.rollback()
+            short = ", ".join(str(s["batch_id"] or s["product_id"]) for s in e.shortages)
+            raise HTTPException(status_code=400, detail=f"Insufficient stock for: {short}")
+        movements = result["movements"]
+    else:
+        movements = []
 
     # Update Status
     do.status = models.DeliveryStatus.SHIPPED
     await db.commit()
+    await publish_movements(movements)
     
     return {"detail": "Delivery order shipped successfully"}
 
@@ -2,21 +2,25 @@
 Fleet Management Router
 API endpoints for vehicles, bookings, fuel logs, maintenance, expenses, and reminders
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, and_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import selectinload
-from typing import List
+from typing import List, Optional
 from datetime import date, datetime, timedelta
 from uuid import UUID
+import uuid
 import qrcode
 import io
 import base64
+import json
 
 import database
 import models
 from auth import get_current_user
-from connections.mongodb import get_mongo_db
+from services import fleet_bookings, fleet_costs, fleet_geo, fleet_journeys, fleet_positions, gps_history, journey_simulation
 from schemas.schemas_fleet import (
     VehicleCreate, VehicleUpdate, VehicleResponse,
     BookingCreate, BookingUpdate, BookingResponse, BookingStatus,
@@ -27,7 +31,7 @@ from schemas.schemas_fleet import (
     DepartmentCreate, DepartmentUpdate, DepartmentResponse,
     DriverCreate, DriverUpdate, DriverResponse,
     VendorCreate, VendorUpdate, VendorResponse,
-    FleetStats
+    FleetStats, VehicleCostMonth, FleetCostTrend
 )
 from schemas.schemas_tracking import (
     VehicleLocationUpdate, VehicleLocationResponse,
@@ -39,6 +43,9 @@ router = APIRouter(
     tags=["fleet"]
 )
 
+# Upper bound for one batched GPS upload
+MAX_LOCATION_BATCH = 5000
+
 
 # ==================== STATS ====================
 
@@ -53,11 +60,17 @@ async def get_fleet_stats(
     month_start = today.replace(day=1)
     
     # Vehicle counts
-    total = await db.scalar(select(func.count()).select_from(models.Vehicle).where(models.Vehicle.tenant_id == tenant_id))
-    available = await db.scalar(select(func.count()).select_from(models.Vehicle).where(and_(models.Vehicle.tenant_id == tenant_id, models.Vehicle.status == 'AVAILABLE')))
-    in_use = await db.scalar(select(func.count()).select_from(models.Vehicle).where(and_(models.Vehicle.tenant_id == tenant_id, models.Vehicle.status == 'IN_USE')))
-    maintenance = await db.scalar(select(func.count()).select_from(models.Vehicle).where(and_(models.Vehicle.tenant_id == tenant_id, models.Vehicle.status == 'MAINTENANCE')))
-    broken = await db.scalar(select(func.count()).select_from(models.Vehicle).where(and_(models.Vehicle.tenant_id == tenant_id, models.Vehicle.status == 'BROKEN')))
+    vehicle = models.Vehicle
+    counts = (await db.execute(
+        select(
+            func.count(),
+            func.count().filter(vehicle.status == 'AVAILABLE'),
+            func.count().filter(vehicle.status == 'IN_USE'),
+            func.count().filter(vehicle.status == 'MAINTENANCE'),
+            func.count().filter(vehicle.status == 'BROKEN')
+        ).where(vehicle.tenant_id == tenant_id)
+    )).one()
+    total, available, in_use, maintenance, broken = counts
     
     # Active bookings
     active_bookings = await db.scalar(
@@ -78,30 +91,8 @@ async def get_fleet_stats(
         ))
     )
     
-    # Monthly costs
-    fuel_cost = await db.scalar(
-        select(func.coalesce(func.sum(models.VehicleFuelLog.total_cost), 0))
-        .where(and_(
-            models.VehicleFuelLog.tenant_id == tenant_id,
-            models.VehicleFuelLog.date >= month_start
-        ))
-    )
-    
-    maint_cost = await db.scalar(
-        select(func.coalesce(func.sum(models.VehicleMaintenanceLog.total_cost), 0))
-        .where(and_(
-            models.VehicleMaintenanceLog.tenant_id == tenant_id,
-            models.VehicleMaintenanceLog.date >= month_start
-        ))
-    )
-    
-    expense_cost = await db.scalar(
-        select(func.coalesce(func.sum(models.VehicleExpense.amount), 0))
-        .where(and_(
-            models.VehicleExpense.tenant_id == tenant_id,
-            models.VehicleExpense.date >= month_start
-        ))
-    )
+    # Monthly costs from the per-vehicle rollups
+    costs = await fleet_costs.month_totals(db, tenant_id, month_start)
     
     return FleetStats(
         total_vehicles=total or 0,
@@ -111,9 +102,9 @@ async def get_fleet_stats(
         broken_vehicles=broken or 0,
         active_bookings=active_bookings or 0,
         pending_reminders=pending_reminders or 0,
-        total_fuel_cost_month=fuel_cost or 0,
-        total_maintenance_cost_month=maint_cost or 0,
-        total_expense_month=expense_cost or 0
+        total_fuel_cost_month=costs["fuel_cost"] or 0,
+        total_maintenance_cost_month=costs["maintenance_cost"] or 0,
+        total_expense_month=costs["expense_cost"] or 0
     )
 
 
@@ -473,10 +464,26 @@ async def create_vehicle(
     )
     db.add(db_vehicle)
     await db.commit()
+    await fleet_journeys.invalidate_journeys(current_user.tenant_id)
+    fleet_positions.invalidate_vehicle_metadata(current_user.tenant_id)
     await db.refresh(db_vehicle)
     return db_vehicle
 
 
+@router.get("/vehicles/available", response_model=List[VehicleResponse])
+async def get_available_vehicles(
+    start: datetime,
+    end: datetime,
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Vehicles with no active booking overlapping [start, end)"""
+    start, end = start.replace(tzinfo=None), end.replace(tzinfo=None)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    return await fleet_bookings.available_vehicles(db, current_user.tenant_id, start, end)
+
+
 @router.get("/vehicles/{vehicle_id}", response_model=VehicleResponse)
 async def get_vehicle(
     vehicle_id: UUID,
@@ -518,6 +525,8 @@ async def update_vehicle(
         setattr(vehicle, key, value)
     
     await db.commit()
+    await fleet_journeys.invalidate_journeys(current_user.tenant_id)
+    fleet_positions.invalidate_vehicle_metadata(current_user.tenant_id)
     await db.refresh(vehicle)
     return vehicle
 
@@ -541,6 +550,8 @@ async def delete_vehicle(
     
     await db.delete(vehicle)
     await db.commit()
+    await fleet_journeys.invalidate_journeys(current_user.tenant_id)
+    fleet_positions.invalidate_vehicle_metadata(current_user.tenant_id)
     return {"message": "Vehicle deleted successfully"}
 
 
@@ -586,6 +597,12 @@ async def create_booking(
     if booking_data.get('end_datetime') and hasattr(booking_data['end_datetime'], 'replace'):
         booking_data['end_datetime'] = booking_data['end_datetime'].replace(tzinfo=None)
     
+    await _check_booking_conflicts(
+        db, current_user.tenant_id,
+        booking_data['start_datetime'], booking_data['end_datetime'],
+        booking.vehicle_id, booking.driver_id
+    )
+    
     db_booking = models.VehicleBooking(
         tenant_id=current_user.tenant_id,
         code=code,
@@ -593,7 +610,9 @@ async def create_booking(
         **booking_data
     )
     db.add(db_booking)
-    await db.commit()
+    await _commit_booking(db)
+    await fleet_journeys.invalidate_journeys(current_user.tenant_id)
+    fleet_positions.invalidate_vehicle_metadata(current_user.tenant_id)
     await db.refresh(db_booking)
     return db_booking
 
@@ -633,14 +652,60 @@ async def update_booking(
         if update_data.get(dt_field) and hasattr(update_data[dt_field], 'replace'):
             update_data[dt_field] = update_data[dt_field].replace(tzinfo=None)
     
+    # Re-check overlaps when the booking's window, driver or status changes
+    if update_data.keys() & {'start_datetime', 'end_datetime', 'driver_id', 'status'}:
+        status = update_data.get('status', booking.status)
+        if getattr(status, 'value', status) in models.ACTIVE_BOOKING_STATUSES:
+            await _check_booking_conflicts(
+                db, current_user.tenant_id,
+                update_data.get('start_datetime', booking.start_datetime),
+                update_data.get('end_datetime', booking.end_datetime),
+                booking.vehicle_id,
+                update_data.get('driver_id', booking.driver_id),
+                exclude_booking_id=booking.id
+            )
+    
     for key, value in update_data.items():
         setattr(booking, key, value)
     
-    await db.commit()
+    await _commit_booking(db)
+    await fleet_journeys.invalidate_journeys(current_user.tenant_id)
+    fleet_positions.invalidate_vehicle_metadata(current_user.tenant_id)
     await db.refresh(booking)
     return booking
 
 
+async def _check_booking_conflicts(
+    db: AsyncSession,
+    tenant_id: UUID,
+    start: datetime,
+    end: datetime,
+    vehicle_id: UUID,
+    driver_id: Optional[UUID],
+    exclude_booking_id: Optional[UUID] = None
+):
+    """400 for an empty window, 409 naming the bookings it overlaps"""
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end_datetime must be after start_datetime")
+    conflicts = await fleet_bookings.find_conflicts(
+        db, tenant_id, start, end, vehicle_id, driver_id, exclude_booking_id
+    )
+    if conflicts:
+        raise HTTPException(status_code=409, detail=fleet_bookings.conflict_detail(conflicts, vehicle_id, driver_id))
+
+
+async def _commit_booking(db: AsyncSession):
+    """Commit; a concurrent overlapping booking trips the exclusion constraints (409)"""
+    try:
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        owner = fleet_bookings.exclusion_violation(e)
+        if owner is None:
+            raise
+        raise HTTPException(status_code=409, detail=f"The {owner} is already booked for an overlapping period")
+
+
 @router.delete("/bookings/{booking_id}")
 async def delete_booking(
     booking_id: UUID,
@@ -660,6 +725,8 @@ async def delete_booking(
     
     await db.delete(booking)
     await db.commit()
+    await fleet_journeys.invalidate_journeys(current_user.tenant_id)
+    fleet_positions.invalidate_vehicle_metadata(current_user.tenant_id)
     return {"message": "Booking deleted successfully"}
 
 
@@ -726,7 +793,10 @@ async def create_fuel_log(
         **fuel_log.model_dump()
     )
     db.add(db_fuel_log)
+    await db.flush()
+    await fleet_costs.add_fuel_log(db, db_fuel_log)
     await db.commit()
+    await fleet_journeys.invalidate_journeys(current_user.tenant_id)
     await db.refresh(db_fuel_log)
     return db_fuel_log
 
@@ -773,7 +843,10 @@ async def create_maintenance_log(
         **maint_log.model_dump()
     )
     db.add(db_maint)
+    await db.flush()
+    await fleet_costs.add_maintenance_log(db, db_maint)
     await db.commit()
+    await fleet_journeys.invalidate_journeys(current_user.tenant_id)
     await db.refresh(db_maint)
     return db_maint
 
@@ -811,11 +884,49 @@ async def create_expense(
         **expense.model_dump()
     )
     db.add(db_expense)
+    await db.flush()
+    await fleet_costs.add_expense(db, db_expense)
     await db.commit()
+    await fleet_journeys.invalidate_journeys(current_user.tenant_id)
     await db.refresh(db_expense)
     return db_expense
 
 
+# ==================== COST ANALYTICS ====================
+
+@router.get("/costs/monthly", response_model=List[VehicleCostMonth])
+async def get_monthly_costs(
+    vehicle_id: Optional[UUID] = None,
+    months: int = Query(12, ge=1, le=120),
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Monthly cost, cost per km and fuel efficiency per vehicle (from the cost rollups)"""
+    since = fleet_costs.months_back(date.today(), months)
+    return await fleet_costs.monthly_costs(db, current_user.tenant_id, since, vehicle_id)
+
+
+@router.get("/costs/trends", response_model=List[FleetCostTrend])
+async def get_cost_trends(
+    months: int = Query(12, ge=1, le=120),
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Fleet-wide monthly cost, cost per km and fuel efficiency trend (from the cost rollups)"""
+    since = fleet_costs.months_back(date.today(), months)
+    return await fleet_costs.cost_trends(db, current_user.tenant_id, since)
+
+
+@router.post("/costs/backfill")
+async def backfill_costs(
+    background_tasks: BackgroundTasks,
+    current_user: models.User = Depends(get_current_user)
+):
+    """Rebuild the cost rollups from all fuel logs, maintenance logs and expenses (background job)"""
+    background_tasks.add_task(fleet_costs.run_cost_backfill, current_user.tenant_id)
+    return {"message": "Cost rollup backfill started"}
+
+
 # ==================== REMINDERS ====================
 
 @router.get("/reminders", response_model=List[ReminderResponse])
@@ -852,6 +963,7 @@ async def create_reminder(
     )
     db.add(db_reminder)
     await db.commit()
+    await fleet_journeys.invalidate_journeys(current_user.tenant_id)
     await db.refresh(db_reminder)
     return db_reminder
 
@@ -885,6 +997,7 @@ async def update_reminder(
         setattr(reminder, key, value)
     
     await db.commit()
+    await fleet_journeys.invalidate_journeys(current_user.tenant_id)
     await db.refresh(reminder)
     return reminder
 
@@ -908,6 +1021,7 @@ async def delete_reminder(
     
     await db.delete(reminder)
     await db.commit()
+    await fleet_journeys.invalidate_journeys(current_user.tenant_id)
     return {"message": "Reminder deleted successfully"}
 
 
@@ -919,122 +1033,7 @@ async def get_vehicles_in_journey(
     current_user: models.User = Depends(get_current_user)
 ):
     """Get all vehicles currently in journey with comprehensive details"""
-    tenant_id = current_user.tenant_id
-    
-    # Get active bookings (IN_USE status)
-    bookings_result = await db.execute(
-        select(models.VehicleBooking)
-        .where(and_(
-            models.VehicleBooking.tenant_id == tenant_id,
-            models.VehicleBooking.status == 'IN_USE'
-        ))
-        .options(
-            selectinload(models.VehicleBooking.vehicle),
-            selectinload(models.VehicleBooking.driver),
-            selectinload(models.VehicleBooking.department)
-        )
-    )
-    active_bookings = bookings_result.scalars().all()
-    
-    vehicles_data = []
-    for booking in active_bookings:
-        vehicle = booking.vehicle
-        if not vehicle:
-            continue
-            
-        # Get last fuel log
-        fuel_result = await db.execute(
-            select(models.VehicleFuelLog)
-            .where(models.VehicleFuelLog.vehicle_id == vehicle.id)
-            .order_by(models.VehicleFuelLog.date.desc())
-            .limit(1)
-        )
-        last_fuel = fuel_result.scalar_one_or_none()
-        
-        # Get last maintenance
-        maint_result = await db.execute(
-            select(models.VehicleMaintenanceLog)
-            .where(models.VehicleMaintenanceLog.vehicle_id == vehicle.id)
-            .order_by(models.VehicleMaintenanceLog.date.desc())
-            .limit(1)
-        )
-        last_maint = maint_result.scalar_one_or_none()
-        
-        # Get next reminder/maintenance
-        next_reminder_result = await db.execute(
-            select(models.VehicleReminder)
-            .where(and_(
-                models.VehicleReminder.vehicle_id == vehicle.id,
-                models.VehicleReminder.is_completed == False
-            ))
-            .order_by(models.VehicleReminder.due_date)
-            .limit(1)
-        )
-        next_reminder = next_reminder_result.scalar_one_or_none()
-        
-        # Get total expenses for this vehicle
-        total_expense = await db.scalar(
-            select(func.coalesce(func.sum(models.VehicleExpense.amount), 0))
-            .where(models.VehicleExpense.vehicle_id == vehicle.id)
-        )
-        
-        vehicles_data.append({
-            "vehicle": {
-                "id": str(vehicle.id),
-                "code": vehicle.code,
-                "plate_number": vehicle.plate_number,
-                "brand": vehicle.brand,
-                "model": vehicle.model,
-                "year": vehicle.year,
-                "vehicle_type": vehicle.vehicle_type,
-                "current_odometer": vehicle.current_odometer,
-                "image_url": vehicle.image_url
-            },
-            "booking": {
-                "id": str(booking.id),
-                "code": booking.code,
-                "purpose": booking.purpose.value if booking.purpose else None,
-                "destination": booking.destination,
-                "destination_lat": booking.destination_lat,
-                "destination_lng": booking.destination_lng,
-                "origin_address": booking.origin_address,
-                "origin_lat": booking.origin_lat,
-                "origin_lng": booking.origin_lng,
-                "start_datetime": booking.start_datetime.isoformat() if booking.start_datetime else None,
-                "end_datetime": booking.end_datetime.isoformat() if booking.end_datetime else None,
-                "actual_start": booking.actual_start.isoformat() if booking.actual_start else None,
-                "department_name": booking.department.name if booking.department else None
-            },
-            "driver": {
-                "id": str(booking.driver.id) if booking.driver else None,
-                "name": booking.driver.name if booking.driver else None,
-                "phone": booking.driver.phone if booking.driver else None,
-                "photo_url": booking.driver.photo_url if booking.driver else None
-            } if booking.driver else None,
-            "last_fuel": {
-                "date": last_fuel.date.isoformat() if last_fuel else None,
-                "liters": last_fuel.liters if last_fuel else None,
-                "total_cost": last_fuel.total_cost if last_fuel else None
-            } if last_fuel else None,
-            "last_maintenance": {
-                "date": last_maint.date.isoformat() if last_maint else None,
-                "service_type": last_maint.service_type if last_maint else None,
-                "total_cost": last_maint.total_cost if last_maint else None
-            } if last_maint else None,
-            "next_reminder": {
-                "title": next_reminder.title if next_reminder else None,
-                "due_date": next_reminder.due_date.isoformat() if next_reminder else None,
-                "reminder_type": next_reminder.reminder_type.value if next_reminder else None
-            } if next_reminder else None,
-            "total_expense": total_expense or 0,
-            # Get current position from MongoDB or use origin as fallback
-            "current_position": {
-                "lat": booking.origin_lat or -6.2088,  # Default to Jakarta
-                "lng": booking.origin_lng or 106.8456
-            }
-        })
-    
-    return {"vehicles": vehicles_data, "count": len(vehicles_data)}
+    return await fleet_journeys.get_vehicles_in_journey(db, current_user.tenant_id)
 
 
 # ==================== REAL-TIME LOCATION TRACKING ====================
@@ -1044,109 +1043,119 @@ async def update_vehicle_location(
     location: VehicleLocationUpdate,
     current_user: models.User = Depends(get_current_user)
 ):
-    """Update vehicle's current GPS position in MongoDB"""
-    mongo_db = await get_mongo_db()
-    if not mongo_db:
-        raise HTTPException(status_code=500, detail="MongoDB not available")
-    
-    collection = mongo_db["vehicle_locations"]
-    
-    # Upsert location data
-    location_data = {
-        "vehicle_id": str(location.vehicle_id),
-        "booking_id": str(location.booking_id) if location.booking_id else None,
-        "tenant_id": str(current_user.tenant_id),
-        "lat": location.lat,
-        "lng": location.lng,
-        "speed": location.speed,
-        "heading": location.heading,
-        "accuracy": location.accuracy,
-        "timestamp": datetime.utcnow(),
-        "updated_by": str(current_user.id)
-    }
-    
-    # Update or insert
-    await collection.update_one(
-        {"vehicle_id": str(location.vehicle_id), "tenant_id": str(current_user.tenant_id)},
-        {"$set": location_data},
-        upsert=True
-    )
-    
-    # Also save to history collection for route tracking
-    history_collection = mongo_db["vehicle_location_history"]
-    await history_collection.insert_one({
-        **location_data,
-        "created_at": datetime.utcnow()
-    })
-    
-    return {"message": "Location updated", "timestamp": location_data["timestamp"]}
+    """Update vehicle's current GPS position (Redis geo index, buffered history)"""
+    timestamp = await _record_positions(current_user, [location])
+    return {"message": "Location updated", "timestamp": timestamp}
+
+
+@router.post("/vehicle-locations/batch")
+async def update_vehicle_locations_batch(
+    locations: List[VehicleLocationUpdate],
+    current_user: models.User = Depends(get_current_user)
+):
+    """Update many GPS positions at once (telematics gateways)"""
+    if len(locations) > MAX_LOCATION_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_LOCATION_BATCH} locations per request")
+    timestamp = await _record_positions(current_user, locations)
+    return {"message": "Locations updated", "count": len(locations), "timestamp": timestamp}
+
+
+async def _record_positions(current_user: models.User, locations: List[VehicleLocationUpdate]):
+    pings = [{**loc.model_dump(), "updated_by": current_user.id} for loc in locations]
+    try:
+        return await fleet_positions.record_positions(current_user.tenant_id, pings)
+    except fleet_positions.LiveTrackingUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
 
 @router.get("/vehicle-locations")
 async def get_vehicle_locations(
+    lat: Optional[float] = None,
+    lng: Optional[float] = None,
+    radius_km: Optional[float] = Query(None, gt=0, le=1000),
+    limit: int = Query(500, ge=1, le=5000),
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Get live vehicle locations with vehicle details, optionally within radius_km of (lat, lng)"""
+    tenant_id = current_user.tenant_id
+    try:
+        if radius_km is not None:
+            if lat is None or lng is None:
+                raise HTTPException(status_code=400, detail="lat and lng are required with radius_km")
+            positions = await fleet_positions.search_positions(tenant_id, lat, lng, radius_km, limit)
+        else:
+            positions = (await fleet_positions.get_positions(tenant_id))[:limit]
+    except fleet_positions.LiveTrackingUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    meta = await fleet_positions.get_vehicle_metadata(db, tenant_id, positions)
+    locations = fleet_positions.enrich_positions(positions, meta)
+    return {"locations": locations, "count": len(locations)}
+
+
+@router.get("/bookings/{booking_id}/eta")
+async def get_booking_eta(
+    booking_id: UUID,
     db: AsyncSession = Depends(database.get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    """Get all active vehicle locations from MongoDB with vehicle details"""
-    mongo_db = await get_mongo_db()
-    if not mongo_db:
-        raise HTTPException(status_code=500, detail="MongoDB not available")
+    """Route distance, remaining distance and ETA of a booking (from its live position and recent speed)"""
+    result = await db.execute(
+        select(models.VehicleBooking).where(
+            models.VehicleBooking.id == booking_id,
+            models.VehicleBooking.tenant_id == current_user.tenant_id
+        )
+    )
+    booking = result.scalar_one_or_none()
+    if not booking:
+        raise HTTPException(status_code=404, detail="Booking not found")
+    if booking.destination_lat is None or booking.destination_lng is None:
+        raise HTTPException(status_code=400, detail="Booking destination not set")
     
-    collection = mongo_db["vehicle_locations"]
-    tenant_id = str(current_user.tenant_id)
+    eta = await fleet_geo.get_booking_eta(current_user.tenant_id, booking)
+    return {"booking_id": str(booking_id), **eta}
+
+
+@router.get("/bookings/{booking_id}/route")
+async def replay_booking_route(
+    booking_id: UUID,
+    format: str = Query("polyline", pattern="^(polyline|ndjson)$"),
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Stream the GPS trail of a trip, read bucket by bucket from the history store.
+    polyline: one Google encoded polyline (text/plain); ndjson: one point per line.
+    """
+    result = await db.execute(
+        select(models.VehicleBooking).where(
+            models.VehicleBooking.id == booking_id,
+            models.VehicleBooking.tenant_id == current_user.tenant_id
+        )
+    )
+    booking = result.scalar_one_or_none()
+    if not booking:
+        raise HTTPException(status_code=404, detail="Booking not found")
     
-    # Get all locations for this tenant
-    cursor = collection.find({"tenant_id": tenant_id})
-    locations = await cursor.to_list(length=100)
+    start = booking.actual_start or booking.start_datetime
+    end = booking.actual_end or datetime.utcnow()
+    buckets = gps_history.iter_route_points(str(current_user.tenant_id), str(booking.vehicle_id), start, end)
     
-    # Enrich with vehicle and booking data from PostgreSQL
-    enriched_locations = []
-    for loc in locations:
-        vehicle_id = loc.get("vehicle_id")
-        booking_id = loc.get("booking_id")
-        
-        # Get vehicle info
-        vehicle_result = await db.execute(
-            select(models.Vehicle).where(models.Vehicle.id == UUID(vehicle_id))
-        )
-        vehicle = vehicle_result.scalar_one_or_none()
-        
-        # Get booking info if available
-        booking = None
-        driver = None
-        if booking_id:
-            booking_result = await db.execute(
-                select(models.VehicleBooking)
-                .where(models.VehicleBooking.id == UUID(booking_id))
-                .options(selectinload(models.VehicleBooking.driver))
-            )
-            booking = booking_result.scalar_one_or_none()
-            if booking:
-                driver = booking.driver
-        
-        enriched_locations.append({
-            "vehicle_id": vehicle_id,
-            "booking_id": booking_id,
-            "lat": loc.get("lat"),
-            "lng": loc.get("lng"),
-            "speed": loc.get("speed"),
-            "heading": loc.get("heading"),
-            "timestamp": loc.get("timestamp").isoformat() if loc.get("timestamp") else None,
-            "vehicle_plate": vehicle.plate_number if vehicle else None,
-            "vehicle_brand": vehicle.brand if vehicle else None,
-            "vehicle_model": vehicle.model if vehicle else None,
-            "vehicle_type": vehicle.vehicle_type if vehicle else None,
-            "driver_name": driver.name if driver else None,
-            "driver_phone": driver.phone if driver else None,
-            "destination": booking.destination if booking else None,
-            "origin_lat": booking.origin_lat if booking else None,
-            "origin_lng": booking.origin_lng if booking else None,
-            "destination_lat": booking.destination_lat if booking else None,
-            "destination_lng": booking.destination_lng if booking else None,
-            "purpose": booking.purpose.value if booking and booking.purpose else None
-        })
+    if format == "ndjson":
+        async def ndjson():
+            async for points in buckets:
+                yield "".join(
+                    json.dumps({**p, "t": p["t"].isoformat()}) + "\n" for p in points
+                )
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
     
-    return {"locations": enriched_locations, "count": len(enriched_locations)}
+    async def polyline():
+        previous = None
+        async for points in buckets:
+            chunk, previous = gps_history.encode_polyline(points, previous)
+            yield chunk
+    return StreamingResponse(polyline(), media_type="text/plain")
 
 
 @router.post("/seed-journey-data")
@@ -1154,11 +1163,8 @@ async def seed_journey_data(
     db: AsyncSession = Depends(database.get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    """Seed 3 sample vehicles with journey data for testing"""
+    """Seed 3 sample vehicles with journey data for testing (re-running reuses their active trips)"""
     tenant_id = current_user.tenant_id
-    mongo_db = await get_mongo_db()
-    if not mongo_db:
-        raise HTTPException(status_code=500, detail="MongoDB not available")
     
     # Sample journey data (Jakarta area)
     sample_journeys = [
@@ -1194,7 +1200,18 @@ async def seed_journey_data(
         }
     ]
     
+    now = datetime.utcnow()
+    start, end = now - timedelta(hours=1), now + timedelta(hours=3)
+    today = date.today()
+    booking_count = await db.scalar(
+        select(func.count()).select_from(models.VehicleBooking)
+        .where(models.VehicleBooking.tenant_id == tenant_id)
+    ) or 0
+    
     created_vehicles = []
+    seeded_positions = []
+    # Inserted together at the end so an overlap left by a concurrent write surfaces in _commit_booking (409)
+    new_bookings = []
     for i, journey in enumerate(sample_journeys):
         # Check if vehicle exists
         existing = await db.execute(
@@ -1251,53 +1268,61 @@ async def seed_journey_data(
             db.add(driver)
             await db.flush()
         
-        # Create booking
-        today = date.today()
-        booking_count = await db.scalar(
-            select(func.count()).select_from(models.VehicleBooking)
-            .where(models.VehicleBooking.tenant_id == tenant_id)
+        # Reuse the trip of an earlier seed; end or cancel other bookings in the window
+        conflicts = await fleet_bookings.find_conflicts(db, tenant_id, start, end, vehicle.id, driver.id)
+        booking = next(
+            (
+                b for b in conflicts
+                if b.vehicle_id == vehicle.id and b.driver_id == driver.id
+                and getattr(b.status, 'value', b.status) == BookingStatus.IN_USE.value
+            ),
+            None
         )
-        booking = models.VehicleBooking(
-            tenant_id=tenant_id,
-            vehicle_id=vehicle.id,
-            driver_id=driver.id,
-            code=f"BK-{today.year}-{(booking_count or 0) + 1:04d}",
-            purpose=journey["purpose"],
-            origin_type="ADDRESS",
-            origin_address=journey["origin"]["address"],
-            origin_lat=journey["origin"]["lat"],
-            origin_lng=journey["origin"]["lng"],
-            destination=journey["destination"]["address"],
-            destination_lat=journey["destination"]["lat"],
-            destination_lng=journey["destination"]["lng"],
-            start_datetime=datetime.utcnow() - timedelta(hours=1),
-            end_datetime=datetime.utcnow() + timedelta(hours=3),
-            actual_start=datetime.utcnow() - timedelta(hours=1),
-            status="IN_USE",
-            requested_by=current_user.id,
-            approved_by=current_user.id,
-            approved_at=datetime.utcnow() - timedelta(hours=2)
-        )
-        db.add(booking)
+        for other in conflicts:
+            if other is booking:
+                continue
+            if getattr(other.status, 'value', other.status) == BookingStatus.IN_USE.value:
+                other.status = BookingStatus.COMPLETED.value
+                other.actual_end = now
+            else:
+                other.status = BookingStatus.CANCELLED.value
         await db.flush()
         
-        # Store current position in MongoDB
-        collection = mongo_db["vehicle_locations"]
-        await collection.update_one(
-            {"vehicle_id": str(vehicle.id), "tenant_id": str(tenant_id)},
-            {"$set": {
-                "vehicle_id": str(vehicle.id),
-                "booking_id": str(booking.id),
-                "tenant_id": str(tenant_id),
-                "lat": journey["current"]["lat"],
-                "lng": journey["current"]["lng"],
-                "speed": 60 + (i * 10),
-                "heading": 90 + (i * 45),
-                "timestamp": datetime.utcnow(),
-                "updated_by": str(current_user.id)
-            }},
-            upsert=True
-        )
+        if booking is None:
+            booking_count += 1
+            booking = models.VehicleBooking(
+                id=uuid.uuid4(),
+                tenant_id=tenant_id,
+                vehicle_id=vehicle.id,
+                driver_id=driver.id,
+                code=f"BK-{today.year}-{booking_count:04d}",
+                purpose=journey["purpose"],
+                origin_type="ADDRESS",
+                origin_address=journey["origin"]["address"],
+                origin_lat=journey["origin"]["lat"],
+                origin_lng=journey["origin"]["lng"],
+                destination=journey["destination"]["address"],
+                destination_lat=journey["destination"]["lat"],
+                destination_lng=journey["destination"]["lng"],
+                start_datetime=start,
+                end_datetime=end,
+                actual_start=start,
+                status="IN_USE",
+                requested_by=current_user.id,
+                approved_by=current_user.id,
+                approved_at=now - timedelta(hours=2)
+            )
+            new_bookings.append(booking)
+        
+        seeded_positions.append({
+            "vehicle_id": vehicle.id,
+            "booking_id": booking.id,
+            "lat": journey["current"]["lat"],
+            "lng": journey["current"]["lng"],
+            "speed": 60 + (i * 10),
+            "heading": 90 + (i * 45),
+            "updated_by": current_user.id
+        })
         
         created_vehicles.append({
             "vehicle_id": str(vehicle.id),
@@ -1306,7 +1331,15 @@ async def seed_journey_data(
             "driver": driver.name
         })
     
-    await db.commit()
+    db.add_all(new_bookings)
+    await _commit_booking(db)
+    await fleet_journeys.invalidate_journeys(tenant_id)
+    fleet_positions.invalidate_vehicle_metadata(tenant_id)
+    
+    try:
+        await fleet_positions.record_positions(tenant_id, seeded_positions)
+    except fleet_positions.LiveTrackingUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     
     return {
         "message": f"Created {len(created_vehicles)} sample vehicles with journeys",
@@ -1321,96 +1354,25 @@ async def simulate_journey(
     current_user: models.User = Depends(get_current_user)
 ):
     """Move a vehicle along its route (call this periodically to simulate movement)"""
-    mongo_db = await get_mongo_db()
-    if not mongo_db:
-        raise HTTPException(status_code=500, detail="MongoDB not available")
-    
-    tenant_id = str(current_user.tenant_id)
-    collection = mongo_db["vehicle_locations"]
-    
-    # Get current location
-    location = await collection.find_one({
-        "vehicle_id": str(vehicle_id),
-        "tenant_id": tenant_id
-    })
-    
-    if not location:
-        raise HTTPException(status_code=404, detail="Vehicle location not found")
-    
-    booking_id = location.get("booking_id")
-    if not booking_id:
-        raise HTTPException(status_code=400, detail="No active booking for this vehicle")
-    
-    # Get booking for destination
-    booking_result = await db.execute(
-        select(models.VehicleBooking).where(models.VehicleBooking.id == UUID(booking_id))
-    )
-    booking = booking_result.scalar_one_or_none()
-    
-    if not booking or not booking.destination_lat or not booking.destination_lng:
-        raise HTTPException(status_code=400, detail="Booking destination not set")
-    
-    # Calculate movement toward destination (10% of remaining distance)
-    current_lat = location.get("lat")
-    current_lng = location.get("lng")
-    dest_lat = booking.destination_lat
-    dest_lng = booking.destination_lng
-    
-    # Move 10% closer to destination
-    new_lat = current_lat + (dest_lat - current_lat) * 0.1
-    new_lng = current_lng + (dest_lng - current_lng) * 0.1
-    
-    # Check if arrived (within ~100m)
-    if abs(new_lat - dest_lat) < 0.001 and abs(new_lng - dest_lng) < 0.001:
-        new_lat = dest_lat
-        new_lng = dest_lng
-        arrived = True
-    else:
-        arrived = False
-    
-    # Update location
-    await collection.update_one(
-        {"vehicle_id": str(vehicle_id), "tenant_id": tenant_id},
-        {"$set": {
-            "lat": new_lat,
-            "lng": new_lng,
-            "speed": 0 if arrived else 55 + (hash(str(vehicle_id)) % 30),
-            "timestamp": datetime.utcnow()
-        }}
-    )
-    
-    # Save to history
-    history_collection = mongo_db["vehicle_location_history"]
-    await history_collection.insert_one({
-        "vehicle_id": str(vehicle_id),
-        "booking_id": booking_id,
-        "tenant_id": tenant_id,
-        "lat": new_lat,
-        "lng": new_lng,
-        "speed": 0 if arrived else 55,
-        "timestamp": datetime.utcnow(),
-        "created_at": datetime.utcnow()
-    })
-    
-    # If arrived, update booking status
-    if arrived:
-        booking.status = "COMPLETED"
-        booking.actual_end = datetime.utcnow()
-        
-        # Update vehicle status
-        vehicle_result = await db.execute(
-            select(models.Vehicle).where(models.Vehicle.id == vehicle_id)
+    try:
+        moved = await journey_simulation.simulate_step(
+            db, current_user.tenant_id, current_user.id,
+            step_seconds=journey_simulation.SIMULATION_STEP_SECONDS * 2, vehicle_ids=[vehicle_id]
         )
-        vehicle = vehicle_result.scalar_one_or_none()
-        if vehicle:
-            vehicle.status = "AVAILABLE"
-        
-        await db.commit()
+    except fleet_positions.LiveTrackingUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if not moved:
+        raise HTTPException(status_code=404, detail="No active journey with a destination for this vehicle")
+    
+    vehicle = moved[0]
+    if vehicle["arrived"]:
+        await fleet_journeys.invalidate_journeys(current_user.tenant_id)
+        fleet_positions.invalidate_vehicle_metadata(current_user.tenant_id)
     
     return {
         "vehicle_id": str(vehicle_id),
-        "new_position": {"lat": new_lat, "lng": new_lng},
-        "arrived": arrived,
+        "new_position": {"lat": vehicle["new_lat"], "lng": vehicle["new_lng"]},
+        "arrived": vehicle["arrived"],
         "timestamp": datetime.utcnow().isoformat()
     }
 
@@ -1420,61 +1382,14 @@ async def simulate_all_journeys(
     db: AsyncSession = Depends(database.get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    """Move all vehicles with active journeys (call periodically)"""
-    mongo_db = await get_mongo_db()
-    if not mongo_db:
-        raise HTTPException(status_code=500, detail="MongoDB not available")
-    
-    tenant_id = str(current_user.tenant_id)
-    collection = mongo_db["vehicle_locations"]
-    
-    # Get all locations for this tenant
-    cursor = collection.find({"tenant_id": tenant_id})
-    locations = await cursor.to_list(length=100)
+    """Move all vehicles with active journeys one step (call periodically)"""
+    try:
+        moved = await journey_simulation.simulate_step(db, current_user.tenant_id, current_user.id)
+    except fleet_positions.LiveTrackingUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     
-    updated = []
-    for location in locations:
-        booking_id = location.get("booking_id")
-        if not booking_id:
-            continue
-        
-        # Get booking
-        booking_result = await db.execute(
-            select(models.VehicleBooking).where(
-                models.VehicleBooking.id == UUID(booking_id),
-                models.VehicleBooking.status == "IN_USE"
-            )
-        )
-        booking = booking_result.scalar_one_or_none()
-        
-        if not booking or not booking.destination_lat or not booking.destination_lng:
-            continue
-        
-        # Calculate movement
-        current_lat = location.get("lat")
-        current_lng = location.get("lng")
-        dest_lat = booking.destination_lat
-        dest_lng = booking.destination_lng
-        
-        # Move 5% closer (slower for realistic movement)
-        new_lat = current_lat + (dest_lat - current_lat) * 0.05
-        new_lng = current_lng + (dest_lng - current_lng) * 0.05
-        
-        # Update location
-        await collection.update_one(
-            {"vehicle_id": location["vehicle_id"], "tenant_id": tenant_id},
-            {"$set": {
-                "lat": new_lat,
-                "lng": new_lng,
-                "speed": 50 + (hash(location["vehicle_id"]) % 40),
-                "timestamp": datetime.utcnow()
-            }}
-        )
-        
-        updated.append({
-            "vehicle_id": location["vehicle_id"],
-            "new_lat": new_lat,
-            "new_lng": new_lng
-        })
-    
-    return {"updated": len(updated), "vehicles": updated}
+    arrived = sum(1 for v in moved if v["arrived"])
+    if arrived:
+        await fleet_journeys.invalidate_journeys(current_user.tenant_id)
+        fleet_positions.invalidate_vehicle_metadata(current_user.tenant_id)
+    return {"updated": len(moved), "arrived": arrived, "vehicles": moved}
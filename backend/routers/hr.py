@@ -3,21 +3,30 @@ HR & Payroll Router
 Complete API endpoints for employee management, attendance with face recognition,
 payroll, leave management, camera monitoring, and performance tracking
 """
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, BackgroundTasks
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, and_, or_
 from sqlalchemy.orm import selectinload
 from typing import List, Optional
 from datetime import date, datetime, timedelta
 from uuid import UUID
-import base64
-import json
 import os
 
 import database
 import models
 from models import models_hr
 from auth import get_current_user
+from services.face_index import encode_embedding, get_face_index, add_face, invalidate_face_index
+from services.biometric_pool import (
+    encode_face, face_recognition_available, BiometricBusyError, BiometricTimeoutError
+)
+from services.attendance_ingest import ingest_attendance_events, upload_attendance_photos
+from services.payroll_engine import (
+    PAYROLL_SYNC_LIMIT, PayrollInProgressError, start_payroll_run, count_payroll_employees,
+    calculate_payroll, preview_payroll, run_payroll_job, get_payroll_progress
+)
+from services.payroll_rules import compile_rules
+from services.hr_dashboard import get_hr_dashboard_stats as get_dashboard_stats, invalidate_hr_dashboard
 from schemas.schemas_hr import (
     # Department & Position
     DepartmentCreate, DepartmentUpdate, DepartmentResponse,
@@ -29,13 +38,15 @@ from schemas.schemas_hr import (
     # Attendance
     ShiftCreate, ShiftResponse,
     AttendanceCheckIn, AttendanceCheckOut, AttendanceResponse,
+    AttendanceIngestRequest, AttendanceIngestResponse,
     # Leave
     LeaveTypeCreate, LeaveTypeResponse,
     LeaveRequestCreate, LeaveRequestUpdate, LeaveRequestApproval, LeaveRequestResponse,
     LeaveBalanceResponse,
     # Payroll
     PayrollPeriodCreate, PayrollPeriodResponse,
-    PayslipResponse, PayrollRunResponse,
+    PayslipResponse, PayrollRunResponse, PayrollPreviewResponse, PayrollRunProgress,
+    PayrollRules, PayrollRulesResponse,
     # Camera
     CameraCreate, CameraUpdate, CameraResponse, CameraActivityResponse,
     # KPI & Performance
@@ -50,6 +61,9 @@ router = APIRouter(
     tags=["Human Resources"]
 )
 
+# Upper bound for one terminal ingest call
+MAX_INGEST_EVENTS = 2000
+
 
 # ==================== DASHBOARD ====================
 
@@ -58,86 +72,8 @@ async def get_hr_dashboard_stats(
     db: AsyncSession = Depends(database.get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    """Get HR dashboard statistics"""
-    tenant_id = current_user.tenant_id
-    today = date.today()
-    
-    # Total employees
-    total_employees = await db.scalar(
-        select(func.count()).select_from(models_hr.Employee)
-        .where(models_hr.Employee.tenant_id == tenant_id)
-    ) or 0
-    
-    # Active employees
-    active_employees = await db.scalar(
-        select(func.count()).select_from(models_hr.Employee)
-        .where(and_(
-            models_hr.Employee.tenant_id == tenant_id,
-            models_hr.Employee.status == models_hr.EmployeeStatus.ACTIVE
-        ))
-    ) or 0
-    
-    # Present today
-    present_today = await db.scalar(
-        select(func.count()).select_from(models_hr.Attendance)
-        .where(and_(
-            models_hr.Attendance.tenant_id == tenant_id,
-            models_hr.Attendance.date == today,
-            models_hr.Attendance.check_in != None
-        ))
-    ) or 0
-    
-    # Late today
-    late_today = await db.scalar(
-        select(func.count()).select_from(models_hr.Attendance)
-        .where(and_(
-            models_hr.Attendance.tenant_id == tenant_id,
-            models_hr.Attendance.date == today,
-            models_hr.Attendance.status == models_hr.AttendanceStatus.LATE
-        ))
-    ) or 0
-    
-    # On leave today
-    on_leave_today = await db.scalar(
-        select(func.count()).select_from(models_hr.LeaveRequest)
-        .where(and_(
-            models_hr.LeaveRequest.tenant_id == tenant_id,
-            models_hr.LeaveRequest.status == models_hr.LeaveStatus.APPROVED,
-            models_hr.LeaveRequest.start_date <= today,
-            models_hr.LeaveRequest.end_date >= today
-        ))
-    ) or 0
-    
-    # Pending leave requests
-    pending_leave = await db.scalar(
-        select(func.count()).select_from(models_hr.LeaveRequest)
-        .where(and_(
-            models_hr.LeaveRequest.tenant_id == tenant_id,
-            models_hr.LeaveRequest.status == models_hr.LeaveStatus.PENDING
-        ))
-    ) or 0
-    
-    # Contracts expiring in 30 days
-    expiring_contracts = await db.scalar(
-        select(func.count()).select_from(models_hr.Employee)
-        .where(and_(
-            models_hr.Employee.tenant_id == tenant_id,
-            models_hr.Employee.contract_end != None,
-            models_hr.Employee.contract_end <= today + timedelta(days=30),
-            models_hr.Employee.contract_end >= today
-        ))
-    ) or 0
-    
-    return HRDashboardStats(
-        total_employees=total_employees,
-        active_employees=active_employees,
-        present_today=present_today,
-        late_today=late_today,
-        on_leave_today=on_leave_today,
-        absent_today=active_employees - present_today - on_leave_today,
-        pending_leave_requests=pending_leave,
-        contracts_expiring_soon=expiring_contracts
-    )
+    """Get HR dashboard statistics (one aggregate query, cached per tenant and day)"""
+    return HRDashboardStats(**await get_dashboard_stats(db, current_user.tenant_id))
 
 
 # ==================== MANAGERS ====================
@@ -415,6 +351,7 @@ async def create_employee(
     )
     db.add(db_employee)
     await db.commit()
+    await invalidate_hr_dashboard(current_user.tenant_id)
     await db.refresh(db_employee)
     return db_employee
 
@@ -437,7 +374,7 @@ async def get_employee(
         raise HTTPException(status_code=404, detail="Employee not found")
     
     response = EmployeeResponse.model_validate(employee)
-    response.has_face_registered = employee.face_encoding is not None
+    response.has_face_registered = employee.face_embedding is not None or employee.face_encoding is not None
     return response
 
 
@@ -459,11 +396,15 @@ async def update_employee(
     if not employee:
         raise HTTPException(status_code=404, detail="Employee not found")
     
-    for key, value in employee_update.model_dump(exclude_unset=True).items():
+    updates = employee_update.model_dump(exclude_unset=True)
+    for key, value in updates.items():
         setattr(employee, key, value)
     
     await db.commit()
+    await invalidate_hr_dashboard(current_user.tenant_id)
     await db.refresh(employee)
+    if updates.keys() & {"status", "first_name", "last_name"}:
+        await invalidate_face_index(current_user.tenant_id)
     return employee
 
 
@@ -487,6 +428,8 @@ async def delete_employee(
     employee.status = models_hr.EmployeeStatus.TERMINATED
     employee.termination_date = date.today()
     await db.commit()
+    await invalidate_hr_dashboard(current_user.tenant_id)
+    await invalidate_face_index(current_user.tenant_id)
     return {"message": "Employee terminated successfully"}
 
 
@@ -572,6 +515,18 @@ async def add_employee_document(
 
 # ==================== FACE RECOGNITION ====================
 
+async def _encode_face_or_raise(image_base64: str):
+    """Encode a face in the biometric pool, mapping pool errors to HTTP errors."""
+    try:
+        return await encode_face(image_base64)
+    except BiometricBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except BiometricTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.post("/employees/{employee_id}/register-face")
 async def register_employee_face(
     employee_id: UUID,
@@ -580,10 +535,7 @@ async def register_employee_face(
     current_user: models.User = Depends(get_current_user)
 ):
     """Register employee face encoding for attendance"""
-    try:
-        import face_recognition
-        import numpy as np
-    except ImportError:
+    if not face_recognition_available():
         # Fallback if face_recognition not installed
         result = await db.execute(
             select(models_hr.Employee).where(
@@ -610,24 +562,23 @@ async def register_employee_face(
     if not employee:
         raise HTTPException(status_code=404, detail="Employee not found")
     
+    encoding = await _encode_face_or_raise(request.face_image_base64)
+    if encoding is None:
+        raise HTTPException(status_code=400, detail="No face detected in image")
+    
     try:
-        # Decode base64 image
-        image_data = base64.b64decode(request.face_image_base64)
-        nparr = np.frombuffer(image_data, np.uint8)
-        import cv2
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        
-        # Get face encoding
-        face_encodings = face_recognition.face_encodings(rgb_image)
-        if not face_encodings:
-            raise HTTPException(status_code=400, detail="No face detected in image")
-        
-        # Store encoding as JSON
-        encoding = face_encodings[0].tolist()
-        employee.face_encoding = json.dumps(encoding)
+        # Store encoding as compact float32 bytes and refresh the matching index
+        employee.face_embedding = encode_embedding(encoding)
+        employee.face_encoding = None
         await db.commit()
         
+        if employee.status == models_hr.EmployeeStatus.ACTIVE:
+            await add_face(current_user.tenant_id, {
+                "id": employee.id,
+                "first_name": employee.first_name,
+                "last_name": employee.last_name
+            }, encoding)
+        
         return {"success": True, "message": "Face registered successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Face registration failed: {str(e)}")
@@ -791,6 +742,7 @@ async def attendance_check_in(
     attendance.notes = check_in.notes
     
     await db.commit()
+    await invalidate_hr_dashboard(current_user.tenant_id)
     await db.refresh(attendance)
     return attendance
 
@@ -854,6 +806,7 @@ async def attendance_check_out(
     attendance.overtime_minutes = overtime_minutes
     
     await db.commit()
+    await invalidate_hr_dashboard(current_user.tenant_id)
     await db.refresh(attendance)
     return attendance
 
@@ -865,64 +818,38 @@ async def face_attendance_check_in(
     current_user: models.User = Depends(get_current_user)
 ):
     """Check-in using face recognition"""
-    try:
-        import face_recognition
-        import numpy as np
-    except ImportError:
+    if not face_recognition_available():
         raise HTTPException(status_code=501, detail="Face recognition not available")
     
+    # Decode and encode the image in the biometric pool, off the event loop
+    unknown_encoding = await _encode_face_or_raise(request.face_image_base64)
+    if unknown_encoding is None:
+        return FaceCheckInResponse(success=False, message="No face detected")
+    
     try:
-        # Decode and process image
-        image_data = base64.b64decode(request.face_image_base64)
-        nparr = np.frombuffer(image_data, np.uint8)
-        import cv2
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        
-        # Get face encoding from image
-        face_encodings = face_recognition.face_encodings(rgb_image)
-        if not face_encodings:
-            return FaceCheckInResponse(success=False, message="No face detected")
+        # One vectorized distance computation against all registered faces
+        index = await get_face_index(db, current_user.tenant_id)
+        matches = index.match(unknown_encoding, top_k=1)
+        if not matches:
+            return FaceCheckInResponse(success=False, message="Face not recognized")
         
-        unknown_encoding = face_encodings[0]
-        
-        # Get all employees with registered faces
-        result = await db.execute(
-            select(models_hr.Employee).where(and_(
-                models_hr.Employee.tenant_id == current_user.tenant_id,
-                models_hr.Employee.face_encoding != None,
-                models_hr.Employee.status == models_hr.EmployeeStatus.ACTIVE
-            ))
+        emp = matches[0]
+        check_in_data = AttendanceCheckIn(
+            method=models_hr.CheckInMethod.FACE,
+            face_image_base64=request.face_image_base64,
+            location=request.location,
+            device=request.device
         )
-        employees = result.scalars().all()
-        
-        # Compare faces
-        for emp in employees:
-            try:
-                known_encoding = np.array(json.loads(emp.face_encoding))
-                match = face_recognition.compare_faces([known_encoding], unknown_encoding, tolerance=0.6)
-                if match[0]:
-                    # Found match - record attendance
-                    check_in_data = AttendanceCheckIn(
-                        method=models_hr.CheckInMethod.FACE,
-                        face_image_base64=request.face_image_base64,
-                        location=request.location,
-                        device=request.device
-                    )
-                    attendance = await attendance_check_in(emp.id, check_in_data, db, current_user)
-                    
-                    return FaceCheckInResponse(
-                        success=True,
-                        message=f"Welcome, {emp.first_name}!",
-                        employee_id=emp.id,
-                        employee_name=f"{emp.first_name} {emp.last_name}",
-                        check_in_time=attendance.check_in,
-                        photo_url=attendance.check_in_photo_url
-                    )
-            except:
-                continue
+        attendance = await attendance_check_in(emp["id"], check_in_data, db, current_user)
         
-        return FaceCheckInResponse(success=False, message="Face not recognized")
+        return FaceCheckInResponse(
+            success=True,
+            message=f"Welcome, {emp['first_name']}!",
+            employee_id=emp["id"],
+            employee_name=f"{emp['first_name']} {emp['last_name']}",
+            check_in_time=attendance.check_in,
+            photo_url=attendance.check_in_photo_url
+        )
     except Exception as e:
         return FaceCheckInResponse(success=False, message=str(e))
 
@@ -975,8 +902,38 @@ async def list_attendance(
     ]
 
 
+@router.post("/attendance/ingest", response_model=AttendanceIngestResponse)
+async def ingest_attendance(
+    request: AttendanceIngestRequest,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Bulk ingest buffered check-in / check-out events from an attendance terminal"""
+    if len(request.events) > MAX_INGEST_EVENTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_INGEST_EVENTS} events per request")
+    
+    result = await ingest_attendance_events(
+        db, current_user.tenant_id, request.device_id,
+        [event.model_dump() for event in request.events]
+    )
+    await db.commit()
+    await invalidate_hr_dashboard(current_user.tenant_id)
+    
+    background_tasks.add_task(upload_attendance_photos, result["photo_jobs"])
+    return AttendanceIngestResponse(
+        received=len(request.events),
+        inserted=result["inserted"],
+        updated=result["updated"],
+        ignored=result["ignored"],
+        rejected=result["rejected"],
+        photos_queued=len(result["photo_jobs"])
+    )
+
+
 @router.post("/attendance/simple-face-check-in")
 async def simple_face_check_in(
+    background_tasks: BackgroundTasks,
     employee_id: UUID = Query(...),
     face_image_base64: Optional[str] = None,
     db: AsyncSession = Depends(database.get_db),
@@ -1009,20 +966,6 @@ async def simple_face_check_in(
     if attendance and attendance.check_in:
         return {"success": False, "message": "Already checked in today"}
     
-    # Upload photo if provided
-    photo_url = None
-    if face_image_base64:
-        try:
-            import cloudinary.uploader
-            upload_result = cloudinary.uploader.upload(
-                f"data:image/jpeg;base64,{face_image_base64}",
-                folder=f"hr/attendance/{today.isoformat()}",
-                public_id=f"checkin_{employee_id}_{now.strftime('%H%M%S')}"
-            )
-            photo_url = upload_result.get("secure_url")
-        except:
-            pass
-    
     if not attendance:
         attendance = models_hr.Attendance(
             tenant_id=current_user.tenant_id,
@@ -1033,10 +976,21 @@ async def simple_face_check_in(
     
     attendance.check_in = now
     attendance.check_in_method = models_hr.CheckInMethod.FACE
-    attendance.check_in_photo_url = photo_url
+    attendance.check_in_photo_url = None
     attendance.status = models_hr.AttendanceStatus.PRESENT
     
     await db.commit()
+    await invalidate_hr_dashboard(current_user.tenant_id)
+    
+    # Upload photo after responding
+    if face_image_base64:
+        background_tasks.add_task(upload_attendance_photos, [{
+            "attendance_id": attendance.id,
+            "kind": "check_in",
+            "employee_id": employee_id,
+            "timestamp": now,
+            "image_base64": face_image_base64
+        }])
     
     return {
         "success": True,
@@ -1052,6 +1006,7 @@ async def simple_face_check_in(
 
 @router.post("/attendance/simple-face-check-out")
 async def simple_face_check_out(
+    background_tasks: BackgroundTasks,
     employee_id: UUID = Query(...),
     face_image_base64: Optional[str] = None,
     db: AsyncSession = Depends(database.get_db),
@@ -1087,30 +1042,27 @@ async def simple_face_check_out(
     if attendance.check_out:
         return {"success": False, "message": "Already checked out today"}
     
-    # Upload photo if provided
-    photo_url = None
-    if face_image_base64:
-        try:
-            import cloudinary.uploader
-            upload_result = cloudinary.uploader.upload(
-                f"data:image/jpeg;base64,{face_image_base64}",
-                folder=f"hr/attendance/{today.isoformat()}",
-                public_id=f"checkout_{employee_id}_{now.strftime('%H%M%S')}"
-            )
-            photo_url = upload_result.get("secure_url")
-        except:
-            pass
-    
     # Calculate work hours
     work_seconds = (now - attendance.check_in).total_seconds()
     work_hours = work_seconds / 3600
     
     attendance.check_out = now
     attendance.check_out_method = models_hr.CheckInMethod.FACE
-    attendance.check_out_photo_url = photo_url
+    attendance.check_out_photo_url = None
     attendance.work_hours = round(work_hours, 2)
     
     await db.commit()
+    await invalidate_hr_dashboard(current_user.tenant_id)
+    
+    # Upload photo after responding
+    if face_image_base64:
+        background_tasks.add_task(upload_attendance_photos, [{
+            "attendance_id": attendance.id,
+            "kind": "check_out",
+            "employee_id": employee_id,
+            "timestamp": now,
+            "image_base64": face_image_base64
+        }])
     
     return {
         "success": True,
@@ -1173,6 +1125,7 @@ async def fingerprint_check_in(
     attendance.status = models_hr.AttendanceStatus.PRESENT
     
     await db.commit()
+    await invalidate_hr_dashboard(current_user.tenant_id)
     
     return {
         "success": True,
@@ -1231,6 +1184,7 @@ async def fingerprint_check_out(
     attendance.work_hours = round(work_hours, 2)
     
     await db.commit()
+    await invalidate_hr_dashboard(current_user.tenant_id)
     
     return {
         "success": True,
@@ -1250,58 +1204,35 @@ async def face_attendance_check_out(
     current_user: models.User = Depends(get_current_user)
 ):
     """Check-out using face recognition"""
-    try:
-        import face_recognition
-        import numpy as np
-    except ImportError:
+    if not face_recognition_available():
         raise HTTPException(status_code=501, detail="Face recognition not available")
     
+    unknown_encoding = await _encode_face_or_raise(request.face_image_base64)
+    if unknown_encoding is None:
+        return FaceCheckInResponse(success=False, message="No face detected")
+    
     try:
-        image_data = base64.b64decode(request.face_image_base64)
-        nparr = np.frombuffer(image_data, np.uint8)
-        import cv2
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        
-        face_encodings = face_recognition.face_encodings(rgb_image)
-        if not face_encodings:
-            return FaceCheckInResponse(success=False, message="No face detected")
+        index = await get_face_index(db, current_user.tenant_id)
+        matches = index.match(unknown_encoding, top_k=1)
+        if not matches:
+            return FaceCheckInResponse(success=False, message="Face not recognized")
         
-        unknown_encoding = face_encodings[0]
-        
-        result = await db.execute(
-            select(models_hr.Employee).where(and_(
-                models_hr.Employee.tenant_id == current_user.tenant_id,
-                models_hr.Employee.face_encoding != None,
-                models_hr.Employee.status == models_hr.EmployeeStatus.ACTIVE
-            ))
+        emp = matches[0]
+        check_out_data = AttendanceCheckOut(
+            method=models_hr.CheckInMethod.FACE,
+            face_image_base64=request.face_image_base64,
+            location=request.location
         )
-        employees = result.scalars().all()
-        
-        for emp in employees:
-            try:
-                known_encoding = np.array(json.loads(emp.face_encoding))
-                match = face_recognition.compare_faces([known_encoding], unknown_encoding, tolerance=0.6)
-                if match[0]:
-                    check_out_data = AttendanceCheckOut(
-                        method=models_hr.CheckInMethod.FACE,
-                        face_image_base64=request.face_image_base64,
-                        location=request.location
-                    )
-                    attendance = await attendance_check_out(emp.id, check_out_data, db, current_user)
-                    
-                    return FaceCheckInResponse(
-                        success=True,
-                        message=f"Goodbye, {emp.first_name}!",
-                        employee_id=emp.id,
-                        employee_name=f"{emp.first_name} {emp.last_name}",
-                        check_in_time=attendance.check_out,
-                        photo_url=attendance.check_out_photo_url
-                    )
-            except:
-                continue
+        attendance = await attendance_check_out(emp["id"], check_out_data, db, current_user)
         
-        return FaceCheckInResponse(success=False, message="Face not recognized")
+        return FaceCheckInResponse(
+            success=True,
+            message=f"Goodbye, {emp['first_name']}!",
+            employee_id=emp["id"],
+            employee_name=f"{emp['first_name']} {emp['last_name']}",
+            check_in_time=attendance.check_out,
+            photo_url=attendance.check_out_photo_url
+        )
     except Exception as e:
         return FaceCheckInResponse(success=False, message=str(e))
 
@@ -1429,6 +1360,7 @@ async def create_leave_request(
     )
     db.add(db_request)
     await db.commit()
+    await invalidate_hr_dashboard(current_user.tenant_id)
     await db.refresh(db_request)
     return db_request
 
@@ -1477,6 +1409,7 @@ async def approve_leave_request(
     leave_request.approved_at = datetime.utcnow()
     
     await db.commit()
+    await invalidate_hr_dashboard(current_user.tenant_id)
     await db.refresh(leave_request)
     return leave_request
 
@@ -1594,98 +1527,139 @@ async def create_payroll_period(
     return db_period
 
 
+@router.get("/payroll/rules", response_model=PayrollRulesResponse)
+async def get_payroll_rules(
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Get the tenant's payroll rules (defaults when none are configured)"""
+    result = await db.execute(
+        select(models_hr.PayrollRuleSet).where(models_hr.PayrollRuleSet.tenant_id == current_user.tenant_id)
+    )
+    rule_set = result.scalar_one_or_none()
+    if not rule_set:
+        return PayrollRulesResponse()
+    return PayrollRulesResponse(**rule_set.rules, version=rule_set.version, updated_at=rule_set.updated_at)
+
+
+@router.put("/payroll/rules", response_model=PayrollRulesResponse)
+async def update_payroll_rules(
+    rules: PayrollRules,
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Replace the tenant's payroll rules (tax brackets, contribution caps, allowances)"""
+    data = rules.model_dump()
+    try:
+        compile_rules(data)
+    except (ValueError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid payroll rules: {e}")
+    
+    result = await db.execute(
+        select(models_hr.PayrollRuleSet)
+        .where(models_hr.PayrollRuleSet.tenant_id == current_user.tenant_id)
+        .with_for_update()
+    )
+    rule_set = result.scalar_one_or_none()
+    if rule_set:
+        rule_set.rules = data
+        rule_set.version += 1
+        rule_set.updated_by = current_user.id
+    else:
+        rule_set = models_hr.PayrollRuleSet(
+            tenant_id=current_user.tenant_id,
+            rules=data,
+            version=1,
+            updated_by=current_user.id
+        )
+        db.add(rule_set)
+    
+    await db.commit()
+    await db.refresh(rule_set)
+    return PayrollRulesResponse(**rule_set.rules, version=rule_set.version, updated_at=rule_set.updated_at)
+
+
 @router.post("/payroll/run/{period_id}", response_model=PayrollRunResponse)
 async def run_payroll(
     period_id: UUID,
+    background_tasks: BackgroundTasks,
+    background: Optional[bool] = Query(None, description="Force (or skip) the background job; default by headcount"),
     db: AsyncSession = Depends(database.get_db),
     current_user: models.User = Depends(get_current_user)
 ):
     """Execute payroll calculation for a period"""
     period = await db.get(models_hr.PayrollPeriod, period_id)
-    if not period:
+    if not period or period.tenant_id != current_user.tenant_id:
         raise HTTPException(status_code=404, detail="Period not found")
     if period.is_closed:
         raise HTTPException(status_code=400, detail="Period already closed")
     
-    # Create payroll run
-    payroll_run = models_hr.PayrollRun(
-        tenant_id=current_user.tenant_id,
-        payroll_period_id=period.id,
-        run_by=current_user.id,
-        status=models_hr.PayrollStatus.CALCULATED
-    )
-    db.add(payroll_run)
-    await db.flush()
-    
-    # Get active employees
-    result = await db.execute(
-        select(models_hr.Employee).where(and_(
-            models_hr.Employee.tenant_id == current_user.tenant_id,
-            models_hr.Employee.status == models_hr.EmployeeStatus.ACTIVE
-        ))
-    )
-    employees = result.scalars().all()
-    
-    total_gross = 0.0
-    total_deductions = 0.0
-    total_net = 0.0
+    # Create payroll run (one calculating run per period)
+    try:
+        payroll_run = await start_payroll_run(db, current_user.tenant_id, period.id, current_user.id)
+    except PayrollInProgressError as e:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail=str(e))
     
-    for emp in employees:
-        # Calculate salary components
-        base_salary = emp.base_salary or 0
-        
-        # Calculate overtime from attendance
-        overtime_result = await db.execute(
-            select(func.sum(models_hr.Attendance.overtime_minutes)).where(and_(
-                models_hr.Attendance.employee_id == emp.id,
-                models_hr.Attendance.date >= period.start_date,
-                models_hr.Attendance.date <= period.end_date
-            ))
-        )
-        overtime_minutes = overtime_result.scalar() or 0
-        hourly_rate = base_salary / 173  # Monthly hours
-        overtime_pay = (overtime_minutes / 60) * hourly_rate * 1.5
-        
-        gross_pay = base_salary + overtime_pay
-        
-        # Deductions
-        tax_rate = 0.05  # 5% simplified tax
-        tax_deduction = gross_pay * tax_rate
-        bpjs_kes = base_salary * 0.01  # 1%
-        bpjs_tk = base_salary * 0.02  # 2%
-        total_ded = tax_deduction + bpjs_kes + bpjs_tk
-        
-        net_pay = gross_pay - total_ded
-        
-        payslip = models_hr.Payslip(
-            tenant_id=current_user.tenant_id,
-            payroll_run_id=payroll_run.id,
-            employee_id=emp.id,
-            base_salary=base_salary,
-            overtime_pay=round(overtime_pay, 2),
-            gross_pay=round(gross_pay, 2),
-            tax_deduction=round(tax_deduction, 2),
-            bpjs_kes_deduction=round(bpjs_kes, 2),
-            bpjs_tk_deduction=round(bpjs_tk, 2),
-            total_deductions=round(total_ded, 2),
-            net_pay=round(net_pay, 2)
-        )
-        db.add(payslip)
-        
-        total_gross += gross_pay
-        total_deductions += total_ded
-        total_net += net_pay
+    employee_count = await count_payroll_employees(db, current_user.tenant_id)
+    run_in_background = background if background is not None else employee_count > PAYROLL_SYNC_LIMIT
     
-    payroll_run.total_employees = len(employees)
-    payroll_run.total_gross = round(total_gross, 2)
-    payroll_run.total_deductions = round(total_deductions, 2)
-    payroll_run.total_net = round(total_net, 2)
+    if run_in_background:
+        await db.commit()
+        background_tasks.add_task(run_payroll_job, payroll_run.id, period.id, current_user.tenant_id)
+        return payroll_run
     
+    await calculate_payroll(db, current_user.tenant_id, payroll_run.id, period)
     await db.commit()
     await db.refresh(payroll_run)
     return payroll_run
 
 
+@router.post("/payroll/run/{period_id}/dry-run", response_model=PayrollPreviewResponse)
+async def dry_run_payroll(
+    period_id: UUID,
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Calculate payroll for a period without saving a run or payslips"""
+    period = await db.get(models_hr.PayrollPeriod, period_id)
+    if not period or period.tenant_id != current_user.tenant_id:
+        raise HTTPException(status_code=404, detail="Period not found")
+    
+    return await preview_payroll(db, current_user.tenant_id, period)
+
+
+@router.get("/payroll/runs/{run_id}/progress", response_model=PayrollRunProgress)
+async def get_payroll_run_progress(
+    run_id: UUID,
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Progress of a background payroll run"""
+    payroll_run = await db.get(models_hr.PayrollRun, run_id)
+    if not payroll_run or payroll_run.tenant_id != current_user.tenant_id:
+        raise HTTPException(status_code=404, detail="Payroll run not found")
+    
+    progress = await get_payroll_progress(run_id)
+    if progress:
+        return {"run_id": run_id, **progress}
+    
+    # No job record (synchronous run, or progress expired) - derive from the run
+    status = {
+        models_hr.PayrollStatus.DRAFT: "running",
+        models_hr.PayrollStatus.CANCELLED: "failed"
+    }.get(payroll_run.status, "completed")
+    done = payroll_run.total_employees or 0
+    return {
+        "run_id": run_id,
+        "status": status,
+        "processed": done,
+        "total": done,
+        "percent": 100 if status == "completed" else 0,
+        "error": payroll_run.notes if status == "failed" else None
+    }
+
+
 @router.get("/payslips/{employee_id}", response_model=List[PayslipResponse])
 async def get_employee_payslips(
     employee_id: UUID,
@@ -8,7 +8,9 @@ import database
 import models
 from models import models_receiving
 import schemas
-from services.inventory_ledger import record_movement
+from services.inventory_ledger import record_movements, publish_movements
+from services.batch_stock import decrement_batch, run_with_retry, BatchNotFoundError
+from services.fefo_allocator import allocate_pick_list, AllocationError
 
 router = APIRouter(
     prefix="/issuance",
@@ -45,32 +47,74 @@ async def get_available_batches(product_id: uuid.UUID, db: AsyncSession = Depend
 
 @router.post("/issue")
 async def issue_material(request: schemas.IssueRequest, db: AsyncSession = Depends(database.get_db)):
-    # 1. Lock Batch
-    batch = await db.get(models.InventoryBatch, request.batch_id)
-    if not batch:
+    async def issue():
+        # 1. Validate & Deduct Stock in one conditional UPDATE (no read-check-write race)
+        batch = await decrement_batch(db, request.batch_id, request.quantity, product_id=request.product_id)
+
+        # 2. Record Ledger
+        movements = await record_movements(db, [{
+            "product_id": request.product_id,
+            "location_id": request.location_id,
+            "batch_id": request.batch_id,
+            "quantity_change": -request.quantity, # Negative for Issue
+            "movement_type": models.MovementType.OUT_ISSUE,
+            "reference_id": request.reference_id,
+            "project_id": request.project_id,
+            "notes": "Issued to Production",
+            "tenant_id": batch.tenant_id
+        }])
+
+        await db.commit()
+        return batch, movements
+
+    try:
+        batch, movements = await run_with_retry(db, issue)
+    except BatchNotFoundError:
+        await db.rollback()
         raise HTTPException(status_code=404, detail="Batch not found")
-    
-    # 2. Validate
-    if batch.quantity_on_hand < request.quantity:
-        raise HTTPException(status_code=400, detail="Insufficient quantity in batch")
-    if batch.product_id != request.product_id:
-        raise HTTPException(status_code=400, detail="Product mismatch")
-    
-    # 3. Deduct Stock
-    batch.quantity_on_hand -= request.quantity
-    
-    # 4. Record Ledger
-    await record_movement(
-        db,
-        product_id=request.product_id,
-        location_id=request.location_id,
-        quantity_change=-request.quantity, # Negative for Issue
-        movement_type=models.MovementType.OUT_ISSUE,
-        batch_id=request.batch_id,
-        reference_id=request.reference_id,
-        project_id=request.project_id,
-        notes=f"Issued to Production"
-    )
-    
-    await db.commit()
+    except ValueError as e:
+        # InsufficientStockError or product mismatch
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+
+    await publish_movements(movements)
     return {"status": "Issued", "remaining_qty": batch.quantity_on_hand}
+
+
+@router.post("/pick", response_model=schemas.PickListResponse)
+async def issue_pick_list(request: schemas.PickListRequest, db: AsyncSession = Depends(database.get_db)):
+    """
+    Issue a whole pick list in one transaction.
+    Batches are allocated FEFO (or pinned via batch_id), locked with SKIP LOCKED
+    and deducted in a single UPDATE, so concurrent pickers never oversell.
+    """
+    if not request.lines:
+        raise HTTPException(status_code=400, detail="Pick list is empty")
+
+    try:
+        result = await allocate_pick_list(
+            db,
+            lines=[line.model_dump() for line in request.lines],
+            movement_type=models.MovementType.OUT_ISSUE,
+            warehouse_id=request.warehouse_id,
+            reference_id=request.reference_id,
+            project_id=request.project_id,
+            notes="Issued to Production"
+        )
+    except AllocationError as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail={
+            "message": str(e),
+            "shortages": [
+                {**s, "product_id": str(s["product_id"]), "batch_id": str(s["batch_id"]) if s["batch_id"] else None}
+                for s in e.shortages
+            ]
+        })
+
+    await db.commit()
+    await publish_movements(result["movements"])
+
+    return schemas.PickListResponse(
+        status="Issued",
+        allocations=[schemas.PickAllocation(**a) for a in result["allocations"]]
+    )
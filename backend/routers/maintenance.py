@@ -2,7 +2,7 @@
 Maintenance Module Router
 API endpoints for assets, work orders, schedules, and maintenance management
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_, func
 from sqlalchemy.orm import selectinload
@@ -13,6 +13,8 @@ import uuid
 
 import database, models
 from auth import get_current_user
+from services import maintenance_stats
+from services.maintenance_scheduler import generate_due_work_orders
 from models.models_maintenance import (
     Asset, MaintenanceType, MaintenanceWorkOrder, MaintenanceWorkOrderTask, 
     MaintenanceWorkOrderPart, MaintenanceWorkOrderCost, MaintenanceSchedule
@@ -38,91 +40,48 @@ router = APIRouter(
 
 @router.get("/stats", response_model=MaintenanceStats)
 async def get_maintenance_stats(
-    db: AsyncSession = Depends(database.get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    """Get maintenance dashboard statistics"""
-    tenant_id = current_user.tenant_id
-    
-    # Asset counts
-    total_assets = await db.scalar(select(func.count()).select_from(Asset).where(Asset.tenant_id == tenant_id))
-    operational = await db.scalar(select(func.count()).select_from(Asset).where(and_(Asset.tenant_id == tenant_id, Asset.status == 'OPERATIONAL')))
-    under_maint = await db.scalar(select(func.count()).select_from(Asset).where(and_(Asset.tenant_id == tenant_id, Asset.status == 'UNDER_MAINTENANCE')))
-    broken = await db.scalar(select(func.count()).select_from(Asset).where(and_(Asset.tenant_id == tenant_id, Asset.status == 'BROKEN')))
-    
-    # Work order counts
-    total_wo = await db.scalar(select(func.count()).select_from(MaintenanceWorkOrder).where(MaintenanceWorkOrder.tenant_id == tenant_id))
-    pending_wo = await db.scalar(select(func.count()).select_from(MaintenanceWorkOrder).where(and_(MaintenanceWorkOrder.tenant_id == tenant_id, MaintenanceWorkOrder.status.in_(['DRAFT', 'SCHEDULED']))))
-    in_progress = await db.scalar(select(func.count()).select_from(MaintenanceWorkOrder).where(and_(MaintenanceWorkOrder.tenant_id == tenant_id, MaintenanceWorkOrder.status == 'IN_PROGRESS')))
-    
-    # Completed this month
-    first_of_month = date.today().replace(day=1)
-    completed_month = await db.scalar(
-        select(func.count()).select_from(MaintenanceWorkOrder).where(
-            and_(MaintenanceWorkOrder.tenant_id == tenant_id, MaintenanceWorkOrder.status == 'COMPLETED', MaintenanceWorkOrder.completed_at >= first_of_month)
-        )
-    )
-    
-    # Schedule counts
-    overdue = await db.scalar(
-        select(func.count()).select_from(MaintenanceSchedule).where(
-            and_(MaintenanceSchedule.tenant_id == tenant_id, MaintenanceSchedule.is_active == True, MaintenanceSchedule.next_due < date.today())
-        )
-    )
-    upcoming = await db.scalar(
-        select(func.count()).select_from(MaintenanceSchedule).where(
-            and_(MaintenanceSchedule.tenant_id == tenant_id, MaintenanceSchedule.is_active == True, MaintenanceSchedule.next_due >= date.today())
-        )
-    )
-    
-    # Costs this month
-    costs_result = await db.execute(
-        select(func.sum(MaintenanceWorkOrderCost.amount)).join(MaintenanceWorkOrder).where(
-            and_(MaintenanceWorkOrder.tenant_id == tenant_id, MaintenanceWorkOrderCost.date >= first_of_month)
-        )
-    )
-    total_costs = costs_result.scalar() or 0
-    
-    return MaintenanceStats(
-        total_assets=total_assets or 0,
-        operational_assets=operational or 0,
-        under_maintenance=under_maint or 0,
-        broken_assets=broken or 0,
-        total_work_orders=total_wo or 0,
-        pending_work_orders=pending_wo or 0,
-        in_progress_work_orders=in_progress or 0,
-        completed_this_month=completed_month or 0,
-        overdue_schedules=overdue or 0,
-        upcoming_schedules=upcoming or 0,
-        total_costs_this_month=total_costs
-    )
+    """Get maintenance dashboard statistics (cached per tenant and day)"""
+    return MaintenanceStats(**await maintenance_stats.get_maintenance_stats(current_user.tenant_id))
 
 
 # ==================== ASSETS ====================
 
 @router.get("/assets", response_model=List[AssetResponse])
 async def list_assets(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
     db: AsyncSession = Depends(database.get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    """List all assets"""
+    """List all assets with their work order counts"""
+    wo_counts = select(
+        MaintenanceWorkOrder.asset_id,
+        func.count().label("work_order_count"),
+        func.count().filter(MaintenanceWorkOrder.status.in_(['DRAFT', 'SCHEDULED', 'IN_PROGRESS'])).label("pending_work_orders")
+    ).where(MaintenanceWorkOrder.tenant_id == current_user.tenant_id).group_by(MaintenanceWorkOrder.asset_id).subquery()
+    
     result = await db.execute(
-        select(Asset).where(Asset.tenant_id == current_user.tenant_id).order_by(Asset.code)
+        select(
+            Asset,
+            func.coalesce(wo_counts.c.work_order_count, 0),
+            func.coalesce(wo_counts.c.pending_work_orders, 0)
+        ).outerjoin(wo_counts, wo_counts.c.asset_id == Asset.id)
+        .where(Asset.tenant_id == current_user.tenant_id)
+        .order_by(Asset.code).offset(skip).limit(limit)
     )
-    assets = result.scalars().all()
     
-    response = []
-    for a in assets:
-        wo_count = await db.scalar(select(func.count()).select_from(MaintenanceWorkOrder).where(MaintenanceWorkOrder.asset_id == a.id))
-        pending = await db.scalar(select(func.count()).select_from(MaintenanceWorkOrder).where(and_(MaintenanceWorkOrder.asset_id == a.id, MaintenanceWorkOrder.status.in_(['DRAFT', 'SCHEDULED', 'IN_PROGRESS']))))
-        response.append(AssetResponse(
+    return [
+        AssetResponse(
             id=a.id, code=a.code, name=a.name, category=a.category, location=a.location, status=a.status,
             purchase_date=a.purchase_date, purchase_cost=a.purchase_cost, serial_number=a.serial_number,
             manufacturer=a.manufacturer, model=a.model, warranty_expiry=a.warranty_expiry,
             notes=a.notes, image_url=a.image_url, created_at=a.created_at, updated_at=a.updated_at,
-            work_order_count=wo_count or 0, pending_work_orders=pending or 0
-        ))
-    return response
+            work_order_count=wo_count, pending_work_orders=pending
+        )
+        for a, wo_count, pending in result.all()
+    ]
 
 
 @router.post("/assets", response_model=AssetResponse)
@@ -135,6 +94,7 @@ async def create_asset(
     db_asset = Asset(tenant_id=current_user.tenant_id, **asset.model_dump())
     db.add(db_asset)
     await db.commit()
+    await maintenance_stats.invalidate_maintenance_stats(current_user.tenant_id)
     await db.refresh(db_asset)
     return db_asset
 
@@ -170,6 +130,7 @@ async def update_asset(
         setattr(asset, key, value)
     
     await db.commit()
+    await maintenance_stats.invalidate_maintenance_stats(current_user.tenant_id)
     await db.refresh(asset)
     return asset
 
@@ -187,6 +148,7 @@ async def delete_asset(
         raise HTTPException(status_code=404, detail="Asset not found")
     await db.delete(asset)
     await db.commit()
+    await maintenance_stats.invalidate_maintenance_stats(current_user.tenant_id)
     return {"message": "Asset deleted"}
 
 
@@ -221,48 +183,59 @@ async def create_maintenance_type(
 @router.get("/work-orders", response_model=List[WorkOrderResponse])
 async def list_work_orders(
     status: str = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
     db: AsyncSession = Depends(database.get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    """List all work orders"""
-    query = select(MaintenanceWorkOrder).where(MaintenanceWorkOrder.tenant_id == current_user.tenant_id)
+    """List all work orders with asset, type, assignee, cost and task totals (one query)"""
+    page = select(MaintenanceWorkOrder.id).where(MaintenanceWorkOrder.tenant_id == current_user.tenant_id)
     if status:
-        query = query.where(MaintenanceWorkOrder.status == status)
-    query = query.order_by(MaintenanceWorkOrder.created_at.desc())
+        page = page.where(MaintenanceWorkOrder.status == status)
+    page = page.order_by(MaintenanceWorkOrder.created_at.desc()).offset(skip).limit(limit).cte("page")
     
-    result = await db.execute(query)
-    work_orders = result.scalars().all()
+    # Aggregate costs and tasks of the requested page only
+    costs = select(
+        MaintenanceWorkOrderCost.work_order_id,
+        func.sum(MaintenanceWorkOrderCost.amount).label("total_cost")
+    ).where(MaintenanceWorkOrderCost.work_order_id.in_(select(page.c.id))) \
+        .group_by(MaintenanceWorkOrderCost.work_order_id).subquery()
+    tasks = select(
+        MaintenanceWorkOrderTask.work_order_id,
+        func.count().label("task_count"),
+        func.count().filter(MaintenanceWorkOrderTask.is_completed == True).label("completed_tasks")
+    ).where(MaintenanceWorkOrderTask.work_order_id.in_(select(page.c.id))) \
+        .group_by(MaintenanceWorkOrderTask.work_order_id).subquery()
     
-    response = []
-    for wo in work_orders:
-        # Get related data
-        asset_result = await db.execute(select(Asset).where(Asset.id == wo.asset_id))
-        asset = asset_result.scalar_one_or_none()
-        
-        assigned_name = None
-        if wo.assigned_to:
-            user_result = await db.execute(select(models.User).where(models.User.id == wo.assigned_to))
-            user = user_result.scalar_one_or_none()
-            assigned_name = user.username if user else None
-        
-        # Get costs
-        costs_result = await db.execute(select(func.sum(MaintenanceWorkOrderCost.amount)).where(MaintenanceWorkOrderCost.work_order_id == wo.id))
-        total_cost = costs_result.scalar() or 0
-        
-        # Get task counts
-        task_count = await db.scalar(select(func.count()).select_from(MaintenanceWorkOrderTask).where(MaintenanceWorkOrderTask.work_order_id == wo.id))
-        completed_tasks = await db.scalar(select(func.count()).select_from(MaintenanceWorkOrderTask).where(and_(MaintenanceWorkOrderTask.work_order_id == wo.id, MaintenanceWorkOrderTask.is_completed == True)))
-        
-        response.append(WorkOrderResponse(
+    result = await db.execute(
+        select(
+            MaintenanceWorkOrder,
+            Asset.name, Asset.code, MaintenanceType.name, models.User.username,
+            func.coalesce(costs.c.total_cost, 0),
+            func.coalesce(tasks.c.task_count, 0),
+            func.coalesce(tasks.c.completed_tasks, 0)
+        )
+        .join(page, page.c.id == MaintenanceWorkOrder.id)
+        .outerjoin(Asset, Asset.id == MaintenanceWorkOrder.asset_id)
+        .outerjoin(MaintenanceType, MaintenanceType.id == MaintenanceWorkOrder.type_id)
+        .outerjoin(models.User, models.User.id == MaintenanceWorkOrder.assigned_to)
+        .outerjoin(costs, costs.c.work_order_id == MaintenanceWorkOrder.id)
+        .outerjoin(tasks, tasks.c.work_order_id == MaintenanceWorkOrder.id)
+        .order_by(MaintenanceWorkOrder.created_at.desc())
+    )
+    
+    return [
+        WorkOrderResponse(
             id=wo.id, code=wo.code, asset_id=wo.asset_id, type_id=wo.type_id,
             title=wo.title, description=wo.description, priority=wo.priority, status=wo.status,
             scheduled_date=wo.scheduled_date, started_at=wo.started_at, completed_at=wo.completed_at,
             assigned_to=wo.assigned_to, reported_by=wo.reported_by, notes=wo.notes,
             created_at=wo.created_at, updated_at=wo.updated_at,
-            asset_name=asset.name if asset else None, asset_code=asset.code if asset else None,
-            assigned_name=assigned_name, total_cost=total_cost, task_count=task_count or 0, completed_tasks=completed_tasks or 0
-        ))
-    return response
+            asset_name=asset_name, asset_code=asset_code, type_name=type_name,
+            assigned_name=assigned_name, total_cost=total_cost, task_count=task_count, completed_tasks=completed_tasks
+        )
+        for wo, asset_name, asset_code, type_name, assigned_name, total_cost, task_count, completed_tasks in result.all()
+    ]
 
 
 @router.post("/work-orders", response_model=WorkOrderResponse)
@@ -291,6 +264,7 @@ async def create_work_order(
     )
     db.add(db_wo)
     await db.commit()
+    await maintenance_stats.invalidate_maintenance_stats(current_user.tenant_id)
     await db.refresh(db_wo)
     
     return WorkOrderResponse(
@@ -351,6 +325,7 @@ async def update_work_order(
         setattr(wo, key, value)
     
     await db.commit()
+    await maintenance_stats.invalidate_maintenance_stats(current_user.tenant_id)
     await db.refresh(wo)
     return wo
 
@@ -368,6 +343,7 @@ async def delete_work_order(
         raise HTTPException(status_code=404, detail="Work order not found")
     await db.delete(wo)
     await db.commit()
+    await maintenance_stats.invalidate_maintenance_stats(current_user.tenant_id)
     return {"message": "Work order deleted"}
 
 
@@ -472,6 +448,7 @@ async def add_work_order_cost(
     db_cost = MaintenanceWorkOrderCost(work_order_id=wo_id, **cost.model_dump())
     db.add(db_cost)
     await db.commit()
+    await maintenance_stats.invalidate_maintenance_stats(current_user.tenant_id)
     await db.refresh(db_cost)
     return db_cost
 
@@ -480,26 +457,41 @@ async def add_work_order_cost(
 
 @router.get("/schedules", response_model=List[MaintenanceScheduleResponse])
 async def list_schedules(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
     db: AsyncSession = Depends(database.get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    """List maintenance schedules"""
+    """List maintenance schedules with their asset and type (one query)"""
     result = await db.execute(
-        select(MaintenanceSchedule).where(MaintenanceSchedule.tenant_id == current_user.tenant_id).order_by(MaintenanceSchedule.next_due)
+        select(MaintenanceSchedule, Asset.name, Asset.code, MaintenanceType.name)
+        .outerjoin(Asset, Asset.id == MaintenanceSchedule.asset_id)
+        .outerjoin(MaintenanceType, MaintenanceType.id == MaintenanceSchedule.type_id)
+        .where(MaintenanceSchedule.tenant_id == current_user.tenant_id)
+        .order_by(MaintenanceSchedule.next_due).offset(skip).limit(limit)
     )
-    schedules = result.scalars().all()
     
-    response = []
-    for s in schedules:
-        asset_result = await db.execute(select(Asset).where(Asset.id == s.asset_id))
-        asset = asset_result.scalar_one_or_none()
-        response.append(MaintenanceScheduleResponse(
+    return [
+        MaintenanceScheduleResponse(
             id=s.id, asset_id=s.asset_id, type_id=s.type_id, title=s.title, description=s.description,
             frequency=s.frequency, interval_days=s.interval_days, next_due=s.next_due, is_active=s.is_active,
             last_performed=s.last_performed, created_at=s.created_at,
-            asset_name=asset.name if asset else None, asset_code=asset.code if asset else None
-        ))
-    return response
+            asset_name=asset_name, asset_code=asset_code, type_name=type_name
+        )
+        for s, asset_name, asset_code, type_name in result.all()
+    ]
+
+
+@router.post("/schedules/generate")
+async def generate_scheduled_work_orders(
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Create work orders for this tenant's due schedules now (same job the scheduler runs)"""
+    created = await generate_due_work_orders(db, tenant_id=current_user.tenant_id)
+    if created is None:
+        raise HTTPException(status_code=409, detail="The maintenance scheduler is running, try again shortly")
+    return {"created": created.get(current_user.tenant_id, 0)}
 
 
 @router.post("/schedules", response_model=MaintenanceScheduleResponse)
@@ -512,6 +504,7 @@ async def create_schedule(
     db_schedule = MaintenanceSchedule(tenant_id=current_user.tenant_id, **schedule.model_dump())
     db.add(db_schedule)
     await db.commit()
+    await maintenance_stats.invalidate_maintenance_stats(current_user.tenant_id)
     await db.refresh(db_schedule)
     return db_schedule
 
@@ -533,6 +526,7 @@ async def update_schedule(
         setattr(schedule, key, value)
     
     await db.commit()
+    await maintenance_stats.invalidate_maintenance_stats(current_user.tenant_id)
     await db.refresh(schedule)
     return schedule
 
@@ -550,4 +544,5 @@ async def delete_schedule(
         raise HTTPException(status_code=404, detail="Schedule not found")
     await db.delete(schedule)
     await db.commit()
+    await maintenance_stats.invalidate_maintenance_stats(current_user.tenant_id)
     return {"message": "Schedule deleted"}
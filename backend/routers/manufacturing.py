@@ -11,6 +11,7 @@ import database, models
 import schemas
 from models.models_manufacturing import Category, Product
 from auth import get_current_user
+from services import pos_pricing
 
 router = APIRouter(
     prefix="/manufacturing",
@@ -206,6 +207,7 @@ async def create_product(
     except Exception as e:
         await db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
+    await pos_pricing.invalidate_pricing(new_product.tenant_id)
     return new_product
 
 @router.get("/products", response_model=List[schemas.ProductResponse])
@@ -234,6 +236,7 @@ async def update_product(
     except Exception as e:
         await db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
+    await pos_pricing.invalidate_pricing(existing.tenant_id)
     return existing
 
 @router.delete("/products/{product_id}")
@@ -247,8 +250,10 @@ async def delete_product(
     if not existing:
         raise HTTPException(status_code=404, detail="Product not found")
     
+    tenant_id = existing.tenant_id
     await db.delete(existing)
     await db.commit()
+    await pos_pricing.invalidate_pricing(tenant_id)
     return {"message": "Product deleted"}
 
 # BOM Endpoints
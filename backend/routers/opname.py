@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
@@ -11,7 +11,13 @@ import models
 from models import models_opname
 import schemas
 from schemas import schemas_opname
-from services.inventory_ledger import record_movement
+from services.inventory_ledger import publish_movements
+from services.opname_posting import recalculate_opname_totals, apply_count_batch, post_opname_adjustments
+from services.opname_snapshot import (
+    SNAPSHOT_SYNC_LIMIT, count_snapshot_batches, snapshot_stock, run_snapshot_job,
+    get_snapshot_progress as fetch_snapshot_progress
+)
+from services.batch_stock import InsufficientStockError
 from auth import get_current_user
 
 router = APIRouter(
@@ -19,6 +25,9 @@ router = APIRouter(
     tags=["Stock Opname"]
 )
 
+# Upper bound for one offline count sync call
+MAX_COUNT_BATCH = 1000
+
 # ============ SCHEDULE ENDPOINTS ============
 
 @router.post("/schedule", response_model=schemas_opname.ScheduleResponse)
@@ -132,10 +141,11 @@ async def assign_team(
 @router.post("/create", response_model=schemas_opname.OpnameResponse)
 async def create_opname(
     request: schemas_opname.OpnameCreate, 
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(database.get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    """Create a new stock opname and snapshot current stock"""
+    """Create a new stock opname and snapshot current stock (in the background for very large warehouses)"""
     # Generate opname number
     today = datetime.now().strftime("%Y%m%d")
     count_query = select(func.count(models_opname.StockOpname.id)).where(
@@ -146,57 +156,34 @@ async def create_opname(
     count = result.scalar() or 0
     opname_number = f"OPN-{today}-{str(count + 1).zfill(3)}"
     
+    # Very large warehouses are snapshotted by a background job
+    batch_count = await count_snapshot_batches(db, request.warehouse_id, current_user.tenant_id)
+    run_in_background = request.background if request.background is not None else batch_count > SNAPSHOT_SYNC_LIMIT
+
     # Create opname header
     new_opname = models_opname.StockOpname(
         warehouse_id=request.warehouse_id,
         schedule_id=request.schedule_id,
         opname_number=opname_number,
-        status="Scheduled",  # Use string value to match database enum
+        status="Snapshotting" if run_in_background else "Scheduled",  # Use string value to match database enum
         notes=request.notes,
+        total_items=0,
+        total_system_value=0,
         tenant_id=current_user.tenant_id,
         created_by=current_user.id
     )
     db.add(new_opname)
     await db.flush()
 
-    # Snapshot current stock in this warehouse
-    query = select(models.InventoryBatch)\
-        .join(models.InventoryBatch.location)\
-        .where(
-            models.Location.warehouse_id == request.warehouse_id,
-            models.InventoryBatch.quantity_on_hand > 0
-        )
-    result = await db.execute(query)
-    batches = result.scalars().all()
-
-    total_items = 0
-    total_system_value = 0
-    
-    for batch in batches:
-        # Get product cost
-        product = await db.get(models.Product, batch.product_id)
-        unit_cost = product.standard_cost if product and product.standard_cost else 0
-        system_value = batch.quantity_on_hand * unit_cost
-        
-        detail = models_opname.StockOpnameDetail(
-            opname_id=new_opname.id,
-            product_id=batch.product_id,
-            batch_id=batch.id,
-            location_id=batch.location_id,
-            system_qty=batch.quantity_on_hand,
-            counted_qty=None,
-            unit_cost=unit_cost,
-            system_value=system_value,
-            tenant_id=current_user.tenant_id
+    if run_in_background:
+        await db.commit()
+        background_tasks.add_task(
+            run_snapshot_job, new_opname.id, request.warehouse_id, current_user.tenant_id, batch_count
         )
-        db.add(detail)
-        total_items += 1
-        total_system_value += system_value
-    
-    new_opname.total_items = total_items
-    new_opname.total_system_value = total_system_value
-
-    await db.commit()
+    else:
+        # Snapshot current stock in this warehouse - one INSERT ... SELECT, totals included
+        await snapshot_stock(db, new_opname.id, request.warehouse_id, current_user.tenant_id)
+        await db.commit()
     
     # Reload with relationships to avoid MissingGreenlet error
     query = select(models_opname.StockOpname).where(
@@ -205,11 +192,37 @@ async def create_opname(
         selectinload(models_opname.StockOpname.warehouse),
         selectinload(models_opname.StockOpname.details).selectinload(models_opname.StockOpnameDetail.product),
         selectinload(models_opname.StockOpname.details).selectinload(models_opname.StockOpnameDetail.location)
-    )
+    ).execution_options(populate_existing=True)
     result = await db.execute(query)
     return result.scalar_one()
 
 
+@router.get("/{opname_id}/snapshot-progress", response_model=schemas_opname.SnapshotProgress)
+async def get_snapshot_progress(
+    opname_id: uuid.UUID,
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Progress of a background stock snapshot"""
+    opname = await db.get(models_opname.StockOpname, opname_id)
+    if not opname or opname.tenant_id != current_user.tenant_id:
+        raise HTTPException(status_code=404, detail="Opname not found")
+
+    progress = await fetch_snapshot_progress(opname_id)
+    if progress:
+        return {"opname_id": opname_id, **progress}
+
+    # No job record (synchronous snapshot, or progress expired) - derive from the opname
+    done = opname.status != "Snapshotting"
+    return {
+        "opname_id": opname_id,
+        "status": "completed" if done else "running",
+        "processed_items": opname.total_items or 0,
+        "total_items": opname.total_items or 0,
+        "percent": 100 if done else 0
+    }
+
+
 @router.post("/start-counting")
 async def start_counting(
     request: schemas_opname.OpnameStartCounting,
@@ -284,6 +297,44 @@ async def update_count(
     return {"status": "Updated", "count": counted, "variance_items": variance_count}
 
 
+@router.post("/count-batch", response_model=schemas_opname.OpnameCountBatchResult)
+async def submit_count_batch(
+    request: schemas_opname.OpnameCountBatch,
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Sync a queue of counted lines from a handheld scanner in one call.
+    Lines carry client sequence numbers, so retrying a batch is safe, and
+    their count time; lines older than another device's count are returned
+    as conflicts.
+    """
+    if len(request.items) > MAX_COUNT_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_COUNT_BATCH} lines per batch")
+
+    opname = await db.get(models_opname.StockOpname, request.opname_id)
+    if not opname or opname.tenant_id != current_user.tenant_id:
+        raise HTTPException(status_code=404, detail="Opname not found")
+    if opname.status not in ["Scheduled", "In Progress", "Counting Done"]:
+        raise HTTPException(status_code=400, detail=f"Cannot record counts. Current status: {opname.status}")
+    
+    if opname.status == "Scheduled":
+        opname.status = "In Progress"
+        opname.counting_started_at = datetime.utcnow()
+    
+    result = await apply_count_batch(
+        db,
+        opname_id=request.opname_id,
+        device_id=request.device_id,
+        items=[item.model_dump() for item in request.items],
+        user_id=current_user.id
+    )
+    totals = await recalculate_opname_totals(db, request.opname_id)
+    
+    await db.commit()
+    return {"status": "Synced", **result, **totals}
+
+
 @router.post("/complete-counting")
 async def complete_counting(
     opname_id: uuid.UUID,
@@ -298,17 +349,8 @@ async def complete_counting(
     opname.status = "Counting Done"
     opname.counting_completed_at = datetime.utcnow()
     
-    # Calculate final totals
-    query = select(models_opname.StockOpnameDetail).where(
-        models_opname.StockOpnameDetail.opname_id == opname_id
-    )
-    result = await db.execute(query)
-    details = result.scalars().all()
-    
-    opname.counted_items = sum(1 for d in details if d.counted_qty is not None)
-    opname.items_with_variance = sum(1 for d in details if d.variance != 0)
-    opname.total_counted_value = sum(d.counted_value or 0 for d in details)
-    opname.total_variance_value = sum(d.variance_value or 0 for d in details)
+    # Calculate final totals - one aggregate query
+    await recalculate_opname_totals(db, opname_id)
     
     await db.commit()
     return {"status": "Counting complete", "ready_for_review": True}
@@ -368,13 +410,15 @@ async def approve_opname(
 @router.post("/post")
 async def post_opname(
     payload: schemas_opname.OpnamePostRequest, 
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(database.get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    """Post opname adjustments to inventory"""
+    """Post opname adjustments to inventory in one transaction"""
+    # Lock the header so the same opname can never be posted twice
     query = select(models_opname.StockOpname)\
         .where(models_opname.StockOpname.id == payload.opname_id)\
-        .options(selectinload(models_opname.StockOpname.details))
+        .with_for_update()
     result = await db.execute(query)
     opname = result.scalar_one_or_none()
 
@@ -383,37 +427,21 @@ async def post_opname(
     if opname.status not in ["Approved", "Reviewed"]:
         raise HTTPException(status_code=400, detail=f"Cannot post. Status must be Approved or Reviewed. Current: {opname.status}")
 
-    adjustments_made = 0
-    for detail in opname.details:
-        if detail.counted_qty is None:
-            continue
-        
-        diff = detail.counted_qty - detail.system_qty
-        
-        if diff != 0:
-            batch = await db.get(models.InventoryBatch, detail.batch_id)
-            if batch:
-                batch.quantity_on_hand = detail.counted_qty
-                
-                await record_movement(
-                    db,
-                    product_id=detail.product_id,
-                    location_id=batch.location_id,
-                    quantity_change=diff,
-                    movement_type=models.MovementType.ADJUSTMENT,
-                    batch_id=batch.id,
-                    reference_id=str(opname.id),
-                    notes=f"Stock Opname Adjustment - {detail.variance_reason.value if detail.variance_reason else 'Adjustment'}",
-                    tenant_id=current_user.tenant_id
-                )
-                adjustments_made += 1
+    try:
+        movements = await post_opname_adjustments(db, opname.id, current_user.id)
+    except InsufficientStockError as e:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail=f"{e}. Recount the item(s).")
 
     opname.status = "Posted"
     opname.posted_at = datetime.utcnow()
     opname.posted_by = current_user.id
     
     await db.commit()
-    return {"status": "Posted", "adjustments_made": adjustments_made}
+
+    # Broadcast ledger events after the commit, off the request path
+    background_tasks.add_task(publish_movements, movements)
+    return {"status": "Posted", "adjustments_made": len(movements)}
 
 
 # ============ LIST & GET ============
@@ -20,6 +20,7 @@ from models.models_sales import Customer
 from models.models_manufacturing import Product
 from models.models_settings import TenantSettings
 from auth import get_current_user
+from services import pos_pricing, pos_sync, promo_redemptions
 
 router = APIRouter(
     prefix="/pos",
@@ -69,19 +70,29 @@ class CustomerResponse(BaseModel):
 
 class TransactionItemCreate(BaseModel):
     product_id: UUID
-    name: str
+    name: Optional[str] = None  # Display only; priced from the catalog
     quantity: float
-    unit_price: float
+    unit_price: Optional[float] = None  # Display only; priced from the catalog
 
 
 class TransactionCreate(BaseModel):
     customer_id: Optional[UUID] = None
     items: List[TransactionItemCreate]
     promo_code: Optional[str] = None
+    promo_codes: List[str] = []  # Stackable promos, in addition to promo_code
     payment_method: str = "CASH"
     payment_reference: Optional[str] = None
 
 
+class OfflineTransactionCreate(TransactionCreate):
+    client_id: UUID  # Generated by the POS client; stored as the transaction id
+    created_at: Optional[datetime] = None  # When the sale happened offline
+
+
+class TransactionSyncRequest(BaseModel):
+    transactions: List[OfflineTransactionCreate]
+
+
 class TransactionResponse(BaseModel):
     id: UUID
     customer_id: Optional[UUID] = None
@@ -388,39 +399,22 @@ async def create_transaction(
     db: AsyncSession = Depends(database.get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    """Create a new POS transaction"""
-    
-    # Calculate subtotal
-    subtotal = sum(item.quantity * item.unit_price for item in payload.items)
-    discount = 0
-    promo_id = None
-    
-    # Apply promo if provided
-    if payload.promo_code:
-        promo_result = await db.execute(
-            select(Promo).where(
-                Promo.tenant_id == current_user.tenant_id,
-                Promo.code == payload.promo_code,
-                Promo.is_active == True
-            )
+    """Create a new POS transaction, priced from the tenant's pricing snapshot"""
+    snapshot = await pos_pricing.get_pricing_snapshot(db, current_user.tenant_id)
+    codes = ([payload.promo_code] if payload.promo_code else []) + payload.promo_codes
+    try:
+        pricing = snapshot.evaluate(
+            [{"product_id": item.product_id, "quantity": item.quantity} for item in payload.items],
+            codes
         )
-        promo = promo_result.scalar_one_or_none()
-        
-        if promo:
-            if subtotal >= promo.min_order:
-                if promo.promo_type == PromoType.FIXED:
-                    discount = promo.value
-                elif promo.promo_type == PromoType.PERCENTAGE:
-                    discount = subtotal * (promo.value / 100)
-                    if promo.max_discount:
-                        discount = min(discount, promo.max_discount)
-                
-                promo_id = promo.id
-                promo.usage_count += 1
-    
-    # Calculate tax (10%)
-    tax = (subtotal - discount) * 0.1
-    total = subtotal - discount + tax
+    except pos_pricing.PricingError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    subtotal = pricing["subtotal"]
+    discount = pricing["discount"]
+    tax = pricing["tax"]
+    total = pricing["total"]
+    promo_ids = [p["id"] for p in pricing["promos"]]
     
     # Parse payment method
     try:
@@ -443,16 +437,7 @@ async def create_transaction(
                 raise HTTPException(status_code=400, detail="Insufficient credit balance")
     
     # Create transaction
-    items_json = [
-        {
-            "product_id": str(item.product_id),
-            "name": item.name,
-            "quantity": item.quantity,
-            "unit_price": item.unit_price,
-            "subtotal": item.quantity * item.unit_price
-        }
-        for item in payload.items
-    ]
+    items_json = pricing["lines"]
     
     transaction = POSTransaction(
         id=uuid_module.uuid4(),
@@ -466,12 +451,19 @@ async def create_transaction(
         total=total,
         payment_method=payment_method,
         payment_reference=payload.payment_reference,
-        promo_id=promo_id,
-        promo_code=payload.promo_code,
+        promo_id=promo_ids[0] if promo_ids else None,
+        promo_code=",".join(p["code"] for p in pricing["promos"]) or None,
         status=TransactionStatus.COMPLETED
     )
     db.add(transaction)
     
+    try:
+        reservation = await promo_redemptions.redeem(
+            db, current_user.tenant_id, transaction.id, pricing["promos"], payload.customer_id
+        )
+    except promo_redemptions.RedemptionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     # Update customer balance if paying with credit
     if payment_method == PaymentMethod.CREDIT and customer:
         balance_before = customer.current_balance
@@ -511,7 +503,12 @@ async def create_transaction(
         )
         db.add(log)
     
-    await db.commit()
+    try:
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        await reservation.release()
+        raise
     await db.refresh(transaction)
     
     return TransactionResponse(
@@ -530,6 +527,26 @@ async def create_transaction(
     )
 
 
+@router.post("/transactions/sync")
+async def sync_transactions(
+    payload: TransactionSyncRequest,
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Store a queue of offline sales in one round-trip (idempotent on client_id)"""
+    if len(payload.transactions) > pos_sync.MAX_SYNC_BATCH:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {pos_sync.MAX_SYNC_BATCH} transactions per sync"
+        )
+    return await pos_sync.sync_transactions(
+        db,
+        current_user.tenant_id,
+        current_user.id,
+        [t.model_dump() for t in payload.transactions]
+    )
+
+
 @router.get("/transactions", response_model=List[TransactionResponse])
 async def get_transactions(
     limit: int = 50,
@@ -600,6 +617,7 @@ async def get_active_promos(
 async def validate_promo(
     code: str,
     order_amount: float,
+    customer_id: Optional[UUID] = None,
     db: AsyncSession = Depends(database.get_db),
     current_user: models.User = Depends(get_current_user)
 ):
@@ -623,8 +641,9 @@ async def validate_promo(
     if promo.end_date and promo.end_date < now:
         return {"valid": False, "error": "Promo has expired"}
     
-    if promo.usage_limit and promo.usage_count >= promo.usage_limit:
-        return {"valid": False, "error": "Promo usage limit reached"}
+    usage_error = await promo_redemptions.usage_error(db, current_user.tenant_id, promo, customer_id)
+    if usage_error:
+        return {"valid": False, "error": usage_error}
     
     if order_amount < promo.min_order:
         return {"valid": False, "error": f"Minimum order amount is {promo.min_order}"}
@@ -588,3 +588,29 @@ class FleetStats(BaseModel):
     total_fuel_cost_month: float
     total_maintenance_cost_month: float
     total_expense_month: float
+
+
+class VehicleCostMonth(BaseModel):
+    vehicle_id: UUID
+    month: date
+    fuel_cost: float
+    maintenance_cost: float
+    expense_cost: float
+    total_cost: float
+    fuel_liters: float
+    distance_km: float
+    cost_per_km: Optional[float] = None
+    fuel_efficiency: Optional[float] = None  # km/liter
+
+
+class FleetCostTrend(BaseModel):
+    month: date
+    vehicles: int
+    fuel_cost: float
+    maintenance_cost: float
+    expense_cost: float
+    total_cost: float
+    fuel_liters: float
+    distance_km: float
+    cost_per_km: Optional[float] = None
+    fuel_efficiency: Optional[float] = None
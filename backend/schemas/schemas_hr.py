@@ -370,6 +370,30 @@ class AttendanceResponse(BaseModel):
         from_attributes = True
 
 
+class AttendanceEvent(BaseModel):
+    """One buffered check-in / check-out from an attendance terminal"""
+    employee_id: UUID
+    event_type: str  # check_in or check_out
+    timestamp: datetime
+    method: CheckInMethodEnum = CheckInMethodEnum.FACE
+    location: Optional[str] = None
+    face_image_base64: Optional[str] = None
+
+
+class AttendanceIngestRequest(BaseModel):
+    device_id: str
+    events: List[AttendanceEvent]
+
+
+class AttendanceIngestResponse(BaseModel):
+    received: int
+    inserted: int
+    updated: int
+    ignored: int
+    rejected: List[dict] = []
+    photos_queued: int
+
+
 class AttendanceListFilter(BaseModel):
     employee_id: Optional[UUID] = None
     department_id: Optional[UUID] = None
@@ -518,6 +542,85 @@ class PayrollRunResponse(BaseModel):
         from_attributes = True
 
 
+class PayslipPreview(BaseModel):
+    employee_id: UUID
+    base_salary: float
+    allowances: float = 0.0
+    overtime_minutes: int
+    overtime_pay: float
+    gross_pay: float
+    tax_deduction: float
+    bpjs_kes_deduction: float
+    bpjs_tk_deduction: float
+    other_deductions: float = 0.0
+    total_deductions: float
+    net_pay: float
+    earnings_detail: Optional[dict] = None
+    deductions_detail: Optional[dict] = None
+
+
+class PayrollPreviewResponse(BaseModel):
+    """Dry-run result - nothing is saved"""
+    total_employees: int
+    total_gross: float
+    total_deductions: float
+    total_net: float
+    payslips: List[PayslipPreview]
+
+
+class PayrollTaxBracket(BaseModel):
+    up_to: Optional[float] = None  # None = open-ended top bracket
+    rate: float
+
+
+class PayrollTaxRule(BaseModel):
+    type: str = "flat"  # flat or progressive
+    rate: float = 0.05  # flat only
+    annualize: bool = True
+    ptkp: dict = {}  # marital status (or "default") -> non-taxable income
+    brackets: List[PayrollTaxBracket] = []
+
+
+class PayrollAllowanceRule(BaseModel):
+    code: str
+    amount: float = 0.0  # fixed per month
+    rate: float = 0.0  # share of base salary
+    taxable: bool = True
+
+
+class PayrollContributionRule(BaseModel):
+    code: str
+    rate: float
+    cap: Optional[float] = None  # salary ceiling the rate applies to
+    basis: str = "base_salary"  # base_salary or gross_pay
+    field: str = "other_deductions"  # bpjs_kes_deduction, bpjs_tk_deduction, other_deductions
+
+
+class PayrollRules(BaseModel):
+    hours_per_month: float = 173
+    overtime_multiplier: float = 1.5
+    allowances: List[PayrollAllowanceRule] = []
+    tax: PayrollTaxRule = PayrollTaxRule()
+    contributions: List[PayrollContributionRule] = [
+        PayrollContributionRule(code="BPJS_KES", rate=0.01, field="bpjs_kes_deduction"),
+        PayrollContributionRule(code="BPJS_TK", rate=0.02, field="bpjs_tk_deduction")
+    ]
+
+
+class PayrollRulesResponse(PayrollRules):
+    version: int = 0
+    updated_at: Optional[datetime] = None
+
+
+class PayrollRunProgress(BaseModel):
+    run_id: UUID
+    status: str  # running, completed, failed
+    processed: int = 0
+    total: int = 0
+    percent: int = 0
+    error: Optional[str] = None
+
+
 # ==================== CAMERA ====================
 
 class CameraCreate(BaseModel):
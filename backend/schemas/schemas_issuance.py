@@ -19,3 +19,27 @@ class IssueRequest(BaseModel):
     quantity: float
     reference_id: str | None = None # e.g. Work Order ID
     project_id: str | None = None
+
+class PickLine(BaseModel):
+    product_id: uuid.UUID
+    quantity: float
+    batch_id: uuid.UUID | None = None # Pin to a batch, otherwise FEFO
+
+class PickListRequest(BaseModel):
+    lines: List[PickLine]
+    warehouse_id: uuid.UUID | None = None # Restrict candidate batches to one warehouse
+    reference_id: str | None = None # e.g. Work Order ID
+    project_id: str | None = None
+
+class PickAllocation(BaseModel):
+    line_index: int
+    product_id: uuid.UUID
+    batch_id: uuid.UUID
+    batch_number: str
+    location_id: uuid.UUID
+    quantity: float
+    remaining_qty: float
+
+class PickListResponse(BaseModel):
+    status: str
+    allocations: List[PickAllocation]
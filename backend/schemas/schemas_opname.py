@@ -54,6 +54,7 @@ class OpnameCreate(BaseModel):
     warehouse_id: uuid.UUID
     schedule_id: Optional[uuid.UUID] = None
     notes: Optional[str] = None
+    background: Optional[bool] = None  # None = auto (background for very large warehouses)
 
 class OpnameStartCounting(BaseModel):
     opname_id: uuid.UUID
@@ -68,6 +69,31 @@ class OpnameBulkCount(BaseModel):
     opname_id: uuid.UUID
     items: List[OpnameDetailUpdate]
 
+class CountSubmission(BaseModel):
+    detail_id: uuid.UUID
+    counted_qty: float
+    seq: int  # Client sequence number, monotonic per device
+    counted_at: datetime  # When the line was counted on the device; orders counts across devices
+    variance_reason: Optional[str] = None
+    variance_notes: Optional[str] = None
+
+class OpnameCountBatch(BaseModel):
+    opname_id: uuid.UUID
+    device_id: str  # Scanner / handheld identifier
+    items: List[CountSubmission]
+
+class OpnameCountBatchResult(BaseModel):
+    status: str
+    applied: int  # Lines written by this call
+    skipped: int  # Duplicates / retries / stale sequence numbers / conflicts
+    conflicts: List[uuid.UUID] = []  # Lines another device counted later; not written
+    acknowledged_seq: Optional[int] = None  # Highest seq the device can drop from its queue
+    total_items: int = 0
+    counted_items: int = 0
+    items_with_variance: int = 0
+    total_counted_value: float = 0
+    total_variance_value: float = 0
+
 class OpnameReview(BaseModel):
     opname_id: uuid.UUID
     notes: Optional[str] = None
@@ -151,6 +177,14 @@ class OpnameResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class SnapshotProgress(BaseModel):
+    opname_id: uuid.UUID
+    status: str  # running, completed, failed
+    processed_items: int = 0
+    total_items: int = 0
+    percent: int = 0
+    error: Optional[str] = None
+
 # ============ Report Schemas ============
 
 class VarianceItem(BaseModel):
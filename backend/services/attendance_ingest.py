@@ -0,0 +1,280 @@
+"""
+Attendance Ingest Service
+
+Bulk ingestion of buffered terminal events (check-ins / check-outs). A
+terminal that was offline can flush hundreds of events in one request:
+
+1. Employees are validated with one query.
+2. Events are folded per (employee, date): earliest check-in, latest
+   check-out. Existing attendance rows for all pairs are loaded with one
+   query, so replays and events already recorded by the single endpoints
+   are ignored instead of duplicated.
+3. New rows are inserted with one executemany INSERT and changed rows are
+   updated with one bulk UPDATE by primary key.
+4. Photos are uploaded to Cloudinary after the response by
+   upload_attendance_photos(), which writes the URLs back in one statement.
+"""
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import logging
+import uuid
+from datetime import date, datetime, timedelta
+from sqlalchemy import func, insert, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from models import models_hr
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+CHECK_IN = "check_in"
+CHECK_OUT = "check_out"
+# Concurrent Cloudinary uploads per ingest
+PHOTO_UPLOAD_CONCURRENCY = 4
+
+
+def _local_naive(ts: datetime) -> datetime:
+    """Attendance times are stored as naive local time (datetime.now())."""
+    return ts.astimezone().replace(tzinfo=None) if ts.tzinfo else ts
+
+
+def fold_events(events: List[Dict]) -> Dict[Tuple[uuid.UUID, date], Dict]:
+    """Reduce events to the earliest check-in and latest check-out per employee and day."""
+    folded: Dict[Tuple[uuid.UUID, date], Dict] = {}
+    for event in events:
+        ts = _local_naive(event["timestamp"])
+        entry = folded.setdefault((event["employee_id"], ts.date()), {CHECK_IN: None, CHECK_OUT: None})
+        current = entry[event["event_type"]]
+        if event["event_type"] == CHECK_IN:
+            if current is None or ts < current["timestamp"]:
+                entry[CHECK_IN] = {**event, "timestamp": ts}
+        elif current is None or ts > current["timestamp"]:
+            entry[CHECK_OUT] = {**event, "timestamp": ts}
+    return folded
+
+
+def _late_minutes(day: date, check_in: datetime, shift) -> int:
+    if not shift:
+        return 0
+    shift_start = datetime.combine(day, shift.start_time)
+    if check_in > shift_start + timedelta(minutes=shift.late_tolerance_minutes or 0):
+        return int((check_in - shift_start).total_seconds() / 60)
+    return 0
+
+
+def _overtime_minutes(day: date, check_out: datetime, shift) -> int:
+    if not shift:
+        return 0
+    shift_end = datetime.combine(day, shift.end_time)
+    return int((check_out - shift_end).total_seconds() / 60) if check_out > shift_end else 0
+
+
+async def ingest_attendance_events(
+    db: AsyncSession,
+    tenant_id: uuid.UUID,
+    device_id: str,
+    events: List[Dict]
+) -> Dict:
+    """
+    Upsert attendance for a batch of terminal events. Does not commit.
+
+    Args:
+        events: [{"employee_id", "event_type", "timestamp", "method", "location", "face_image_base64"}]
+
+    Returns:
+        Dict with inserted, updated, ignored, rejected and photo_jobs
+        (pass photo_jobs to upload_attendance_photos after the commit).
+    """
+    attendance = models_hr.Attendance
+    employee_ids = {e["employee_id"] for e in events}
+
+    # 1. Employees of this tenant
+    known = set()
+    if employee_ids:
+        result = await db.execute(
+            select(models_hr.Employee.id).where(
+                models_hr.Employee.tenant_id == tenant_id,
+                models_hr.Employee.id.in_(employee_ids)
+            )
+        )
+        known = set(result.scalars().all())
+
+    rejected = []
+    valid = []
+    for i, event in enumerate(events):
+        if event["event_type"] not in (CHECK_IN, CHECK_OUT):
+            rejected.append({"index": i, "reason": f"Unknown event type {event['event_type']}"})
+        elif event["employee_id"] not in known:
+            rejected.append({"index": i, "reason": "Employee not found"})
+        else:
+            valid.append(event)
+
+    folded = fold_events(valid)
+    if not folded:
+        return {"inserted": 0, "updated": 0, "ignored": len(valid), "rejected": rejected, "photo_jobs": []}
+
+    # Serialize ingests of one tenant so two terminals never insert the same day twice
+    await db.execute(select(func.pg_advisory_xact_lock(func.hashtext(f"attendance:{tenant_id}"))))
+
+    # 2. Existing rows and scheduled shifts for every (employee, date) pair
+    pairs = list(folded.keys())
+    result = await db.execute(
+        select(attendance).where(
+            attendance.tenant_id == tenant_id,
+            tuple_(attendance.employee_id, attendance.date).in_(pairs)
+        )
+    )
+    existing = {(row.employee_id, row.date): row for row in result.scalars().all()}
+
+    result = await db.execute(
+        select(models_hr.EmployeeSchedule.employee_id, models_hr.EmployeeSchedule.date, models_hr.Shift)
+        .join(models_hr.Shift, models_hr.EmployeeSchedule.shift_id == models_hr.Shift.id)
+        .where(tuple_(models_hr.EmployeeSchedule.employee_id, models_hr.EmployeeSchedule.date).in_(pairs))
+    )
+    scheduled = {(row.employee_id, row.date): row.Shift for row in result.all()}
+
+    shift_ids = {row.shift_id for row in existing.values() if row.shift_id} - {s.id for s in scheduled.values()}
+    shifts = {s.id: s for s in scheduled.values()}
+    if shift_ids:
+        result = await db.execute(select(models_hr.Shift).where(models_hr.Shift.id.in_(shift_ids)))
+        shifts.update({s.id: s for s in result.scalars().all()})
+
+    # 3. Merge in memory
+    inserts, updates, photo_jobs = [], [], []
+    applied = 0
+    now = datetime.utcnow()
+    for (employee_id, day), entry in folded.items():
+        row = existing.get((employee_id, day))
+        check_in_event, check_out_event = entry[CHECK_IN], entry[CHECK_OUT]
+        check_in = row.check_in if row else None
+        check_out = row.check_out if row else None
+        scheduled_shift = scheduled.get((employee_id, day))
+        shift_id = row.shift_id if row and row.shift_id else (scheduled_shift.id if scheduled_shift else None)
+        shift = shifts.get(shift_id)
+
+        values = {}
+        if check_in_event and (check_in is None or check_in_event["timestamp"] < check_in):
+            check_in = check_in_event["timestamp"]
+            late = _late_minutes(day, check_in, shift)
+            values.update(
+                check_in=check_in,
+                check_in_method=models_hr.CheckInMethod(check_in_event["method"]),
+                check_in_location=check_in_event.get("location"),
+                check_in_device=device_id,
+                late_minutes=late,
+                status=models_hr.AttendanceStatus.LATE if late > 0 else models_hr.AttendanceStatus.PRESENT
+            )
+        else:
+            check_in_event = None
+        if check_out_event and check_in and check_out_event["timestamp"] > check_in \
+                and (check_out is None or check_out_event["timestamp"] > check_out):
+            check_out = check_out_event["timestamp"]
+            values.update(
+                check_out=check_out,
+                check_out_method=models_hr.CheckInMethod(check_out_event["method"]),
+                check_out_location=check_out_event.get("location"),
+                check_out_device=device_id,
+                overtime_minutes=_overtime_minutes(day, check_out, shift)
+            )
+        else:
+            check_out_event = None
+        if not values:
+            continue
+        applied += bool(check_in_event) + bool(check_out_event)
+        if check_in and check_out:
+            values["work_hours"] = round((check_out - check_in).total_seconds() / 3600, 2)
+
+        if row:
+            attendance_id = row.id
+            updates.append({"id": attendance_id, "updated_at": now, **values})
+        else:
+            attendance_id = uuid.uuid4()
+            inserts.append({
+                "id": attendance_id,
+                "tenant_id": tenant_id,
+                "employee_id": employee_id,
+                "date": day,
+                "shift_id": shift_id,
+                "status": models_hr.AttendanceStatus.ABSENT,
+                "late_minutes": 0,
+                "early_leave_minutes": 0,
+                "overtime_minutes": 0,
+                "work_hours": 0.0,
+                "created_at": now,
+                "updated_at": now,
+                **values
+            })
+
+        for kind, event in ((CHECK_IN, check_in_event), (CHECK_OUT, check_out_event)):
+            if event and event.get("face_image_base64"):
+                photo_jobs.append({
+                    "attendance_id": attendance_id,
+                    "kind": kind,
+                    "employee_id": employee_id,
+                    "timestamp": event["timestamp"],
+                    "image_base64": event["face_image_base64"]
+                })
+
+    # 4. Bulk INSERT of new days, bulk UPDATE by primary key of changed ones
+    if inserts:
+        await db.execute(insert(attendance), inserts)
+    if updates:
+        # executemany needs the same columns in every row
+        for group in _group_by_keys(updates).values():
+            await db.execute(update(attendance), group)
+
+    return {
+        "inserted": len(inserts),
+        "updated": len(updates),
+        "ignored": len(valid) - applied,
+        "rejected": rejected,
+        "photo_jobs": photo_jobs
+    }
+
+
+def _group_by_keys(rows: List[Dict]) -> Dict[frozenset, List[Dict]]:
+    groups: Dict[frozenset, List[Dict]] = {}
+    for row in rows:
+        groups.setdefault(frozenset(row.keys()), []).append(row)
+    return groups
+
+
+def _upload_photo(job: Dict) -> Optional[str]:
+    import cloudinary.uploader
+    upload_result = cloudinary.uploader.upload(
+        f"data:image/jpeg;base64,{job['image_base64']}",
+        folder=f"hr/attendance/{job['timestamp'].date().isoformat()}",
+        public_id=f"{job['kind'].replace('_', '')}_{job['employee_id']}_{job['timestamp'].strftime('%H%M%S')}"
+    )
+    return upload_result.get("secure_url")
+
+
+async def upload_attendance_photos(photo_jobs: List[Dict]):
+    """
+    Background task: upload queued photos with bounded concurrency, then
+    store all URLs with one bulk UPDATE. Failed uploads are logged and skipped.
+    """
+    if not photo_jobs:
+        return
+    semaphore = asyncio.Semaphore(PHOTO_UPLOAD_CONCURRENCY)
+
+    async def upload(job):
+        async with semaphore:
+            try:
+                return job, await asyncio.to_thread(_upload_photo, job)
+            except Exception as e:
+                logger.error(f"Attendance photo upload failed for {job['attendance_id']}: {e}")
+                return job, None
+
+    results = await asyncio.gather(*(upload(job) for job in photo_jobs))
+    rows = [
+        {"id": job["attendance_id"], f"{job['kind']}_photo_url": url}
+        for job, url in results if url
+    ]
+    if not rows:
+        return
+
+    async with SessionLocal() as db:
+        for group in _group_by_keys(rows).values():
+            await db.execute(update(models_hr.Attendance), group)
+        await db.commit()
@@ -0,0 +1,138 @@
+"""
+Batch Stock Service
+
+Atomic quantity changes on InventoryBatch without pessimistic locking.
+
+Reading quantity_on_hand into Python, checking it and writing it back races
+under concurrent pickers (two requests both see 10, both take 8). Every change
+here is instead one conditional UPDATE ... RETURNING:
+
+    UPDATE inventory_batches
+       SET quantity_on_hand = quantity_on_hand + :delta, version = version + 1
+     WHERE id = :id AND quantity_on_hand + :delta >= 0
+    RETURNING ...
+
+Postgres re-checks the WHERE clause after a concurrent writer commits, so the
+check and the write can never interleave and a batch can never go negative.
+ORM read-modify-write code elsewhere is covered by the version column
+(version_id_col), which raises StaleDataError instead of losing an update;
+run_with_retry() replays such units of work.
+"""
+from typing import Awaitable, Callable, Optional, TypeVar
+import asyncio
+import random
+import uuid
+from sqlalchemy import update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm.exc import StaleDataError
+import models
+
+T = TypeVar("T")
+
+# serialization_failure, deadlock_detected
+RETRYABLE_SQLSTATES = {"40001", "40P01"}
+
+
+class BatchNotFoundError(LookupError):
+    """Raised when the batch does not exist (or belongs to another tenant)."""
+
+
+class InsufficientStockError(ValueError):
+    """Raised when a decrement would take the batch below zero."""
+
+
+async def change_batch_quantity(
+    db: AsyncSession,
+    batch_id: uuid.UUID,
+    delta: float,
+    product_id: Optional[uuid.UUID] = None,
+    tenant_id: Optional[uuid.UUID] = None
+):
+    """
+    Atomically add delta (negative to deduct) to a batch.
+
+    Does not commit. Returns the updated row
+    (id, tenant_id, product_id, location_id, batch_number, quantity_on_hand, version).
+
+    Raises:
+        BatchNotFoundError, InsufficientStockError, ValueError (product mismatch)
+    """
+    batch = models.InventoryBatch
+    conditions = [batch.id == batch_id, batch.quantity_on_hand + delta >= 0]
+    if product_id:
+        conditions.append(batch.product_id == product_id)
+    if tenant_id:
+        conditions.append(batch.tenant_id == tenant_id)
+
+    stmt = update(batch)\
+        .where(*conditions)\
+        .values(
+            quantity_on_hand=batch.quantity_on_hand + delta,
+            version=batch.version + 1
+        )\
+        .returning(
+            batch.id, batch.tenant_id, batch.product_id, batch.location_id,
+            batch.batch_number, batch.quantity_on_hand, batch.version
+        )\
+        .execution_options(synchronize_session=False)
+    row = (await db.execute(stmt)).one_or_none()
+    if row is not None:
+        return row
+
+    # Nothing matched - work out why for a useful error
+    query = select(batch.product_id, batch.tenant_id, batch.quantity_on_hand).where(batch.id == batch_id)
+    current = (await db.execute(query)).one_or_none()
+    if current is None or (tenant_id and current.tenant_id != tenant_id):
+        raise BatchNotFoundError("Batch not found")
+    if product_id and current.product_id != product_id:
+        raise ValueError("Product mismatch")
+    raise InsufficientStockError("Insufficient quantity in batch")
+
+
+async def decrement_batch(
+    db: AsyncSession,
+    batch_id: uuid.UUID,
+    quantity: float,
+    product_id: Optional[uuid.UUID] = None,
+    tenant_id: Optional[uuid.UUID] = None
+):
+    """Atomically deduct quantity from a batch - see change_batch_quantity."""
+    if quantity <= 0:
+        raise ValueError("Quantity must be greater than zero")
+    return await change_batch_quantity(db, batch_id, -quantity, product_id, tenant_id)
+
+
+def is_retryable(exc: Exception) -> bool:
+    """True for optimistic-lock misses, serialization failures and deadlocks."""
+    if isinstance(exc, StaleDataError):
+        return True
+    if isinstance(exc, DBAPIError):
+        orig = exc.orig
+        code = getattr(orig, "sqlstate", None) or getattr(orig, "pgcode", None)
+        return code in RETRYABLE_SQLSTATES
+    return False
+
+
+async def run_with_retry(
+    db: AsyncSession,
+    operation: Callable[[], Awaitable[T]],
+    attempts: int = 3,
+    base_delay: float = 0.02
+) -> T:
+    """
+    Run a unit of work (including its commit), replaying it on conflicts.
+
+    The session is rolled back between attempts and the wait grows
+    exponentially with jitter so a burst of conflicting requests spreads out.
+    Business errors (InsufficientStockError, ...) are never retried.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return await operation()
+        except (StaleDataError, DBAPIError) as e:
+            await db.rollback()
+            if attempt == attempts or not is_retryable(e):
+                raise
+            await asyncio.sleep(base_delay * (2 ** (attempt - 1)) * (1 + random.random()))
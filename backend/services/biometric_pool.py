@@ -0,0 +1,167 @@
+"""
+Biometric Worker Pool
+
+Face decoding and encoding (base64 -> cv2.imdecode -> face_encodings) takes
+hundreds of milliseconds of pure CPU. Running it inside an async handler
+stalls every other request on the worker during the shift-change spike, so it
+runs here in a bounded process pool instead:
+
+- workers are spawned once and preload cv2 / face_recognition,
+- images are downscaled before detection (HOG cost grows with pixel count),
+- at most FACE_POOL_MAX_PENDING jobs may be queued or running; beyond that
+  callers get BiometricBusyError immediately (HTTP 503) instead of piling up,
+- each job has a timeout (BiometricTimeoutError, HTTP 504),
+- a worker that dies (dlib crash, OOM kill) breaks the whole executor; the
+  broken pool is dropped and a new one started by the next request, the
+  affected callers get BiometricBusyError.
+
+This module must stay importable with the standard library only: spawned
+workers re-import it to find the job functions.
+"""
+from typing import List, Optional
+import asyncio
+import importlib.util
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+FACE_POOL_WORKERS = int(os.getenv("FACE_POOL_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+FACE_POOL_MAX_PENDING = int(os.getenv("FACE_POOL_MAX_PENDING", FACE_POOL_WORKERS * 8))
+FACE_ENCODE_TIMEOUT = float(os.getenv("FACE_ENCODE_TIMEOUT", "5"))
+# Longest image side fed to the detector; gate cameras send far more than needed
+FACE_MAX_IMAGE_SIDE = int(os.getenv("FACE_MAX_IMAGE_SIDE", "640"))
+
+
+class BiometricBusyError(Exception):
+    """Raised when the pool already has FACE_POOL_MAX_PENDING jobs in flight."""
+
+
+class BiometricTimeoutError(Exception):
+    """Raised when a job does not finish within FACE_ENCODE_TIMEOUT."""
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pending = 0
+_available: Optional[bool] = None
+
+
+def face_recognition_available() -> bool:
+    """Whether the face extras are installed, without loading them into the API process."""
+    global _available
+    if _available is None:
+        _available = all(
+            importlib.util.find_spec(name) is not None
+            for name in ("face_recognition", "cv2", "numpy")
+        )
+    return _available
+
+
+# ---------- worker side ----------
+
+def _init_worker():
+    # Load dlib models once per worker instead of on the first check-in
+    import cv2  # noqa: F401
+    import face_recognition  # noqa: F401
+
+
+def _encode_face_job(image_base64: str, max_side: int) -> Optional[List[float]]:
+    """Decode, downscale and encode the first face in an image (runs in a worker)."""
+    import base64
+    import binascii
+    import cv2
+    import numpy as np
+    import face_recognition
+
+    if "," in image_base64[:100]:
+        image_base64 = image_base64.split(",", 1)[1]  # strip data URL prefix
+    try:
+        image_data = base64.b64decode(image_base64)
+    except (binascii.Error, ValueError):
+        raise ValueError("Invalid base64 image")
+
+    image = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Could not decode image")
+
+    height, width = image.shape[:2]
+    scale = max_side / max(height, width)
+    if scale < 1:
+        image = cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+    rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    encodings = face_recognition.face_encodings(rgb_image)
+    if not encodings:
+        return None
+    return encodings[0].tolist()
+
+
+# ---------- API side ----------
+
+def get_biometric_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=FACE_POOL_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker
+        )
+        logger.info(f"Biometric pool started with {FACE_POOL_WORKERS} workers")
+    return _pool
+
+
+def _drop_broken_pool(pool: ProcessPoolExecutor):
+    global _pool
+    if _pool is pool:
+        logger.error("Biometric pool broken (worker died), restarting on next request")
+        pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _release(_future):
+    global _pending
+    _pending -= 1
+
+
+async def encode_face(image_base64: str, timeout: Optional[float] = None) -> Optional[List[float]]:
+    """
+    Encode the first face in a base64 image off the event loop.
+
+    Returns:
+        The 128-d encoding as a list, or None when no face is detected.
+
+    Raises:
+        BiometricBusyError, BiometricTimeoutError, ValueError (bad image)
+    """
+    global _pending
+    if _pending >= FACE_POOL_MAX_PENDING:
+        raise BiometricBusyError("Face recognition is busy, please retry")
+
+    loop = asyncio.get_running_loop()
+    pool = get_biometric_pool()
+    try:
+        future = loop.run_in_executor(pool, _encode_face_job, image_base64, FACE_MAX_IMAGE_SIDE)
+    except BrokenProcessPool:
+        _drop_broken_pool(pool)
+        raise BiometricBusyError("Face recognition is restarting, please retry")
+    # The slot is freed when the worker really finishes, even after a timeout
+    _pending += 1
+    future.add_done_callback(_release)
+
+    try:
+        return await asyncio.wait_for(asyncio.shield(future), timeout or FACE_ENCODE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise BiometricTimeoutError("Face recognition timed out")
+    except BrokenProcessPool:
+        _drop_broken_pool(pool)
+        raise BiometricBusyError("Face recognition is restarting, please retry")
+
+
+def shutdown_biometric_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
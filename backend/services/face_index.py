@@ -0,0 +1,193 @@
+"""
+Face Index Service
+
+In-memory, per-tenant matrix of employee face encodings for attendance.
+
+Instead of loading every employee and comparing encodings one by one, each
+tenant gets an (N x 128) float32 matrix built once from the database. A
+check-in is then one vectorized distance computation:
+
+    distances = ||matrix - probe||  ->  top-k smallest under the threshold
+
+Encodings are stored as raw float32 bytes (Employee.face_embedding, 512
+bytes) rather than JSON text. register-face updates the matrix in place and
+bumps a per-tenant version in Redis so other API workers rebuild their copy
+on their next match.
+"""
+from typing import Dict, List, Optional
+import asyncio
+import json
+import logging
+import time
+import uuid
+from sqlalchemy import and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from models import models_hr
+from connections.redis_utils import get_redis
+
+try:
+    import numpy as np
+except ImportError:  # face recognition extras not installed
+    np = None
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_SIZE = 128
+# Same tolerance face_recognition.compare_faces used
+MATCH_THRESHOLD = 0.6
+# Rebuild even without a version bump (e.g. employee terminated)
+INDEX_MAX_AGE = 600
+
+
+def _version_key(tenant_id: uuid.UUID) -> str:
+    return f"face_index:version:{tenant_id}"
+
+
+def encode_embedding(encoding) -> bytes:
+    """Pack an encoding into the compact binary column format (little-endian float32)."""
+    return np.asarray(encoding, dtype="<f4").tobytes()
+
+
+def decode_embedding(data: bytes):
+    return np.frombuffer(data, dtype="<f4").astype(np.float32)
+
+
+def _legacy_embedding(face_encoding: Optional[str]):
+    """Parse the old JSON text column; simplified-mode placeholders are ignored."""
+    if not face_encoding or not face_encoding.startswith("["):
+        return None
+    try:
+        vector = np.asarray(json.loads(face_encoding), dtype=np.float32)
+    except ValueError:
+        return None
+    return vector if vector.shape == (EMBEDDING_SIZE,) else None
+
+
+class FaceIndex:
+    """Encodings of one tenant's active employees as a single matrix."""
+
+    def __init__(self, employees: List[Dict], embeddings, version: Optional[int] = None):
+        self.employees = employees
+        self.matrix = embeddings.reshape(-1, EMBEDDING_SIZE) if len(employees) else np.empty((0, EMBEDDING_SIZE), np.float32)
+        self.positions = {emp["id"]: i for i, emp in enumerate(employees)}
+        self.version = version
+        self.built_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.employees)
+
+    def match(self, encoding, top_k: int = 1, threshold: float = MATCH_THRESHOLD) -> List[Dict]:
+        """Return up to top_k employees closest to the encoding, nearest first."""
+        if not len(self.employees):
+            return []
+        probe = np.asarray(encoding, dtype=np.float32)
+        distances = np.linalg.norm(self.matrix - probe, axis=1)
+
+        k = min(top_k, len(distances))
+        nearest = np.argpartition(distances, k - 1)[:k]
+        nearest = nearest[np.argsort(distances[nearest])]
+        return [
+            {**self.employees[i], "distance": float(distances[i])}
+            for i in nearest if distances[i] <= threshold
+        ]
+
+    def upsert(self, employee: Dict, encoding):
+        vector = np.asarray(encoding, dtype=np.float32).reshape(1, EMBEDDING_SIZE)
+        position = self.positions.get(employee["id"])
+        if position is not None:
+            self.matrix[position] = vector
+            self.employees[position] = employee
+        else:
+            self.positions[employee["id"]] = len(self.employees)
+            self.employees.append(employee)
+            self.matrix = np.vstack([self.matrix, vector])
+
+
+_indexes: Dict[uuid.UUID, FaceIndex] = {}
+_build_locks: Dict[uuid.UUID, asyncio.Lock] = {}
+
+
+async def _shared_version(tenant_id: uuid.UUID) -> Optional[int]:
+    try:
+        r = await get_redis()
+        value = await r.get(_version_key(tenant_id))
+        return int(value) if value else 0
+    except Exception as e:
+        logger.error(f"Face index version check failed: {e}")
+        return None
+
+
+async def _bump_version(tenant_id: uuid.UUID) -> Optional[int]:
+    try:
+        r = await get_redis()
+        return await r.incr(_version_key(tenant_id))
+    except Exception as e:
+        logger.error(f"Face index version bump failed: {e}")
+        return None
+
+
+async def build_face_index(db: AsyncSession, tenant_id: uuid.UUID, version: Optional[int] = None) -> FaceIndex:
+    """Load every active employee with a registered face into one matrix."""
+    employee = models_hr.Employee
+    result = await db.execute(
+        select(
+            employee.id, employee.first_name, employee.last_name,
+            employee.face_embedding, employee.face_encoding
+        ).where(and_(
+            employee.tenant_id == tenant_id,
+            employee.status == models_hr.EmployeeStatus.ACTIVE,
+            or_(employee.face_embedding != None, employee.face_encoding != None)
+        ))
+    )
+
+    employees = []
+    vectors = []
+    for row in result.all():
+        if row.face_embedding is not None:
+            vector = decode_embedding(row.face_embedding)
+        else:
+            vector = _legacy_embedding(row.face_encoding)
+        if vector is None or vector.shape != (EMBEDDING_SIZE,):
+            continue
+        employees.append({"id": row.id, "first_name": row.first_name, "last_name": row.last_name})
+        vectors.append(vector)
+
+    embeddings = np.stack(vectors) if vectors else np.empty((0, EMBEDDING_SIZE), np.float32)
+    return FaceIndex(employees, embeddings, version)
+
+
+async def get_face_index(db: AsyncSession, tenant_id: uuid.UUID) -> FaceIndex:
+    """Return the tenant's index, rebuilding it if another worker changed it or it is too old."""
+    version = await _shared_version(tenant_id)
+    index = _indexes.get(tenant_id)
+    if index is not None and index.version == version and time.monotonic() - index.built_at < INDEX_MAX_AGE:
+        return index
+
+    lock = _build_locks.setdefault(tenant_id, asyncio.Lock())
+    async with lock:
+        index = _indexes.get(tenant_id)
+        if index is None or index.version != version or time.monotonic() - index.built_at >= INDEX_MAX_AGE:
+            index = await build_face_index(db, tenant_id, version)
+            _indexes[tenant_id] = index
+    return index
+
+
+async def add_face(tenant_id: uuid.UUID, employee: Dict, encoding):
+    """Put a newly registered encoding into the local index and tell other workers."""
+    version = await _bump_version(tenant_id)
+    index = _indexes.get(tenant_id)
+    if index is None:
+        return
+    if version is None or index.version is None or version != index.version + 1:
+        # Missed a change from another worker - rebuild instead of patching
+        _indexes.pop(tenant_id, None)
+        return
+    index.upsert(employee, encoding)
+    index.version = version
+
+
+async def invalidate_face_index(tenant_id: uuid.UUID):
+    """Drop the index on every worker (employee status change / removal); rebuilt on the next match."""
+    _indexes.pop(tenant_id, None)
+    await _bump_version(tenant_id)
@@ -0,0 +1,222 @@
+"""
+FEFO Allocation Service
+
+Allocates a whole pick list (many products and quantities) against inventory
+batches in First-Expired-First-Out order:
+
+1. Candidate batches of open (FEFO) lines are locked with ONE
+   SELECT ... FOR UPDATE SKIP LOCKED, so concurrent pickers never queue on
+   each other's rows - a batch held by another picker is simply not offered.
+   Batches pinned by a line are locked first with a plain FOR UPDATE: the
+   line can use no other batch, so it waits for the other picker instead of
+   failing with a shortage.
+2. Quantities are split across batches in memory.
+3. All deductions are applied with ONE UPDATE statement and the stock
+   movements are bulk-inserted.
+
+The caller owns the transaction: commit, then publish_movements().
+"""
+from typing import Dict, List, Optional
+import uuid
+from sqlalchemy import update, case
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+import models
+from services.inventory_ledger import record_movements
+
+# Quantities are floats - ignore rounding dust when comparing
+EPSILON = 1e-9
+
+
+class AllocationError(Exception):
+    """Raised when a pick list cannot be fully allocated."""
+
+    def __init__(self, message: str, shortages: Optional[List[Dict]] = None):
+        super().__init__(message)
+        self.shortages = shortages or []
+
+
+async def lock_candidate_batches(
+    db: AsyncSession,
+    lines: List[Dict],
+    tenant_id: Optional[uuid.UUID] = None,
+    warehouse_id: Optional[uuid.UUID] = None
+) -> List[models.InventoryBatch]:
+    """
+    Lock every batch that could serve the pick list, in FEFO order per product.
+
+    Lines pinned to a batch (batch_id set) only lock that batch; other lines
+    lock all in-stock batches of their product.
+    """
+    product_ids = {l["product_id"] for l in lines if not l.get("batch_id")}
+    batch_ids = {l["batch_id"] for l in lines if l.get("batch_id")}
+
+    query = select(models.InventoryBatch).where(models.InventoryBatch.quantity_on_hand > 0)
+    if tenant_id:
+        query = query.where(models.InventoryBatch.tenant_id == tenant_id)
+    if warehouse_id:
+        query = query.where(
+            models.InventoryBatch.location_id.in_(
+                select(models.Location.id).where(models.Location.warehouse_id == warehouse_id)
+            )
+        )
+
+    batches = []
+    if batch_ids:
+        # Always locked in id order so two pickers pinning the same batches cannot deadlock
+        pinned = query.where(models.InventoryBatch.id.in_(batch_ids))\
+            .order_by(models.InventoryBatch.id)\
+            .with_for_update()\
+            .execution_options(populate_existing=True)
+        batches += (await db.execute(pinned)).scalars().all()
+    if product_ids:
+        fefo = query.where(models.InventoryBatch.product_id.in_(product_ids))\
+            .order_by(
+                models.InventoryBatch.product_id,
+                models.InventoryBatch.expiration_date.asc().nullslast(),
+                models.InventoryBatch.id
+            ).with_for_update(skip_locked=True)\
+            .execution_options(populate_existing=True)
+        # A pinned batch of a FEFO product comes back again (we hold its lock)
+        locked = {b.id for b in batches}
+        batches += [b for b in (await db.execute(fefo)).scalars().all() if b.id not in locked]
+    # FEFO order per product across both queries
+    batches.sort(key=lambda b: (b.expiration_date is None, b.expiration_date, b.id))
+    return batches
+
+
+def plan_allocations(lines: List[Dict], batches: List[models.InventoryBatch]):
+    """
+    Split each line across the locked batches (pure, no I/O).
+
+    Pinned lines are served first so FEFO lines never consume a batch that a
+    pinned line asked for explicitly.
+
+    Returns:
+        (allocations, shortages) - allocations are dicts with line_index,
+        tenant_id, product_id, batch_id, batch_number, location_id, quantity.
+    """
+    remaining = {b.id: b.quantity_on_hand for b in batches}
+    by_id = {b.id: b for b in batches}
+    by_product: Dict[uuid.UUID, List[models.InventoryBatch]] = {}
+    for b in batches:
+        by_product.setdefault(b.product_id, []).append(b)
+
+    allocations = []
+    shortages = []
+
+    order = sorted(range(len(lines)), key=lambda i: 0 if lines[i].get("batch_id") else 1)
+    for index in order:
+        line = lines[index]
+        needed = line["quantity"]
+
+        if line.get("batch_id"):
+            batch = by_id.get(line["batch_id"])
+            candidates = [batch] if batch and batch.product_id == line["product_id"] else []
+        else:
+            candidates = by_product.get(line["product_id"], [])
+
+        for batch in candidates:
+            if needed <= EPSILON:
+                break
+            available = remaining[batch.id]
+            if available <= EPSILON:
+                continue
+            take = min(available, needed)
+            remaining[batch.id] = available - take
+            needed -= take
+            allocations.append({
+                "line_index": index,
+                "tenant_id": batch.tenant_id,
+                "product_id": batch.product_id,
+                "batch_id": batch.id,
+                "batch_number": batch.batch_number,
+                "location_id": batch.location_id,
+                "quantity": take
+            })
+
+        if needed > EPSILON:
+            shortages.append({
+                "line_index": index,
+                "product_id": line["product_id"],
+                "batch_id": line.get("batch_id"),
+                "requested": line["quantity"],
+                "short_by": needed
+            })
+
+    return allocations, shortages
+
+
+async def apply_allocations(db: AsyncSession, allocations: List[Dict]) -> Dict[uuid.UUID, float]:
+    """Deduct all allocations with a single UPDATE. Returns remaining qty per batch."""
+    deductions: Dict[uuid.UUID, float] = {}
+    for a in allocations:
+        deductions[a["batch_id"]] = deductions.get(a["batch_id"], 0) + a["quantity"]
+    if not deductions:
+        return {}
+
+    stmt = update(models.InventoryBatch)\
+        .where(models.InventoryBatch.id.in_(deductions.keys()))\
+        .values(
+            quantity_on_hand=models.InventoryBatch.quantity_on_hand
+            - case(deductions, value=models.InventoryBatch.id),
+            version=models.InventoryBatch.version + 1
+        )\
+        .returning(models.InventoryBatch.id, models.InventoryBatch.quantity_on_hand)\
+        .execution_options(synchronize_session=False)
+    result = await db.execute(stmt)
+    return {row[0]: row[1] for row in result.all()}
+
+
+async def allocate_pick_list(
+    db: AsyncSession,
+    lines: List[Dict],
+    movement_type: models.MovementType,
+    tenant_id: Optional[uuid.UUID] = None,
+    warehouse_id: Optional[uuid.UUID] = None,
+    reference_id: Optional[str] = None,
+    project_id: Optional[str] = None,
+    notes: Optional[str] = None
+) -> Dict:
+    """
+    Allocate, deduct and record a pick list in the caller's transaction.
+
+    Args:
+        lines: [{"product_id", "quantity", "batch_id" (optional)}]
+
+    Raises:
+        AllocationError: if any line cannot be fully served. Nothing is
+        written in that case; the caller should roll back to release locks.
+
+    Returns:
+        Dict with allocations (each carrying remaining_qty) and movements.
+    """
+    for line in lines:
+        if line["quantity"] <= 0:
+            raise AllocationError("Pick quantity must be greater than zero")
+
+    batches = await lock_candidate_batches(db, lines, tenant_id, warehouse_id)
+    allocations, shortages = plan_allocations(lines, batches)
+    if shortages:
+        raise AllocationError("Insufficient stock for pick list", shortages)
+
+    remaining = await apply_allocations(db, allocations)
+    for a in allocations:
+        a["remaining_qty"] = remaining.get(a["batch_id"], 0)
+
+    movements = await record_movements(db, [
+        {
+            "product_id": a["product_id"],
+            "location_id": a["location_id"],
+            "batch_id": a["batch_id"],
+            "quantity_change": -a["quantity"],
+            "movement_type": movement_type,
+            "reference_id": reference_id,
+            "project_id": project_id,
+            "notes": notes,
+            "tenant_id": a["tenant_id"]
+        }
+        for a in allocations
+    ])
+
+    return {"allocations": allocations, "movements": movements}
@@ -0,0 +1,118 @@
+"""
+Fleet Booking Conflicts
+
+Overlap checks for vehicle bookings are backed by Postgres ranges instead of
+scanning bookings:
+
+- vehicle_bookings.period is a generated tsrange(start_datetime,
+  end_datetime, '[)') column.
+- Two GiST exclusion constraints (btree_gist) forbid overlapping periods of
+  ACTIVE bookings (PENDING, APPROVED, IN_USE) for the same vehicle and for
+  the same driver. They are the guarantee under concurrency: of two
+  simultaneous conflicting writes, one fails with an IntegrityError.
+- find_conflicts() runs first so the API can name the conflicting bookings;
+  available_vehicles() returns the free vehicles of a window with one
+  NOT EXISTS query. Both use `period && window`, served by the same GiST
+  indexes.
+
+Back-to-back bookings (one ends when the next starts) do not overlap.
+"""
+from typing import Dict, List, Optional
+import uuid
+from datetime import datetime
+from sqlalchemy import and_, exists, func, not_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+import models
+from models.models_fleet import ACTIVE_BOOKING_STATUSES
+
+EXCLUSION_CONSTRAINTS = {
+    "excl_vehicle_bookings_vehicle_period": "vehicle",
+    "excl_vehicle_bookings_driver_period": "driver"
+}
+# Vehicles that cannot be booked whatever their schedule
+UNAVAILABLE_VEHICLE_STATUSES = ['MAINTENANCE', 'BROKEN']
+
+
+def booking_window(start: datetime, end: datetime):
+    return func.tsrange(start, end, '[)')
+
+
+def overlaps(start: datetime, end: datetime):
+    """Active bookings whose period overlaps [start, end)."""
+    booking = models.VehicleBooking
+    return and_(
+        booking.status.in_(ACTIVE_BOOKING_STATUSES),
+        booking.period.op('&&')(booking_window(start, end))
+    )
+
+
+async def find_conflicts(
+    db: AsyncSession,
+    tenant_id: uuid.UUID,
+    start: datetime,
+    end: datetime,
+    vehicle_id: Optional[uuid.UUID] = None,
+    driver_id: Optional[uuid.UUID] = None,
+    exclude_booking_id: Optional[uuid.UUID] = None
+) -> List:
+    """Active bookings of the vehicle or the driver overlapping [start, end), earliest first."""
+    booking = models.VehicleBooking
+    owners = []
+    if vehicle_id:
+        owners.append(booking.vehicle_id == vehicle_id)
+    if driver_id:
+        owners.append(booking.driver_id == driver_id)
+    if not owners:
+        return []
+    query = select(booking).where(booking.tenant_id == tenant_id, or_(*owners), overlaps(start, end))
+    if exclude_booking_id:
+        query = query.where(booking.id != exclude_booking_id)
+    result = await db.execute(query.order_by(booking.start_datetime))
+    return result.scalars().all()
+
+
+def conflict_detail(conflicts: List, vehicle_id: Optional[uuid.UUID], driver_id: Optional[uuid.UUID]) -> Dict:
+    """HTTP 409 payload naming the conflicting bookings."""
+    return {
+        "message": "Booking overlaps existing bookings",
+        "conflicts": [
+            {
+                "booking_id": str(b.id),
+                "code": b.code,
+                "status": b.status.value if hasattr(b.status, "value") else b.status,
+                "start_datetime": b.start_datetime.isoformat(),
+                "end_datetime": b.end_datetime.isoformat(),
+                "vehicle": vehicle_id is not None and b.vehicle_id == vehicle_id,
+                "driver": driver_id is not None and b.driver_id == driver_id
+            }
+            for b in conflicts
+        ]
+    }
+
+
+def exclusion_violation(error: IntegrityError) -> Optional[str]:
+    """'vehicle' or 'driver' when the error is one of the overlap constraints, else None."""
+    message = str(error.orig)
+    for name, owner in EXCLUSION_CONSTRAINTS.items():
+        if name in message:
+            return owner
+    return None
+
+
+async def available_vehicles(db: AsyncSession, tenant_id: uuid.UUID, start: datetime, end: datetime) -> List:
+    """Vehicles with no active booking overlapping [start, end), in one query."""
+    vehicle = models.Vehicle
+    booking = models.VehicleBooking
+    busy = exists().where(booking.vehicle_id == vehicle.id, overlaps(start, end))
+    result = await db.execute(
+        select(vehicle)
+        .where(
+            vehicle.tenant_id == tenant_id,
+            vehicle.status.notin_(UNAVAILABLE_VEHICLE_STATUSES),
+            not_(busy)
+        )
+        .order_by(vehicle.code)
+    )
+    return result.scalars().all()
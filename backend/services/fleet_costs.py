@@ -0,0 +1,238 @@
+"""
+Fleet Cost Rollups
+
+Monthly per-vehicle cost totals (VehicleCostRollup) so cost analytics are
+reads of a few small rows instead of sums over every fuel log, maintenance
+log and expense:
+
+1. Incremental: every fuel-log, maintenance and expense write adds its
+   amounts to the vehicle's month with one INSERT ... ON CONFLICT DO UPDATE
+   in the SAME transaction as the source row, so the rollup commits or rolls
+   back with it.
+2. Backfill: backfill_cost_rollups() rebuilds a tenant's rollups from the
+   source tables with one DELETE and one INSERT ... SELECT (grouped UNION ALL
+   of the three sources). It takes the tenant's advisory lock exclusively;
+   writers hold it shared, so no increment is lost or counted twice while a
+   backfill runs.
+3. Reads: monthly_costs() per vehicle and cost_trends() per month, with
+   cost per km (total cost / distance) and fuel efficiency (km / liter)
+   derived from the stored sums. Distance is the distance_traveled of the
+   fuel logs (odometer delta between fills).
+"""
+from typing import Dict, List, Optional
+import logging
+import uuid
+from datetime import date, datetime
+from sqlalchemy import Date, cast, case, delete, func, insert, literal, union_all
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+import models
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+COST_COLUMNS = [
+    "fuel_cost", "fuel_liters", "fuel_count", "distance_km", "distance_liters",
+    "maintenance_cost", "maintenance_count", "expense_cost", "expense_count"
+]
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def months_back(today: date, months: int) -> date:
+    """First day of the month `months - 1` months before today's month."""
+    index = today.year * 12 + today.month - 1 - (months - 1)
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _lock_key(tenant_id: uuid.UUID):
+    return func.hashtext(f"fleet_costs:{tenant_id}")
+
+
+# ==================== INCREMENTAL UPDATES ====================
+
+def fuel_log_delta(log) -> Dict:
+    has_distance = log.distance_traveled is not None
+    return {
+        "fuel_cost": log.total_cost or 0,
+        "fuel_liters": log.liters or 0,
+        "fuel_count": 1,
+        "distance_km": log.distance_traveled if has_distance else 0,
+        "distance_liters": (log.liters or 0) if has_distance else 0
+    }
+
+
+def maintenance_log_delta(log) -> Dict:
+    return {"maintenance_cost": log.total_cost or 0, "maintenance_count": 1}
+
+
+def expense_delta(expense) -> Dict:
+    return {"expense_cost": expense.amount or 0, "expense_count": 1}
+
+
+def rollup_upsert(tenant_id: uuid.UUID, vehicle_id: uuid.UUID, day: date, deltas: Dict):
+    """INSERT ... ON CONFLICT (vehicle_id, month) DO UPDATE adding the deltas."""
+    rollup = models.VehicleCostRollup
+    now = datetime.utcnow()
+    stmt = pg_insert(rollup).values(
+        id=uuid.uuid4(),
+        tenant_id=tenant_id,
+        vehicle_id=vehicle_id,
+        month=month_start(day),
+        updated_at=now,
+        **{column: deltas.get(column, 0) for column in COST_COLUMNS}
+    )
+    return stmt.on_conflict_do_update(
+        constraint="uq_vehicle_cost_rollups_vehicle_month",
+        set_={
+            **{column: getattr(rollup, column) + stmt.excluded[column] for column in deltas},
+            "updated_at": now
+        }
+    )
+
+
+async def apply_cost_delta(db: AsyncSession, tenant_id: uuid.UUID, vehicle_id: uuid.UUID, day: date, deltas: Dict):
+    """Add deltas to the vehicle's month. Call in the source write's transaction (does not commit)."""
+    await db.execute(select(func.pg_advisory_xact_lock_shared(_lock_key(tenant_id))))
+    await db.execute(rollup_upsert(tenant_id, vehicle_id, day, deltas))
+
+
+async def add_fuel_log(db: AsyncSession, log):
+    await apply_cost_delta(db, log.tenant_id, log.vehicle_id, log.date, fuel_log_delta(log))
+
+
+async def add_maintenance_log(db: AsyncSession, log):
+    await apply_cost_delta(db, log.tenant_id, log.vehicle_id, log.date, maintenance_log_delta(log))
+
+
+async def add_expense(db: AsyncSession, expense):
+    await apply_cost_delta(db, expense.tenant_id, expense.vehicle_id, expense.date, expense_delta(expense))
+
+
+# ==================== BACKFILL ====================
+
+def _source_select(model, tenant_id: uuid.UUID, values: Dict):
+    """Rows of (vehicle_id, month, *COST_COLUMNS) from one source; missing columns are 0."""
+    return select(
+        model.vehicle_id.label("vehicle_id"),
+        cast(func.date_trunc("month", model.date), Date).label("month"),
+        *[values.get(column, literal(0)).label(column) for column in COST_COLUMNS]
+    ).where(model.tenant_id == tenant_id)
+
+
+def backfill_statement(tenant_id: uuid.UUID):
+    """INSERT ... SELECT of a tenant's rollups, grouped from the source tables."""
+    fuel = models.VehicleFuelLog
+    maint = models.VehicleMaintenanceLog
+    expense = models.VehicleExpense
+    sources = union_all(
+        _source_select(fuel, tenant_id, {
+            "fuel_cost": fuel.total_cost,
+            "fuel_liters": fuel.liters,
+            "fuel_count": literal(1),
+            "distance_km": func.coalesce(fuel.distance_traveled, 0),
+            "distance_liters": case((fuel.distance_traveled.isnot(None), fuel.liters), else_=0)
+        }),
+        _source_select(maint, tenant_id, {"maintenance_cost": maint.total_cost, "maintenance_count": literal(1)}),
+        _source_select(expense, tenant_id, {"expense_cost": expense.amount, "expense_count": literal(1)})
+    ).subquery("cost_sources")
+
+    grouped = select(
+        func.gen_random_uuid(),
+        literal(tenant_id, models.VehicleCostRollup.tenant_id.type),
+        sources.c.vehicle_id,
+        sources.c.month,
+        *[func.sum(sources.c[column]) for column in COST_COLUMNS],
+        func.now()
+    ).group_by(sources.c.vehicle_id, sources.c.month)
+    return insert(models.VehicleCostRollup).from_select(
+        ["id", "tenant_id", "vehicle_id", "month", *COST_COLUMNS, "updated_at"],
+        grouped
+    )
+
+
+async def backfill_cost_rollups(db: AsyncSession, tenant_id: uuid.UUID) -> int:
+    """Rebuild the tenant's rollups from history. Returns the number of vehicle-months. Does not commit."""
+    await db.execute(select(func.pg_advisory_xact_lock(_lock_key(tenant_id))))
+    await db.execute(delete(models.VehicleCostRollup).where(models.VehicleCostRollup.tenant_id == tenant_id))
+    result = await db.execute(backfill_statement(tenant_id))
+    return result.rowcount
+
+
+async def run_cost_backfill(tenant_id: uuid.UUID):
+    """Background job: backfill in its own session and transaction."""
+    async with SessionLocal() as db:
+        try:
+            rows = await backfill_cost_rollups(db, tenant_id)
+            await db.commit()
+            logger.info(f"Fleet cost rollups rebuilt for tenant {tenant_id}: {rows} vehicle-months")
+        except Exception as e:
+            logger.error(f"Fleet cost backfill failed for tenant {tenant_id}: {e}")
+            await db.rollback()
+
+
+# ==================== READS ====================
+
+def derived_metrics(row: Dict) -> Dict:
+    """Totals plus cost per km and fuel efficiency (None without distance data)."""
+    total = row["fuel_cost"] + row["maintenance_cost"] + row["expense_cost"]
+    return {
+        **row,
+        "total_cost": total,
+        "cost_per_km": round(total / row["distance_km"], 2) if row["distance_km"] > 0 else None,
+        "fuel_efficiency": round(row["distance_km"] / row["distance_liters"], 2) if row["distance_liters"] > 0 else None
+    }
+
+
+async def monthly_costs(
+    db: AsyncSession,
+    tenant_id: uuid.UUID,
+    since: date,
+    vehicle_id: Optional[uuid.UUID] = None
+) -> List[Dict]:
+    """Per vehicle and month since `since`, newest month first."""
+    rollup = models.VehicleCostRollup
+    query = select(rollup).where(rollup.tenant_id == tenant_id, rollup.month >= since)
+    if vehicle_id:
+        query = query.where(rollup.vehicle_id == vehicle_id)
+    result = await db.execute(query.order_by(rollup.month.desc(), rollup.vehicle_id))
+    return [
+        derived_metrics({
+            "vehicle_id": r.vehicle_id,
+            "month": r.month,
+            **{column: getattr(r, column) for column in COST_COLUMNS}
+        })
+        for r in result.scalars().all()
+    ]
+
+
+async def cost_trends(db: AsyncSession, tenant_id: uuid.UUID, since: date) -> List[Dict]:
+    """Fleet-wide totals per month since `since`, oldest first."""
+    rollup = models.VehicleCostRollup
+    result = await db.execute(
+        select(
+            rollup.month,
+            func.count(rollup.vehicle_id).label("vehicles"),
+            *[func.sum(getattr(rollup, column)).label(column) for column in COST_COLUMNS]
+        )
+        .where(rollup.tenant_id == tenant_id, rollup.month >= since)
+        .group_by(rollup.month)
+        .order_by(rollup.month)
+    )
+    return [derived_metrics(dict(row._mapping)) for row in result.all()]
+
+
+async def month_totals(db: AsyncSession, tenant_id: uuid.UUID, month: date) -> Dict:
+    """Fuel, maintenance and expense totals of one month for the whole fleet."""
+    rollup = models.VehicleCostRollup
+    result = await db.execute(
+        select(
+            func.coalesce(func.sum(rollup.fuel_cost), 0).label("fuel_cost"),
+            func.coalesce(func.sum(rollup.maintenance_cost), 0).label("maintenance_cost"),
+            func.coalesce(func.sum(rollup.expense_cost), 0).label("expense_cost")
+        ).where(rollup.tenant_id == tenant_id, rollup.month == month_start(month))
+    )
+    return dict(result.one()._mapping)
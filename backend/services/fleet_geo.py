@@ -0,0 +1,180 @@
+"""
+Fleet Geo Service
+
+Distances and ETAs of bookings, computed for many journeys at once:
+
+- haversine_km(): great-circle distance on NumPy arrays (scalars work too).
+- estimate_etas(): total route, remaining distance, progress and ETA of
+  every journey in one array computation.
+- Speed comes from the vehicle's recent GPS history (mean moving speed over
+  the last SPEED_WINDOW_MINUTES, one MongoDB aggregation for all vehicles),
+  falling back to the live speed, then to DEFAULT_SPEED_KMH.
+- get_booking_etas(): results are cached per booking for ETA_TTL seconds;
+  one MGET serves the cached bookings and only the missing ones are
+  computed (one HMGET of live positions, one aggregation, one pipeline of
+  SETEX to store them).
+
+Distances are straight lines between coordinates - bookings carry no route
+geometry - so ETAs are a lower bound on road time.
+"""
+from typing import Dict, List, Optional
+import json
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+import numpy as np
+from connections.redis_utils import get_redis, tenant_key
+from services import fleet_positions, gps_history
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+DEFAULT_SPEED_KMH = float(os.getenv("FLEET_DEFAULT_SPEED_KMH", "40"))
+SPEED_WINDOW_MINUTES = int(os.getenv("FLEET_SPEED_WINDOW_MINUTES", "15"))
+# A vehicle this close to its destination has arrived
+ARRIVAL_RADIUS_KM = 0.05
+ETA_TTL = 30
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance in km between arrays (or scalars) of coordinates."""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def estimate_etas(
+    lat: np.ndarray,
+    lng: np.ndarray,
+    origin_lat: np.ndarray,
+    origin_lng: np.ndarray,
+    dest_lat: np.ndarray,
+    dest_lng: np.ndarray,
+    speed_kmh: np.ndarray
+) -> Dict[str, np.ndarray]:
+    """Route length, remaining distance, progress and minutes to destination of every journey."""
+    total_km = haversine_km(origin_lat, origin_lng, dest_lat, dest_lng)
+    remaining_km = haversine_km(lat, lng, dest_lat, dest_lng)
+    arrived = remaining_km <= ARRIVAL_RADIUS_KM
+    speed = np.where(speed_kmh > 0, speed_kmh, DEFAULT_SPEED_KMH)
+    route_km = np.where(total_km > 0, total_km, 1.0)
+    progress = np.where(total_km > 0, 1 - np.minimum(remaining_km / route_km, 1), 1.0)
+    return {
+        "total_km": total_km,
+        "remaining_km": np.where(arrived, 0.0, remaining_km),
+        "progress": np.where(arrived, 1.0, progress),
+        "speed_kmh": speed,
+        "eta_minutes": np.where(arrived, 0.0, remaining_km / speed * 60)
+    }
+
+
+def _eta_key(tenant_id, booking_id) -> str:
+    return tenant_key(str(tenant_id), f"fleet:eta:{booking_id}")
+
+
+async def recent_speeds(tenant_id: uuid.UUID, vehicle_ids: List[str]) -> Dict[str, float]:
+    """Mean moving speed of each vehicle over the speed window (missing when no history)."""
+    since = datetime.utcnow() - timedelta(minutes=SPEED_WINDOW_MINUTES)
+    try:
+        return await gps_history.average_speeds(str(tenant_id), vehicle_ids, since)
+    except Exception as e:
+        logger.error(f"Speed history not available: {e}")
+        return {}
+
+
+async def compute_booking_etas(tenant_id: uuid.UUID, journeys: List[Dict]) -> Dict[str, Dict]:
+    """
+    ETAs of journeys [{"booking_id", "vehicle_id", "origin_lat", "origin_lng",
+    "destination_lat", "destination_lng"}] with a destination. A vehicle
+    without a live position is assumed to be at its origin.
+    """
+    if not journeys:
+        return {}
+    vehicle_ids = list({str(j["vehicle_id"]) for j in journeys})
+    try:
+        positions = await fleet_positions.get_positions(tenant_id, vehicle_ids)
+    except fleet_positions.LiveTrackingUnavailable as e:
+        logger.error(f"ETA without live positions: {e}")
+        positions = []
+    live = {p["vehicle_id"]: p for p in positions}
+    history = await recent_speeds(tenant_id, vehicle_ids)
+
+    origin_lat, origin_lng, lat, lng, speed = [], [], [], [], []
+    for j in journeys:
+        vehicle_id = str(j["vehicle_id"])
+        o_lat = j["origin_lat"] if j.get("origin_lat") is not None else j["destination_lat"]
+        o_lng = j["origin_lng"] if j.get("origin_lng") is not None else j["destination_lng"]
+        position = live.get(vehicle_id)
+        origin_lat.append(o_lat)
+        origin_lng.append(o_lng)
+        lat.append(position["lat"] if position else o_lat)
+        lng.append(position["lng"] if position else o_lng)
+        speed.append(history.get(vehicle_id) or (position or {}).get("speed") or 0)
+
+    etas = estimate_etas(
+        np.array(lat, dtype=np.float64), np.array(lng, dtype=np.float64),
+        np.array(origin_lat, dtype=np.float64), np.array(origin_lng, dtype=np.float64),
+        np.array([j["destination_lat"] for j in journeys], dtype=np.float64),
+        np.array([j["destination_lng"] for j in journeys], dtype=np.float64),
+        np.array(speed, dtype=np.float64)
+    )
+    columns = {name: values.tolist() for name, values in etas.items()}
+    now = datetime.utcnow()
+    return {
+        str(j["booking_id"]): {
+            "position": {"lat": lat[i], "lng": lng[i], "live": str(j["vehicle_id"]) in live},
+            "total_km": round(columns["total_km"][i], 3),
+            "remaining_km": round(columns["remaining_km"][i], 3),
+            "progress": round(columns["progress"][i], 4),
+            "speed_kmh": round(columns["speed_kmh"][i], 1),
+            "eta_minutes": round(columns["eta_minutes"][i], 1),
+            "eta": (now + timedelta(minutes=columns["eta_minutes"][i])).isoformat(),
+            "computed_at": now.isoformat()
+        }
+        for i, j in enumerate(journeys)
+    }
+
+
+async def get_booking_etas(tenant_id: uuid.UUID, journeys: List[Dict]) -> Dict[str, Dict]:
+    """{booking_id: ETA} for the journeys, cached per booking for ETA_TTL seconds."""
+    journeys = [j for j in journeys if j.get("destination_lat") is not None and j.get("destination_lng") is not None]
+    if not journeys:
+        return {}
+    keys = [_eta_key(tenant_id, j["booking_id"]) for j in journeys]
+    try:
+        r = await get_redis()
+        cached = await r.mget(keys)
+    except Exception as e:
+        logger.error(f"ETA cache get error: {e}")
+        r, cached = None, [None] * len(keys)
+
+    etas = {str(j["booking_id"]): json.loads(value) for j, value in zip(journeys, cached) if value}
+    missing = [j for j in journeys if str(j["booking_id"]) not in etas]
+    fresh = await compute_booking_etas(tenant_id, missing)
+    if fresh and r is not None:
+        try:
+            pipe = r.pipeline(transaction=False)
+            for booking_id, eta in fresh.items():
+                pipe.setex(_eta_key(tenant_id, booking_id), ETA_TTL, json.dumps(eta))
+            await pipe.execute()
+        except Exception as e:
+            logger.error(f"ETA cache set error: {e}")
+    etas.update(fresh)
+    return etas
+
+
+async def get_booking_eta(tenant_id: uuid.UUID, booking) -> Optional[Dict]:
+    etas = await get_booking_etas(tenant_id, [booking_journey(booking)])
+    return etas.get(str(booking.id))
+
+
+def booking_journey(booking) -> Dict:
+    return {
+        "booking_id": booking.id,
+        "vehicle_id": booking.vehicle_id,
+        "origin_lat": booking.origin_lat,
+        "origin_lng": booking.origin_lng,
+        "destination_lat": booking.destination_lat,
+        "destination_lng": booking.destination_lng
+    }
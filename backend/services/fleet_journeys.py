@@ -0,0 +1,172 @@
+"""
+Fleet Journeys Service
+
+Builds the live-tracking "vehicles in journey" payload for a tenant with a
+constant number of queries, however many vehicles are on the road:
+
+1. Active (IN_USE) bookings with vehicle, driver and department (selectinload).
+2. Latest fuel log per vehicle       - SELECT DISTINCT ON (vehicle_id)
+3. Latest maintenance log per vehicle - SELECT DISTINCT ON (vehicle_id)
+4. Next open reminder per vehicle     - SELECT DISTINCT ON (vehicle_id)
+5. Total expenses per vehicle         - GROUP BY vehicle_id
+
+Live position, remaining distance and ETA of every booking come from
+services.fleet_geo in one array computation (cached per booking).
+
+Map screens poll this endpoint, so the payload is cached per tenant for
+JOURNEYS_TTL seconds and dropped by invalidate_journeys() on booking,
+fuel, maintenance, expense and reminder writes.
+"""
+from typing import Dict, List, Optional
+import uuid
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import selectinload
+import models
+from connections.redis_utils import tenant_cache_get, tenant_cache_set, cache_delete, tenant_key
+from services import fleet_geo
+
+JOURNEYS_TTL = 15
+JOURNEYS_CACHE_KEY = "fleet:journeys"
+
+# Fallback map position (Jakarta) for bookings without origin coordinates
+DEFAULT_POSITION = {"lat": -6.2088, "lng": 106.8456}
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+async def _latest_per_vehicle(db: AsyncSession, model, vehicle_ids: List[uuid.UUID], *order_by, where=None) -> Dict:
+    """{vehicle_id: first row by order_by} for all vehicles in one DISTINCT ON query."""
+    query = select(model).where(model.vehicle_id.in_(vehicle_ids))
+    if where is not None:
+        query = query.where(where)
+    result = await db.execute(query.distinct(model.vehicle_id).order_by(model.vehicle_id, *order_by))
+    return {row.vehicle_id: row for row in result.scalars().all()}
+
+
+async def load_vehicles_in_journey(db: AsyncSession, tenant_id: uuid.UUID) -> Dict:
+    result = await db.execute(
+        select(models.VehicleBooking)
+        .where(
+            models.VehicleBooking.tenant_id == tenant_id,
+            models.VehicleBooking.status == 'IN_USE'
+        )
+        .options(
+            selectinload(models.VehicleBooking.vehicle),
+            selectinload(models.VehicleBooking.driver),
+            selectinload(models.VehicleBooking.department)
+        )
+    )
+    bookings = [b for b in result.scalars().all() if b.vehicle]
+    if not bookings:
+        return {"vehicles": [], "count": 0}
+
+    vehicle_ids = list({b.vehicle_id for b in bookings})
+    fuel = models.VehicleFuelLog
+    maint = models.VehicleMaintenanceLog
+    reminder = models.VehicleReminder
+
+    last_fuel = await _latest_per_vehicle(db, fuel, vehicle_ids, fuel.date.desc(), fuel.created_at.desc())
+    last_maint = await _latest_per_vehicle(db, maint, vehicle_ids, maint.date.desc(), maint.created_at.desc())
+    next_reminder = await _latest_per_vehicle(
+        db, reminder, vehicle_ids, reminder.due_date, where=reminder.is_completed == False
+    )
+    result = await db.execute(
+        select(models.VehicleExpense.vehicle_id, func.sum(models.VehicleExpense.amount))
+        .where(models.VehicleExpense.vehicle_id.in_(vehicle_ids))
+        .group_by(models.VehicleExpense.vehicle_id)
+    )
+    expenses = dict(result.all())
+    etas = await fleet_geo.get_booking_etas(tenant_id, [fleet_geo.booking_journey(b) for b in bookings])
+
+    vehicles = [
+        journey_entry(
+            booking,
+            last_fuel.get(booking.vehicle_id),
+            last_maint.get(booking.vehicle_id),
+            next_reminder.get(booking.vehicle_id),
+            expenses.get(booking.vehicle_id) or 0,
+            etas.get(str(booking.id))
+        )
+        for booking in bookings
+    ]
+    return {"vehicles": vehicles, "count": len(vehicles)}
+
+
+def journey_entry(booking, last_fuel, last_maint, next_reminder, total_expense: float, eta: Optional[Dict] = None) -> Dict:
+    vehicle = booking.vehicle
+    driver = booking.driver
+    return {
+        "vehicle": {
+            "id": str(vehicle.id),
+            "code": vehicle.code,
+            "plate_number": vehicle.plate_number,
+            "brand": vehicle.brand,
+            "model": vehicle.model,
+            "year": vehicle.year,
+            "vehicle_type": vehicle.vehicle_type,
+            "current_odometer": vehicle.current_odometer,
+            "image_url": vehicle.image_url
+        },
+        "booking": {
+            "id": str(booking.id),
+            "code": booking.code,
+            "purpose": booking.purpose.value if booking.purpose else None,
+            "destination": booking.destination,
+            "destination_lat": booking.destination_lat,
+            "destination_lng": booking.destination_lng,
+            "origin_address": booking.origin_address,
+            "origin_lat": booking.origin_lat,
+            "origin_lng": booking.origin_lng,
+            "start_datetime": _isoformat(booking.start_datetime),
+            "end_datetime": _isoformat(booking.end_datetime),
+            "actual_start": _isoformat(booking.actual_start),
+            "department_name": booking.department.name if booking.department else None
+        },
+        "driver": {
+            "id": str(driver.id),
+            "name": driver.name,
+            "phone": driver.phone,
+            "photo_url": driver.photo_url
+        } if driver else None,
+        "last_fuel": {
+            "date": last_fuel.date.isoformat(),
+            "liters": last_fuel.liters,
+            "total_cost": last_fuel.total_cost
+        } if last_fuel else None,
+        "last_maintenance": {
+            "date": last_maint.date.isoformat(),
+            "service_type": last_maint.service_type,
+            "total_cost": last_maint.total_cost
+        } if last_maint else None,
+        "next_reminder": {
+            "title": next_reminder.title,
+            "due_date": next_reminder.due_date.isoformat(),
+            "reminder_type": next_reminder.reminder_type.value
+        } if next_reminder else None,
+        "total_expense": float(total_expense),
+        "current_position": {
+            "lat": eta["position"]["lat"],
+            "lng": eta["position"]["lng"]
+        } if eta else {
+            "lat": booking.origin_lat or DEFAULT_POSITION["lat"],
+            "lng": booking.origin_lng or DEFAULT_POSITION["lng"]
+        },
+        "eta": {key: value for key, value in eta.items() if key != "position"} if eta else None
+    }
+
+
+async def get_vehicles_in_journey(db: AsyncSession, tenant_id: uuid.UUID) -> Dict:
+    """Vehicles in journey, from cache when fresh."""
+    data = await tenant_cache_get(str(tenant_id), JOURNEYS_CACHE_KEY)
+    if data is None:
+        data = await load_vehicles_in_journey(db, tenant_id)
+        await tenant_cache_set(str(tenant_id), JOURNEYS_CACHE_KEY, data, JOURNEYS_TTL)
+    return data
+
+
+async def invalidate_journeys(tenant_id: uuid.UUID):
+    await cache_delete(tenant_key(str(tenant_id), JOURNEYS_CACHE_KEY))
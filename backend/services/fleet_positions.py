@@ -0,0 +1,230 @@
+"""
+Fleet Live Positions
+
+The latest position of every vehicle lives in Redis, per tenant:
+
+- fleet:geo:{tenant}  GEO set (member = vehicle_id) for radius queries
+- fleet:pos:{tenant}  hash vehicle_id -> JSON position (speed, heading, booking, timestamp)
+
+A ping is one pipelined GEOADD + HSET; the point is also queued for the
+buffered MongoDB history (services.gps_history). Reads are one HGETALL or
+one GEOSEARCH ... WITHDIST followed by one HMGET.
+
+Positions are enriched from an in-memory per-tenant metadata cache of
+vehicles and their active bookings (plate, driver, destination). The cache
+is loaded with two queries, refreshed after METADATA_TTL seconds, dropped
+locally on vehicle/booking writes, and topped up with one batched query for
+vehicles or bookings it has not seen yet.
+"""
+from typing import Dict, List, Optional
+import json
+import time
+import uuid
+from datetime import datetime
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import selectinload
+import models
+from connections.redis_utils import get_redis
+from services.gps_history import enqueue_history
+
+METADATA_TTL = 30
+ACTIVE_BOOKING_STATUSES = ['APPROVED', 'IN_USE']
+
+
+class LiveTrackingUnavailable(Exception):
+    """Raised when the Redis live-position store cannot be reached."""
+
+
+def _geo_key(tenant_id) -> str:
+    return f"fleet:geo:{tenant_id}"
+
+
+def _pos_key(tenant_id) -> str:
+    return f"fleet:pos:{tenant_id}"
+
+
+def _position(tenant_id, ping: Dict, now: datetime) -> Dict:
+    return {
+        "vehicle_id": str(ping["vehicle_id"]),
+        "booking_id": str(ping["booking_id"]) if ping.get("booking_id") else None,
+        "tenant_id": str(tenant_id),
+        "lat": ping["lat"],
+        "lng": ping["lng"],
+        "speed": ping.get("speed"),
+        "heading": ping.get("heading"),
+        "accuracy": ping.get("accuracy"),
+        "timestamp": now.isoformat(),
+        "updated_by": str(ping["updated_by"]) if ping.get("updated_by") else None
+    }
+
+
+async def record_positions(tenant_id: uuid.UUID, pings: List[Dict]) -> datetime:
+    """Store the latest position of each vehicle and queue the pings for history."""
+    now = datetime.utcnow()
+    positions = [_position(tenant_id, ping, now) for ping in pings]
+    if not positions:
+        return now
+    try:
+        r = await get_redis()
+        pipe = r.pipeline(transaction=False)
+        geo = []
+        for p in positions:
+            geo.extend((p["lng"], p["lat"], p["vehicle_id"]))
+        pipe.geoadd(_geo_key(tenant_id), geo)
+        pipe.hset(_pos_key(tenant_id), mapping={p["vehicle_id"]: json.dumps(p) for p in positions})
+        await pipe.execute()
+    except Exception as e:
+        raise LiveTrackingUnavailable(f"Live tracking store not available: {e}")
+
+    enqueue_history([{**p, "timestamp": now, "created_at": now} for p in positions])
+    return now
+
+
+async def get_positions(tenant_id: uuid.UUID, vehicle_ids: Optional[List[str]] = None) -> List[Dict]:
+    """Latest positions of the given vehicles (all vehicles of the tenant when None)."""
+    try:
+        r = await get_redis()
+        if vehicle_ids is None:
+            raw = list((await r.hgetall(_pos_key(tenant_id))).values())
+        elif vehicle_ids:
+            raw = await r.hmget(_pos_key(tenant_id), vehicle_ids)
+        else:
+            raw = []
+    except Exception as e:
+        raise LiveTrackingUnavailable(f"Live tracking store not available: {e}")
+    return [json.loads(value) for value in raw if value]
+
+
+async def search_positions(tenant_id: uuid.UUID, lat: float, lng: float, radius_km: float, limit: int) -> List[Dict]:
+    """Vehicles within radius_km of (lat, lng), nearest first, with distance_km."""
+    try:
+        r = await get_redis()
+        hits = await r.geosearch(
+            _geo_key(tenant_id), longitude=lng, latitude=lat,
+            radius=radius_km, unit="km", sort="ASC", count=limit, withdist=True
+        )
+    except Exception as e:
+        raise LiveTrackingUnavailable(f"Live tracking store not available: {e}")
+    distances = {member: dist for member, dist in hits}
+    positions = await get_positions(tenant_id, list(distances.keys()))
+    for p in positions:
+        p["distance_km"] = round(float(distances[p["vehicle_id"]]), 3)
+    return positions
+
+
+async def remove_positions(tenant_id: uuid.UUID, vehicle_ids: List[str]):
+    if not vehicle_ids:
+        return
+    try:
+        r = await get_redis()
+        pipe = r.pipeline(transaction=False)
+        pipe.zrem(_geo_key(tenant_id), *vehicle_ids)
+        pipe.hdel(_pos_key(tenant_id), *vehicle_ids)
+        await pipe.execute()
+    except Exception as e:
+        raise LiveTrackingUnavailable(f"Live tracking store not available: {e}")
+
+
+# ==================== VEHICLE METADATA CACHE ====================
+
+_metadata: Dict[uuid.UUID, Dict] = {}
+
+
+def _vehicle_meta(vehicle) -> Dict:
+    return {
+        "vehicle_plate": vehicle.plate_number,
+        "vehicle_brand": vehicle.brand,
+        "vehicle_model": vehicle.model,
+        "vehicle_type": vehicle.vehicle_type
+    }
+
+
+def _booking_meta(booking) -> Dict:
+    driver = booking.driver
+    return {
+        "driver_name": driver.name if driver else None,
+        "driver_phone": driver.phone if driver else None,
+        "destination": booking.destination,
+        "origin_lat": booking.origin_lat,
+        "origin_lng": booking.origin_lng,
+        "destination_lat": booking.destination_lat,
+        "destination_lng": booking.destination_lng,
+        "purpose": booking.purpose.value if booking.purpose else None
+    }
+
+
+async def _load_bookings(db: AsyncSession, *conditions) -> Dict[str, Dict]:
+    result = await db.execute(
+        select(models.VehicleBooking).where(*conditions).options(selectinload(models.VehicleBooking.driver))
+    )
+    return {str(b.id): _booking_meta(b) for b in result.scalars().all()}
+
+
+async def _load_metadata(db: AsyncSession, tenant_id: uuid.UUID) -> Dict:
+    result = await db.execute(select(models.Vehicle).where(models.Vehicle.tenant_id == tenant_id))
+    vehicles = {str(v.id): _vehicle_meta(v) for v in result.scalars().all()}
+    bookings = await _load_bookings(
+        db,
+        models.VehicleBooking.tenant_id == tenant_id,
+        models.VehicleBooking.status.in_(ACTIVE_BOOKING_STATUSES)
+    )
+    return {"vehicles": vehicles, "bookings": bookings, "loaded_at": time.monotonic()}
+
+
+async def get_vehicle_metadata(db: AsyncSession, tenant_id: uuid.UUID, positions: List[Dict]) -> Dict:
+    """Tenant metadata covering every vehicle and booking referenced by positions."""
+    meta = _metadata.get(tenant_id)
+    if meta is None or time.monotonic() - meta["loaded_at"] > METADATA_TTL:
+        meta = _metadata[tenant_id] = await _load_metadata(db, tenant_id)
+
+    missing_vehicles = {p["vehicle_id"] for p in positions} - meta["vehicles"].keys()
+    if missing_vehicles:
+        result = await db.execute(
+            select(models.Vehicle).where(
+                models.Vehicle.tenant_id == tenant_id,
+                models.Vehicle.id.in_([uuid.UUID(v) for v in missing_vehicles])
+            )
+        )
+        meta["vehicles"].update({str(v.id): _vehicle_meta(v) for v in result.scalars().all()})
+
+    missing_bookings = {p["booking_id"] for p in positions if p.get("booking_id")} - meta["bookings"].keys()
+    if missing_bookings:
+        meta["bookings"].update(await _load_bookings(
+            db,
+            models.VehicleBooking.tenant_id == tenant_id,
+            models.VehicleBooking.id.in_([uuid.UUID(b) for b in missing_bookings])
+        ))
+    return meta
+
+
+def invalidate_vehicle_metadata(tenant_id: uuid.UUID):
+    _metadata.pop(tenant_id, None)
+
+
+_EMPTY_VEHICLE = dict.fromkeys(("vehicle_plate", "vehicle_brand", "vehicle_model", "vehicle_type"))
+_EMPTY_BOOKING = dict.fromkeys((
+    "driver_name", "driver_phone", "destination", "origin_lat", "origin_lng",
+    "destination_lat", "destination_lng", "purpose"
+))
+
+
+def enrich_positions(positions: List[Dict], meta: Dict) -> List[Dict]:
+    """Positions joined with cached vehicle and booking metadata."""
+    enriched = []
+    for p in positions:
+        entry = {
+            "vehicle_id": p["vehicle_id"],
+            "booking_id": p.get("booking_id"),
+            "lat": p["lat"],
+            "lng": p["lng"],
+            "speed": p.get("speed"),
+            "heading": p.get("heading"),
+            "timestamp": p.get("timestamp"),
+            **meta["vehicles"].get(p["vehicle_id"], _EMPTY_VEHICLE),
+            **meta["bookings"].get(p.get("booking_id"), _EMPTY_BOOKING)
+        }
+        if "distance_km" in p:
+            entry["distance_km"] = p["distance_km"]
+        enriched.append(entry)
+    return enriched
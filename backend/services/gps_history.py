@@ -0,0 +1,236 @@
+"""
+GPS History Buffer
+
+Location pings are not written to MongoDB one by one. enqueue_history()
+appends them to an in-process buffer and a background flusher writes the
+buffer every HISTORY_FLUSH_INTERVAL seconds, or as soon as
+HISTORY_FLUSH_SIZE points are waiting.
+
+History is stored time-bucketed: one document per vehicle per
+HISTORY_BUCKET_MINUTES holds the compact points of that window
+
+    {tenant_id, vehicle_id, bucket_start, first_ts, last_ts, count,
+     points: [{t, lat, lng, speed, heading, booking_id}, ...]}
+
+so a flush is ONE unordered bulk_write of upserts ($push $each) - one
+operation per touched bucket instead of one insert per ping. Buckets expire
+through a TTL index on bucket_start after HISTORY_RETENTION_DAYS.
+
+If MongoDB is unreachable the points stay buffered (up to
+HISTORY_MAX_BUFFER, oldest dropped first) and are retried on the next flush;
+when only some bucket upserts fail, only their points are requeued.
+"""
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+from datetime import datetime
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+from connections.mongodb import get_mongo_db
+
+logger = logging.getLogger(__name__)
+
+HISTORY_COLLECTION = "vehicle_location_buckets"
+HISTORY_FLUSH_INTERVAL = float(os.getenv("GPS_HISTORY_FLUSH_INTERVAL", "2"))
+HISTORY_FLUSH_SIZE = int(os.getenv("GPS_HISTORY_FLUSH_SIZE", "1000"))
+HISTORY_MAX_BUFFER = int(os.getenv("GPS_HISTORY_MAX_BUFFER", "200000"))
+HISTORY_BUCKET_MINUTES = int(os.getenv("GPS_HISTORY_BUCKET_MINUTES", "10"))
+HISTORY_RETENTION_DAYS = int(os.getenv("GPS_HISTORY_RETENTION_DAYS", "90"))
+
+_buffer: List[Dict] = []
+_flush_lock = asyncio.Lock()
+_flush_task = None
+_indexes_ready = False
+
+
+def enqueue_history(points: List[Dict]):
+    """Queue location points for the next history flush."""
+    global _flush_task
+    _buffer.extend(points)
+    overflow = len(_buffer) - HISTORY_MAX_BUFFER
+    if overflow > 0:
+        del _buffer[:overflow]
+        logger.warning(f"GPS history buffer full, dropped {overflow} oldest points")
+    if len(_buffer) >= HISTORY_FLUSH_SIZE and (_flush_task is None or _flush_task.done()):
+        _flush_task = asyncio.create_task(flush_history())
+
+
+def pending_history() -> int:
+    return len(_buffer)
+
+
+def bucket_start(ts: datetime) -> datetime:
+    minute = ts.minute - ts.minute % HISTORY_BUCKET_MINUTES
+    return ts.replace(minute=minute, second=0, microsecond=0)
+
+
+def _compact(point: Dict) -> Dict:
+    return {
+        "t": point["timestamp"],
+        "lat": point["lat"],
+        "lng": point["lng"],
+        "speed": point.get("speed"),
+        "heading": point.get("heading"),
+        "booking_id": point.get("booking_id")
+    }
+
+
+def _bucket_key(point: Dict) -> Tuple[str, str, datetime]:
+    return point["tenant_id"], point["vehicle_id"], bucket_start(point["timestamp"])
+
+
+def group_into_buckets(points: List[Dict]) -> Dict[Tuple[str, str, datetime], List[Dict]]:
+    """(tenant_id, vehicle_id, bucket_start) -> compact points in time order."""
+    buckets: Dict[Tuple[str, str, datetime], List[Dict]] = {}
+    for point in points:
+        buckets.setdefault(_bucket_key(point), []).append(_compact(point))
+    for bucket in buckets.values():
+        bucket.sort(key=lambda p: p["t"])
+    return buckets
+
+
+def failed_points(points: List[Dict], write_errors: List[Dict]) -> List[Dict]:
+    """Points of the bucket operations (by bulk_write index) that failed."""
+    keys = list(group_into_buckets(points))
+    failed = {keys[error["index"]] for error in write_errors}
+    return [point for point in points if _bucket_key(point) in failed]
+
+
+def bucket_operations(points: List[Dict]) -> List[UpdateOne]:
+    """One upsert per bucket, in group_into_buckets order."""
+    return [
+        UpdateOne(
+            {"tenant_id": tenant_id, "vehicle_id": vehicle_id, "bucket_start": start},
+            {
+                "$push": {"points": {"$each": bucket}},
+                "$inc": {"count": len(bucket)},
+                "$min": {"first_ts": bucket[0]["t"]},
+                "$max": {"last_ts": bucket[-1]["t"]}
+            },
+            upsert=True
+        )
+        for (tenant_id, vehicle_id, start), bucket in group_into_buckets(points).items()
+    ]
+
+
+async def _ensure_indexes(collection):
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    await collection.create_index(
+        [("tenant_id", ASCENDING), ("vehicle_id", ASCENDING), ("bucket_start", ASCENDING)],
+        unique=True
+    )
+    await collection.create_index("bucket_start", expireAfterSeconds=HISTORY_RETENTION_DAYS * 86400)
+    _indexes_ready = True
+
+
+async def flush_history() -> int:
+    """Write everything buffered so far. Returns the number of points written."""
+    async with _flush_lock:
+        if not _buffer:
+            return 0
+        mongo_db = await get_mongo_db()
+        if mongo_db is None:
+            return 0
+        points = _buffer[:]
+        del _buffer[:len(points)]
+        collection = mongo_db[HISTORY_COLLECTION]
+        try:
+            await _ensure_indexes(collection)
+            await collection.bulk_write(bucket_operations(points), ordered=False)
+        except BulkWriteError as e:
+            # Buckets that were written are not retried (that would duplicate their points)
+            write_errors = e.details.get("writeErrors", [])
+            retry = failed_points(points, write_errors)
+            logger.error(
+                f"GPS history flush partially failed, {len(retry)} points requeued: {write_errors[:3]}"
+            )
+            _buffer[:0] = retry
+            return len(points) - len(retry)
+        except Exception as e:
+            logger.error(f"GPS history flush failed, {len(points)} points requeued: {e}")
+            _buffer[:0] = points
+            return 0
+        return len(points)
+
+
+async def run_history_flusher():
+    """Background loop started from the app lifespan."""
+    try:
+        while True:
+            await asyncio.sleep(HISTORY_FLUSH_INTERVAL)
+            await flush_history()
+    except asyncio.CancelledError:
+        await flush_history()
+        raise
+
+
+# ==================== ROUTE REPLAY ====================
+
+async def iter_route_points(
+    tenant_id: str,
+    vehicle_id: str,
+    start: datetime,
+    end: datetime
+) -> AsyncIterator[List[Dict]]:
+    """Yield the vehicle's points between start and end, one bucket at a time."""
+    mongo_db = await get_mongo_db()
+    if mongo_db is None:
+        return
+    cursor = mongo_db[HISTORY_COLLECTION].find(
+        {
+            "tenant_id": tenant_id,
+            "vehicle_id": vehicle_id,
+            "bucket_start": {"$gte": bucket_start(start), "$lte": end}
+        },
+        {"points": 1, "_id": 0}
+    ).sort("bucket_start", ASCENDING)
+    async for bucket in cursor:
+        points = sorted((p for p in bucket["points"] if start <= p["t"] <= end), key=lambda p: p["t"])
+        if points:
+            yield points
+
+
+async def average_speeds(tenant_id: str, vehicle_ids: List[str], since: datetime) -> Dict[str, float]:
+    """{vehicle_id: mean moving speed since `since`} for all vehicles in one aggregation."""
+    mongo_db = await get_mongo_db()
+    if mongo_db is None or not vehicle_ids:
+        return {}
+    cursor = mongo_db[HISTORY_COLLECTION].aggregate([
+        {"$match": {
+            "tenant_id": tenant_id,
+            "vehicle_id": {"$in": vehicle_ids},
+            "bucket_start": {"$gte": bucket_start(since)},
+            "last_ts": {"$gte": since}
+        }},
+        {"$unwind": "$points"},
+        {"$match": {"points.t": {"$gte": since}, "points.speed": {"$gt": 0}}},
+        {"$group": {"_id": "$vehicle_id", "speed": {"$avg": "$points.speed"}}}
+    ])
+    return {row["_id"]: float(row["speed"]) async for row in cursor}
+
+
+def _encode_value(value: int) -> str:
+    value = ~(value << 1) if value < 0 else value << 1
+    chunks = []
+    while value >= 0x20:
+        chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    chunks.append(chr(value + 63))
+    return "".join(chunks)
+
+
+def encode_polyline(points: List[Dict], previous: Optional[Tuple[int, int]] = None) -> Tuple[str, Tuple[int, int]]:
+    """
+    Google encoded polyline of points, continuing from previous (the last
+    encoded point) so a route can be streamed bucket by bucket.
+    """
+    prev_lat, prev_lng = previous or (0, 0)
+    encoded = []
+    for point in points:
+        lat, lng = round(point["lat"] * 1e5), round(point["lng"] * 1e5)
+        encoded.append(_encode_value(lat - prev_lat) + _encode_value(lng - prev_lng))
+        prev_lat, prev_lng = lat, lng
+    return "".join(encoded), (prev_lat, prev_lng)
@@ -0,0 +1,77 @@
+"""
+HR Dashboard Stats
+
+The dashboard counters are computed with ONE statement: three single-row
+CTEs (employees, today's attendance, leave requests) each aggregate their
+table with COUNT(*) FILTER (...), and are cross joined into one row.
+
+Wall-mounted dashboards refresh constantly, so the row is cached per
+(tenant, date) for DASHBOARD_TTL seconds. Employee, attendance and leave
+writes call invalidate_hr_dashboard() so counters never lag a check-in.
+"""
+from typing import Dict
+import uuid
+from datetime import date, timedelta
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import models_hr
+from connections.redis_utils import tenant_cache_get, tenant_cache_set, cache_delete, tenant_key
+
+DASHBOARD_TTL = 60
+CONTRACT_EXPIRY_DAYS = 30
+
+
+def _cache_key(day: date) -> str:
+    return f"hr:dashboard:{day.isoformat()}"
+
+
+async def compute_hr_dashboard_stats(db: AsyncSession, tenant_id: uuid.UUID, today: date) -> Dict:
+    employee = models_hr.Employee
+    attendance = models_hr.Attendance
+    leave = models_hr.LeaveRequest
+
+    employees = select(
+        func.count().label("total_employees"),
+        func.count().filter(employee.status == models_hr.EmployeeStatus.ACTIVE).label("active_employees"),
+        func.count().filter(
+            employee.contract_end >= today,
+            employee.contract_end <= today + timedelta(days=CONTRACT_EXPIRY_DAYS)
+        ).label("contracts_expiring_soon")
+    ).where(employee.tenant_id == tenant_id).cte("employee_counts")
+
+    attendances = select(
+        func.count().filter(attendance.check_in.isnot(None)).label("present_today"),
+        func.count().filter(attendance.status == models_hr.AttendanceStatus.LATE).label("late_today")
+    ).where(attendance.tenant_id == tenant_id, attendance.date == today).cte("attendance_counts")
+
+    leaves = select(
+        func.count().filter(
+            leave.status == models_hr.LeaveStatus.APPROVED,
+            leave.start_date <= today,
+            leave.end_date >= today
+        ).label("on_leave_today"),
+        func.count().filter(leave.status == models_hr.LeaveStatus.PENDING).label("pending_leave_requests")
+    ).where(
+        leave.tenant_id == tenant_id,
+        leave.status.in_([models_hr.LeaveStatus.APPROVED, models_hr.LeaveStatus.PENDING])
+    ).cte("leave_counts")
+
+    result = await db.execute(select(employees, attendances, leaves))
+    stats = dict(result.one()._mapping)
+    stats["absent_today"] = stats["active_employees"] - stats["present_today"] - stats["on_leave_today"]
+    return stats
+
+
+async def get_hr_dashboard_stats(db: AsyncSession, tenant_id: uuid.UUID) -> Dict:
+    """Today's dashboard counters, from cache when fresh."""
+    today = date.today()
+    stats = await tenant_cache_get(str(tenant_id), _cache_key(today))
+    if stats is None:
+        stats = await compute_hr_dashboard_stats(db, tenant_id, today)
+        await tenant_cache_set(str(tenant_id), _cache_key(today), stats, DASHBOARD_TTL)
+    return stats
+
+
+async def invalidate_hr_dashboard(tenant_id: uuid.UUID):
+    """Drop today's cached counters after an employee, attendance or leave write."""
+    await cache_delete(tenant_key(str(tenant_id), _cache_key(date.today())))
@@ -1,4 +1,5 @@
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import insert
 import models
 import uuid
 from datetime import datetime
@@ -6,6 +7,21 @@ from connections.rabbitmq_utils import get_rabbitmq_connection
 import json
 import aio_pika
 
+
+def _movement_event(product_id, location_id, quantity_change, movement_type, reference_id):
+    return {
+        "event": "inventory.movement",
+        "data": {
+            "product_id": str(product_id),
+            "location_id": str(location_id),
+            "quantity": quantity_change,
+            "type": movement_type.value, # Use .value for Enum
+            "ref_id": reference_id,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+    }
+
+
 async def record_movement(
     db: AsyncSession,
     product_id: uuid.UUID,
@@ -39,17 +55,7 @@ async def record_movement(
         channel = await connection.channel()
         exchange = await channel.declare_exchange("erp_events", type="topic")
         
-        message = {
-            "event": "inventory.movement",
-            "data": {
-                "product_id": str(product_id),
-                "location_id": str(location_id),
-                "quantity": quantity_change,
-                "type": movement_type.value, # Use .value for Enum
-                "ref_id": reference_id,
-                "timestamp": datetime.utcnow().isoformat()
-            }
-        }
+        message = _movement_event(product_id, location_id, quantity_change, movement_type, reference_id)
         
         await exchange.publish(
             aio_pika.Message(body=json.dumps(message).encode()),
@@ -59,3 +65,45 @@ async def record_movement(
         print(f"Failed to publish inventory event: {e}")
 
     return movement
+
+
+async def record_movements(db: AsyncSession, movements: list[dict]) -> list[dict]:
+    """
+    Bulk variant of record_movement for multi-line operations (pick lists,
+    opname posting). Inserts all rows with one executemany INSERT and does NOT
+    commit - the caller owns the transaction. Call publish_movements() after
+    the commit succeeds so events are never sent for rolled-back stock.
+    """
+    if not movements:
+        return []
+
+    now = datetime.utcnow()
+    for m in movements:
+        m.setdefault("id", uuid.uuid4())
+        m.setdefault("timestamp", now)
+
+    await db.execute(insert(models.StockMovement), movements)
+    return movements
+
+
+async def publish_movements(movements: list[dict]):
+    """Broadcast inventory.movement events for rows saved by record_movements over one channel."""
+    if not movements:
+        return
+
+    try:
+        connection = await get_rabbitmq_connection()
+        channel = await connection.channel()
+        exchange = await channel.declare_exchange("erp_events", type="topic")
+
+        for m in movements:
+            message = _movement_event(
+                m["product_id"], m["location_id"], m["quantity_change"],
+                m["movement_type"], m.get("reference_id")
+            )
+            await exchange.publish(
+                aio_pika.Message(body=json.dumps(message).encode()),
+                routing_key=f"inventory.movement.{m['movement_type'].value.lower()}"
+            )
+    except Exception as e:
+        print(f"Failed to publish inventory events: {e}")
@@ -0,0 +1,170 @@
+"""
+Journey Simulation Engine
+
+Moves every vehicle of a tenant that is on an IN_USE booking one step
+toward its destination, for demos and load tests of the tracking UI:
+
+1. Load once: all live positions (one Redis HGETALL) and all IN_USE
+   bookings with coordinates (one query). A journey without a live
+   position starts at its origin.
+2. Step: every vehicle covers speed x step_seconds along the straight line
+   to its destination (haversine distance, services.fleet_geo) and has
+   arrived once the remaining distance is within the step or
+   fleet_geo.ARRIVAL_RADIUS_KM - all journeys at once on NumPy arrays.
+3. Write: all positions go to Redis in one pipeline through
+   services.fleet_positions (history is buffered and bucketed by
+   services.gps_history), and all arrivals are committed in ONE Postgres
+   transaction - two set-based UPDATEs for bookings and vehicles.
+"""
+from typing import Dict, List, Optional
+import uuid
+from datetime import datetime
+import numpy as np
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+import models
+from models.models_fleet import BookingStatus, VehicleStatus
+from services import fleet_geo, fleet_positions
+
+# Simulated time per step
+SIMULATION_STEP_SECONDS = 60
+
+
+async def load_journeys(db: AsyncSession, tenant_id: uuid.UUID, vehicle_ids: Optional[List[uuid.UUID]] = None) -> Dict:
+    """Active journeys as column arrays (vehicle, booking, current and destination coordinates)."""
+    query = select(
+        models.VehicleBooking.id,
+        models.VehicleBooking.vehicle_id,
+        models.VehicleBooking.origin_lat,
+        models.VehicleBooking.origin_lng,
+        models.VehicleBooking.destination_lat,
+        models.VehicleBooking.destination_lng
+    ).where(
+        models.VehicleBooking.tenant_id == tenant_id,
+        models.VehicleBooking.status == BookingStatus.IN_USE,
+        models.VehicleBooking.destination_lat.isnot(None),
+        models.VehicleBooking.destination_lng.isnot(None)
+    )
+    if vehicle_ids is not None:
+        query = query.where(models.VehicleBooking.vehicle_id.in_(vehicle_ids))
+    bookings = (await db.execute(query)).all()
+
+    positions = await fleet_positions.get_positions(
+        tenant_id, None if vehicle_ids is None else [str(v) for v in vehicle_ids]
+    )
+    by_vehicle = {p["vehicle_id"]: p for p in positions}
+
+    rows = []
+    for booking_id, vehicle_id, origin_lat, origin_lng, dest_lat, dest_lng in bookings:
+        position = by_vehicle.get(str(vehicle_id))
+        if position:
+            lat, lng, heading = position["lat"], position["lng"], position.get("heading")
+        elif origin_lat is not None and origin_lng is not None:
+            lat, lng, heading = origin_lat, origin_lng, None
+        else:
+            continue
+        rows.append((str(booking_id), str(vehicle_id), lat, lng, dest_lat, dest_lng, heading))
+
+    return {
+        "booking_id": [r[0] for r in rows],
+        "vehicle_id": [r[1] for r in rows],
+        "lat": np.array([r[2] for r in rows], dtype=np.float64),
+        "lng": np.array([r[3] for r in rows], dtype=np.float64),
+        "dest_lat": np.array([r[4] for r in rows], dtype=np.float64),
+        "dest_lng": np.array([r[5] for r in rows], dtype=np.float64),
+        "heading": [r[6] for r in rows]
+    }
+
+
+def simulated_speeds(vehicle_ids: List[str]) -> np.ndarray:
+    """Stable pseudo-random cruising speed (50-89 km/h) per vehicle, the same in every process."""
+    return np.array([50 + uuid.UUID(str(vehicle_id)).int % 40 for vehicle_id in vehicle_ids], dtype=np.float64)
+
+
+def step_journeys(journeys: Dict, speed_kmh: np.ndarray, seconds: float) -> Dict[str, np.ndarray]:
+    """Move every journey speed x seconds toward its destination; snap arrivals to it."""
+    remaining_km = fleet_geo.haversine_km(journeys["lat"], journeys["lng"], journeys["dest_lat"], journeys["dest_lng"])
+    step_km = speed_kmh * seconds / 3600
+    arrived = remaining_km <= np.maximum(step_km, fleet_geo.ARRIVAL_RADIUS_KM)
+    fraction = np.where(arrived, 1.0, step_km / np.where(arrived, 1.0, remaining_km))
+    return {
+        "lat": journeys["lat"] + (journeys["dest_lat"] - journeys["lat"]) * fraction,
+        "lng": journeys["lng"] + (journeys["dest_lng"] - journeys["lng"]) * fraction,
+        "arrived": arrived
+    }
+
+
+async def complete_arrivals(db: AsyncSession, tenant_id: uuid.UUID, booking_ids: List[str], vehicle_ids: List[str]):
+    """Close arrived bookings and free their vehicles in one transaction."""
+    now = datetime.utcnow()
+    await db.execute(
+        update(models.VehicleBooking)
+        .where(
+            models.VehicleBooking.tenant_id == tenant_id,
+            models.VehicleBooking.id.in_([uuid.UUID(b) for b in booking_ids])
+        )
+        .values(status=BookingStatus.COMPLETED, actual_end=now, updated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(
+        update(models.Vehicle)
+        .where(
+            models.Vehicle.tenant_id == tenant_id,
+            models.Vehicle.id.in_([uuid.UUID(v) for v in vehicle_ids])
+        )
+        .values(status=VehicleStatus.AVAILABLE, updated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+
+async def simulate_step(
+    db: AsyncSession,
+    tenant_id: uuid.UUID,
+    user_id: uuid.UUID,
+    step_seconds: float = SIMULATION_STEP_SECONDS,
+    vehicle_ids: Optional[List[uuid.UUID]] = None
+) -> List[Dict]:
+    """One simulation step for all (or the given) active journeys. Returns the moved vehicles."""
+    journeys = await load_journeys(db, tenant_id, vehicle_ids)
+    if not journeys["vehicle_id"]:
+        return []
+
+    speeds = simulated_speeds(journeys["vehicle_id"])
+    moved = step_journeys(journeys, speeds, step_seconds)
+    arrived = moved["arrived"].tolist()
+    lats, lngs, speeds = moved["lat"].tolist(), moved["lng"].tolist(), speeds.tolist()
+
+    pings = [
+        {
+            "vehicle_id": vehicle_id,
+            "booking_id": journeys["booking_id"][i],
+            "lat": lats[i],
+            "lng": lngs[i],
+            "speed": 0 if arrived[i] else speeds[i],
+            "heading": journeys["heading"][i],
+            "updated_by": user_id
+        }
+        for i, vehicle_id in enumerate(journeys["vehicle_id"])
+    ]
+    await fleet_positions.record_positions(tenant_id, pings)
+
+    arrived_idx = [i for i, done in enumerate(arrived) if done]
+    if arrived_idx:
+        await complete_arrivals(
+            db, tenant_id,
+            [journeys["booking_id"][i] for i in arrived_idx],
+            [journeys["vehicle_id"][i] for i in arrived_idx]
+        )
+
+    return [
+        {
+            "vehicle_id": p["vehicle_id"],
+            "booking_id": p["booking_id"],
+            "new_lat": p["lat"],
+            "new_lng": p["lng"],
+            "arrived": arrived[i]
+        }
+        for i, p in enumerate(pings)
+    ]
@@ -0,0 +1,149 @@
+"""
+Preventive Maintenance Scheduler
+
+In-process loop that turns due MaintenanceSchedules into work orders.
+
+Every SCHEDULER_INTERVAL seconds each API replica tries to become the
+leader for one tick with pg_try_advisory_xact_lock; the others skip the
+tick. The leader, in one transaction:
+
+1. Reads due schedules (is_active, next_due <= today + lead days) in
+   batches, served by ix_maintenance_schedules_tenant_active_due.
+2. Bulk-inserts one SCHEDULED work order per schedule, numbered after the
+   tenant's current work order count.
+3. Advances next_due of the whole batch past today with ONE UPDATE
+   (missed cycles are skipped, not backfilled).
+
+Because the insert and the advance commit together, a crash never produces
+a work order without moving its schedule, or the other way round.
+"""
+from typing import Dict, List, Optional
+import asyncio
+import logging
+import os
+import uuid
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import cast, func, insert, literal, update, Date, Integer
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from database import SessionLocal
+from models.models_maintenance import MaintenanceWorkOrder, MaintenanceSchedule
+from services.maintenance_stats import invalidate_maintenance_stats
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_ENABLED = os.getenv("MAINTENANCE_SCHEDULER_ENABLED", "true").lower() == "true"
+SCHEDULER_INTERVAL = int(os.getenv("MAINTENANCE_SCHEDULER_INTERVAL", "300"))
+# Create work orders this many days before the due date
+SCHEDULER_LEAD_DAYS = int(os.getenv("MAINTENANCE_SCHEDULER_LEAD_DAYS", "0"))
+SCHEDULER_BATCH = 500
+LEADER_LOCK = "maintenance-scheduler"
+
+
+def _interval_days():
+    return func.greatest(func.coalesce(MaintenanceSchedule.interval_days, 30), 1)
+
+
+def build_work_orders(schedules: List, wo_counts: Dict[uuid.UUID, int], now: datetime) -> List[Dict]:
+    """Work order rows for due schedules; wo_counts (tenant -> count) is advanced in place."""
+    rows = []
+    for schedule in schedules:
+        wo_counts[schedule.tenant_id] = wo_counts.get(schedule.tenant_id, 0) + 1
+        rows.append({
+            "id": uuid.uuid4(),
+            "tenant_id": schedule.tenant_id,
+            "code": f"WO-{now.year}-{wo_counts[schedule.tenant_id]:04d}",
+            "asset_id": schedule.asset_id,
+            "type_id": schedule.type_id,
+            "title": schedule.title,
+            "description": schedule.description,
+            "priority": "MEDIUM",
+            "status": "SCHEDULED",
+            "scheduled_date": datetime.combine(schedule.next_due, time()),
+            "notes": f"Generated from preventive schedule {schedule.id}",
+            "created_at": now,
+            "updated_at": now
+        })
+    return rows
+
+
+async def generate_due_work_orders(
+    db: AsyncSession,
+    today: Optional[date] = None,
+    tenant_id: Optional[uuid.UUID] = None
+) -> Optional[Dict[uuid.UUID, int]]:
+    """
+    One scheduler tick. Commits.
+
+    Returns:
+        Work orders created per tenant, or None when another replica holds the tick.
+    """
+    today = today or date.today()
+    horizon = today + timedelta(days=SCHEDULER_LEAD_DAYS)
+    now = datetime.utcnow()
+
+    acquired = await db.scalar(select(func.pg_try_advisory_xact_lock(func.hashtext(LEADER_LOCK))))
+    if not acquired:
+        return None
+
+    created: Dict[uuid.UUID, int] = {}
+    wo_counts: Optional[Dict[uuid.UUID, int]] = None
+    while True:
+        query = select(MaintenanceSchedule).where(
+            MaintenanceSchedule.is_active == True,
+            MaintenanceSchedule.next_due <= horizon
+        )
+        if tenant_id:
+            query = query.where(MaintenanceSchedule.tenant_id == tenant_id)
+        result = await db.execute(query.order_by(MaintenanceSchedule.next_due).limit(SCHEDULER_BATCH))
+        schedules = result.scalars().all()
+        if not schedules:
+            break
+
+        if wo_counts is None:
+            # Work order numbering continues from each tenant's current count
+            counts = select(MaintenanceWorkOrder.tenant_id, func.count()).group_by(MaintenanceWorkOrder.tenant_id)
+            if tenant_id:
+                counts = counts.where(MaintenanceWorkOrder.tenant_id == tenant_id)
+            wo_counts = dict((await db.execute(counts)).all())
+
+        await db.execute(insert(MaintenanceWorkOrder), build_work_orders(schedules, wo_counts, now))
+
+        # Advance every schedule of the batch past the horizon in one statement
+        interval = _interval_days()
+        overdue_days = literal(horizon, Date) - MaintenanceSchedule.next_due
+        await db.execute(
+            update(MaintenanceSchedule)
+            .where(MaintenanceSchedule.id.in_([s.id for s in schedules]))
+            .values(
+                next_due=MaintenanceSchedule.next_due + cast(interval * (overdue_days // interval + 1), Integer),
+                updated_at=now
+            )
+            .execution_options(synchronize_session=False)
+        )
+        for schedule in schedules:
+            created[schedule.tenant_id] = created.get(schedule.tenant_id, 0) + 1
+        if len(schedules) < SCHEDULER_BATCH:
+            break
+
+    await db.commit()
+    for tenant in created:
+        await invalidate_maintenance_stats(tenant)
+    if created:
+        logger.info(f"Maintenance scheduler created {sum(created.values())} work orders for {len(created)} tenants")
+    return created
+
+
+async def run_maintenance_scheduler():
+    """Background loop started from the app lifespan."""
+    if not SCHEDULER_ENABLED:
+        return
+    while True:
+        try:
+            async with SessionLocal() as db:
+                await generate_due_work_orders(db)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Maintenance scheduler tick failed: {e}")
+        await asyncio.sleep(SCHEDULER_INTERVAL)
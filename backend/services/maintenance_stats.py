@@ -0,0 +1,94 @@
+"""
+Maintenance Stats Service
+
+Dashboard counters for the maintenance module. Every counter of a table is
+one COUNT(*) FILTER (WHERE ...) column, so the whole dashboard is three
+single-row queries (assets, work orders with this month's costs, schedules).
+The three run concurrently, each on its own pooled connection - an
+AsyncSession cannot run statements in parallel.
+
+The result is cached per (tenant, date) for STATS_TTL seconds and dropped
+by invalidate_maintenance_stats() on asset, work order, cost and schedule
+writes.
+"""
+from typing import Dict
+import asyncio
+import uuid
+from datetime import date
+from sqlalchemy import func, select
+from database import SessionLocal
+from models.models_maintenance import Asset, MaintenanceWorkOrder, MaintenanceWorkOrderCost, MaintenanceSchedule
+from connections.redis_utils import tenant_cache_get, tenant_cache_set, cache_delete, tenant_key
+
+STATS_TTL = 60
+
+
+def _cache_key(day: date) -> str:
+    return f"maintenance:stats:{day.isoformat()}"
+
+
+def asset_counts_query(tenant_id: uuid.UUID):
+    return select(
+        func.count().label("total_assets"),
+        func.count().filter(Asset.status == 'OPERATIONAL').label("operational_assets"),
+        func.count().filter(Asset.status == 'UNDER_MAINTENANCE').label("under_maintenance"),
+        func.count().filter(Asset.status == 'BROKEN').label("broken_assets")
+    ).where(Asset.tenant_id == tenant_id)
+
+
+def work_order_counts_query(tenant_id: uuid.UUID, today: date):
+    first_of_month = today.replace(day=1)
+    costs = select(func.coalesce(func.sum(MaintenanceWorkOrderCost.amount), 0)).join(MaintenanceWorkOrder).where(
+        MaintenanceWorkOrder.tenant_id == tenant_id,
+        MaintenanceWorkOrderCost.date >= first_of_month
+    ).scalar_subquery()
+    return select(
+        func.count().label("total_work_orders"),
+        func.count().filter(MaintenanceWorkOrder.status.in_(['DRAFT', 'SCHEDULED'])).label("pending_work_orders"),
+        func.count().filter(MaintenanceWorkOrder.status == 'IN_PROGRESS').label("in_progress_work_orders"),
+        func.count().filter(
+            MaintenanceWorkOrder.status == 'COMPLETED',
+            MaintenanceWorkOrder.completed_at >= first_of_month
+        ).label("completed_this_month"),
+        costs.label("total_costs_this_month")
+    ).where(MaintenanceWorkOrder.tenant_id == tenant_id)
+
+
+def schedule_counts_query(tenant_id: uuid.UUID, today: date):
+    return select(
+        func.count().filter(MaintenanceSchedule.next_due < today).label("overdue_schedules"),
+        func.count().filter(MaintenanceSchedule.next_due >= today).label("upcoming_schedules")
+    ).where(MaintenanceSchedule.tenant_id == tenant_id, MaintenanceSchedule.is_active == True)
+
+
+async def _fetch_row(query) -> Dict:
+    async with SessionLocal() as db:
+        result = await db.execute(query)
+        return dict(result.one()._mapping)
+
+
+async def compute_maintenance_stats(tenant_id: uuid.UUID, today: date) -> Dict:
+    rows = await asyncio.gather(
+        _fetch_row(asset_counts_query(tenant_id)),
+        _fetch_row(work_order_counts_query(tenant_id, today)),
+        _fetch_row(schedule_counts_query(tenant_id, today))
+    )
+    stats = {}
+    for row in rows:
+        stats.update(row)
+    stats["total_costs_this_month"] = float(stats["total_costs_this_month"] or 0)
+    return stats
+
+
+async def get_maintenance_stats(tenant_id: uuid.UUID) -> Dict:
+    """Today's maintenance counters, from cache when fresh."""
+    today = date.today()
+    stats = await tenant_cache_get(str(tenant_id), _cache_key(today))
+    if stats is None:
+        stats = await compute_maintenance_stats(tenant_id, today)
+        await tenant_cache_set(str(tenant_id), _cache_key(today), stats, STATS_TTL)
+    return stats
+
+
+async def invalidate_maintenance_stats(tenant_id: uuid.UUID):
+    await cache_delete(tenant_key(str(tenant_id), _cache_key(date.today())))
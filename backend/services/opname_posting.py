@@ -0,0 +1,263 @@
+"""
+Opname Posting Service
+
+Set-based counterparts of the per-detail loops in the opname workflow:
+
+- recalculate_opname_totals: one UPDATE ... FROM (aggregate) refreshes the
+  counted / variance totals of an opname from its detail rows.
+- apply_count_batch: writes hundreds of counted lines from a handheld in one
+  UPDATE ... FROM (VALUES ...), idempotent through client sequence numbers
+  and ordered across devices by the client count time.
+- post_opname_adjustments: applies every counted variance in the caller's
+  transaction with one batch UPDATE and one INSERT ... SELECT of stock
+  movements, so a 10k-line opname posts in a few statements and is either
+  fully applied or not at all.
+"""
+from typing import Dict, List, Optional
+import uuid
+from datetime import datetime, timezone
+from sqlalchemy import DateTime, Float, Integer, String, func, update, case, cast, literal, and_, or_, values, column
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+import models
+from models import models_opname
+from services.batch_stock import InsufficientStockError
+
+
+async def recalculate_opname_totals(db: AsyncSession, opname_id: uuid.UUID) -> Dict:
+    """Recompute counted_items, items_with_variance and value totals in one statement. Does not commit."""
+    detail = models_opname.StockOpnameDetail
+    opname = models_opname.StockOpname
+
+    totals = select(
+        func.count(detail.counted_qty).label("counted_items"),
+        func.count().filter(detail.variance != 0).label("items_with_variance"),
+        func.coalesce(func.sum(detail.counted_value), 0).label("total_counted_value"),
+        func.coalesce(func.sum(detail.variance_value), 0).label("total_variance_value")
+    ).where(detail.opname_id == opname_id).subquery()
+
+    stmt = update(opname)\
+        .where(opname.id == opname_id)\
+        .values(
+            counted_items=totals.c.counted_items,
+            items_with_variance=totals.c.items_with_variance,
+            total_counted_value=totals.c.total_counted_value,
+            total_variance_value=totals.c.total_variance_value
+        )\
+        .returning(
+            opname.total_items, opname.counted_items, opname.items_with_variance,
+            opname.total_counted_value, opname.total_variance_value
+        )\
+        .execution_options(synchronize_session=False)
+    row = (await db.execute(stmt)).one()
+    return dict(row._mapping)
+
+
+def _parse_variance_reason(reason: Optional[str]) -> Optional[str]:
+    """Map a client reason to the stored enum name (unknown reasons become OTHER)."""
+    if not reason:
+        return None
+    try:
+        return models_opname.VarianceReason(reason).name
+    except ValueError:
+        return models_opname.VarianceReason.OTHER.name
+
+
+def _client_time(value: datetime) -> datetime:
+    """A client count time as naive UTC like the rest of the schema."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+async def apply_count_batch(
+    db: AsyncSession,
+    opname_id: uuid.UUID,
+    device_id: str,
+    items: List[Dict],
+    user_id: uuid.UUID
+) -> Dict:
+    """
+    Apply counted lines from one device in a single UPDATE. Does not commit.
+
+    A line is written only if it is newer than what that device already
+    synced for the detail (count_seq), so replaying a batch after a dropped
+    connection is a no-op. Over a count from another device it is written
+    only if it was counted later (counted_at); an older line is reported as
+    a conflict so a delayed queue cannot overwrite a newer count.
+
+    Args:
+        items: [{"detail_id", "counted_qty", "seq", "counted_at", "variance_reason", "variance_notes"}]
+
+    Returns:
+        Dict with applied, skipped, conflicts (detail ids), acknowledged_seq.
+    """
+    # Keep only the newest submission per detail within the batch
+    latest: Dict[uuid.UUID, Dict] = {}
+    for item in items:
+        current = latest.get(item["detail_id"])
+        if current is None or item["seq"] > current["seq"]:
+            latest[item["detail_id"]] = item
+    if not latest:
+        return {"applied": 0, "skipped": 0, "conflicts": [], "acknowledged_seq": None}
+
+    detail = models_opname.StockOpnameDetail
+    submitted = values(
+        column("detail_id", UUID(as_uuid=True)),
+        column("counted_qty", Float),
+        column("seq", Integer),
+        column("counted_at", DateTime),
+        column("variance_reason", String),
+        column("variance_notes", String),
+        name="submitted"
+    ).data([
+        (
+            item["detail_id"],
+            float(item["counted_qty"]),
+            item["seq"],
+            _client_time(item["counted_at"]),
+            _parse_variance_reason(item.get("variance_reason")),
+            item.get("variance_notes")
+        )
+        for item in latest.values()
+    ])
+
+    variance = submitted.c.counted_qty - detail.system_qty
+    stmt = update(detail)\
+        .where(
+            detail.id == submitted.c.detail_id,
+            detail.opname_id == opname_id,
+            or_(
+                and_(
+                    detail.count_device == device_id,
+                    or_(detail.count_seq.is_(None), detail.count_seq < submitted.c.seq)
+                ),
+                and_(
+                    detail.count_device.is_distinct_from(device_id),
+                    or_(detail.counted_at.is_(None), detail.counted_at < submitted.c.counted_at)
+                )
+            )
+        )\
+        .values(
+            counted_qty=submitted.c.counted_qty,
+            variance=variance,
+            counted_value=submitted.c.counted_qty * detail.unit_cost,
+            variance_value=variance * detail.unit_cost,
+            variance_reason=func.coalesce(
+                cast(submitted.c.variance_reason, detail.variance_reason.type), detail.variance_reason
+            ),
+            variance_notes=submitted.c.variance_notes,
+            counted_at=submitted.c.counted_at,
+            counted_by=user_id,
+            count_device=device_id,
+            count_seq=submitted.c.seq
+        )\
+        .returning(detail.id)\
+        .execution_options(synchronize_session=False)
+    applied = {row.id for row in (await db.execute(stmt)).all()}
+
+    # Lines not written although this device has not synced them: another device counted later
+    conflicts = []
+    unapplied = [detail_id for detail_id in latest if detail_id not in applied]
+    if unapplied:
+        result = await db.execute(
+            select(detail.id).where(
+                detail.id.in_(unapplied),
+                detail.opname_id == opname_id,
+                detail.count_device.is_distinct_from(device_id)
+            )
+        )
+        conflicts = list(result.scalars().all())
+
+    return {
+        "applied": len(applied),
+        "skipped": len(items) - len(applied),
+        "conflicts": conflicts,
+        "acknowledged_seq": max(item["seq"] for item in items)
+    }
+
+
+def _variance_conditions(opname_id: uuid.UUID):
+    detail = models_opname.StockOpnameDetail
+    return [
+        detail.opname_id == opname_id,
+        detail.counted_qty.isnot(None),
+        detail.counted_qty != detail.system_qty,
+        detail.batch_id.isnot(None)
+    ]
+
+
+async def post_opname_adjustments(db: AsyncSession, opname_id: uuid.UUID, user_id: uuid.UUID) -> List[Dict]:
+    """
+    Apply all counted variances of an opname. Does not commit.
+
+    Variances are applied as deltas (counted - system) so movements recorded
+    after the snapshot are kept.
+
+    Raises:
+        InsufficientStockError: a batch would go negative - roll back.
+
+    Returns:
+        The inserted stock movements (for publish_movements after commit).
+    """
+    detail = models_opname.StockOpnameDetail
+    batch = models.InventoryBatch
+    movement = models.StockMovement
+
+    # 1. One UPDATE for every affected batch
+    deltas = select(
+        detail.batch_id.label("batch_id"),
+        func.sum(detail.counted_qty - detail.system_qty).label("diff")
+    ).where(*_variance_conditions(opname_id))\
+     .group_by(detail.batch_id)\
+     .subquery()
+
+    stmt = update(batch)\
+        .where(batch.id == deltas.c.batch_id)\
+        .values(
+            quantity_on_hand=batch.quantity_on_hand + deltas.c.diff,
+            version=batch.version + 1
+        )\
+        .returning(batch.id, batch.quantity_on_hand)\
+        .execution_options(synchronize_session=False)
+    updated = (await db.execute(stmt)).all()
+
+    negative = [str(row.id) for row in updated if row.quantity_on_hand < 0]
+    if negative:
+        raise InsufficientStockError(
+            f"Stock changed since the snapshot and cannot absorb the variance for batch(es): {', '.join(negative)}"
+        )
+
+    # 2. One INSERT ... SELECT for every movement
+    reason_note = case(
+        {reason: reason.value for reason in models_opname.VarianceReason},
+        value=detail.variance_reason,
+        else_="Adjustment"
+    )
+    source = select(
+        func.gen_random_uuid(),
+        detail.tenant_id,
+        detail.product_id,
+        detail.batch_id,
+        batch.location_id,
+        detail.counted_qty - detail.system_qty,
+        literal(models.MovementType.ADJUSTMENT, movement.movement_type.type),
+        literal(str(opname_id)),
+        literal(user_id, movement.created_by.type),
+        literal(datetime.utcnow(), movement.timestamp.type),
+        func.concat("Stock Opname Adjustment - ", reason_note)
+    ).join(batch, batch.id == detail.batch_id)\
+     .where(and_(*_variance_conditions(opname_id)))
+
+    stmt = movement.__table__.insert()\
+        .from_select([
+            "id", "tenant_id", "product_id", "batch_id", "location_id", "quantity_change",
+            "movement_type", "reference_id", "created_by", "timestamp", "notes"
+        ], source)\
+        .returning(
+            movement.product_id, movement.location_id, movement.quantity_change,
+            movement.movement_type, movement.reference_id
+        )
+    result = await db.execute(stmt)
+    return [dict(row._mapping) for row in result.all()]
@@ -0,0 +1,189 @@
+"""
+Opname Snapshot Service
+
+Snapshots the stock of a warehouse into StockOpnameDetail rows set-based:
+one INSERT ... SELECT joins batches, locations and products, and the opname
+totals are updated from the inserted rows in the same statement:
+
+    WITH inserted AS (
+        INSERT INTO stock_opname_details (...)
+        SELECT ... FROM inventory_batches
+        JOIN locations ... JOIN products ...
+        RETURNING system_value
+    )
+    UPDATE stock_opnames
+       SET total_items = total_items + (SELECT count(*) FROM inserted),
+           total_system_value = total_system_value + (SELECT sum(system_value) FROM inserted)
+
+Very large warehouses are snapshotted by a background job that runs the same
+statement per chunk of locations and reports progress through Redis. If a
+chunk fails, the rows of the chunks already committed are deleted again so
+a retry starts from an empty opname.
+"""
+from typing import List, Optional
+import uuid
+import logging
+from sqlalchemy import Float, delete, func, update, literal, false
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+import models
+from models import models_opname
+from database import SessionLocal
+from connections.redis_utils import cache_get, cache_set
+
+logger = logging.getLogger(__name__)
+
+# Above this many batches the snapshot runs as a background job
+SNAPSHOT_SYNC_LIMIT = 5000
+# Locations per INSERT ... SELECT in the background job
+SNAPSHOT_LOCATION_CHUNK = 50
+PROGRESS_TTL = 86400
+
+
+def _progress_key(opname_id: uuid.UUID) -> str:
+    return f"opname:snapshot:{opname_id}"
+
+
+def _batch_filter(warehouse_id: uuid.UUID, tenant_id: uuid.UUID, location_ids: Optional[List[uuid.UUID]] = None):
+    batch = models.InventoryBatch
+    conditions = [
+        models.Location.warehouse_id == warehouse_id,
+        batch.tenant_id == tenant_id,
+        batch.quantity_on_hand > 0
+    ]
+    if location_ids is not None:
+        conditions.append(batch.location_id.in_(location_ids))
+    return conditions
+
+
+def build_snapshot_statement(
+    opname_id: uuid.UUID,
+    warehouse_id: uuid.UUID,
+    tenant_id: uuid.UUID,
+    location_ids: Optional[List[uuid.UUID]] = None
+):
+    """INSERT ... SELECT of the detail rows plus the opname totals update, as one statement."""
+    batch = models.InventoryBatch
+    detail = models_opname.StockOpnameDetail
+    opname = models_opname.StockOpname
+    unit_cost = func.coalesce(models.Product.standard_cost, 0)
+
+    source = select(
+        func.gen_random_uuid(),
+        literal(tenant_id),
+        literal(opname_id),
+        batch.product_id,
+        batch.id,
+        batch.location_id,
+        batch.quantity_on_hand,
+        unit_cost,
+        batch.quantity_on_hand * unit_cost,
+        literal(0.0, Float),
+        literal(0.0, Float),
+        literal(0.0, Float),
+        false()
+    )\
+        .join(models.Location, batch.location_id == models.Location.id)\
+        .join(models.Product, batch.product_id == models.Product.id)\
+        .where(*_batch_filter(warehouse_id, tenant_id, location_ids))
+
+    inserted = detail.__table__.insert()\
+        .from_select([
+            "id", "tenant_id", "opname_id", "product_id", "batch_id", "location_id",
+            "system_qty", "unit_cost", "system_value",
+            "variance", "counted_value", "variance_value", "needs_recount"
+        ], source)\
+        .returning(detail.system_value)\
+        .cte("inserted")
+
+    return update(opname)\
+        .where(opname.id == opname_id)\
+        .values(
+            total_items=func.coalesce(opname.total_items, 0)
+            + select(func.count()).select_from(inserted).scalar_subquery(),
+            total_system_value=func.coalesce(opname.total_system_value, 0)
+            + select(func.coalesce(func.sum(inserted.c.system_value), 0)).scalar_subquery()
+        )\
+        .returning(opname.total_items)\
+        .execution_options(synchronize_session=False)
+
+
+async def count_snapshot_batches(db: AsyncSession, warehouse_id: uuid.UUID, tenant_id: uuid.UUID) -> int:
+    query = select(func.count(models.InventoryBatch.id))\
+        .join(models.Location, models.InventoryBatch.location_id == models.Location.id)\
+        .where(*_batch_filter(warehouse_id, tenant_id))
+    return (await db.execute(query)).scalar() or 0
+
+
+async def snapshot_stock(db: AsyncSession, opname_id: uuid.UUID, warehouse_id: uuid.UUID, tenant_id: uuid.UUID) -> int:
+    """Snapshot the whole warehouse in one statement. Does not commit. Returns total_items."""
+    result = await db.execute(build_snapshot_statement(opname_id, warehouse_id, tenant_id))
+    return result.scalar() or 0
+
+
+async def get_snapshot_progress(opname_id: uuid.UUID) -> Optional[dict]:
+    return await cache_get(_progress_key(opname_id))
+
+
+async def run_snapshot_job(opname_id: uuid.UUID, warehouse_id: uuid.UUID, tenant_id: uuid.UUID, expected_items: int):
+    """
+    Background job: snapshot location chunk by location chunk, committing and
+    publishing progress after each chunk, then open the opname for counting.
+    On failure the opname is cancelled and its detail rows removed.
+    """
+    key = _progress_key(opname_id)
+    progress = {"status": "running", "processed_items": 0, "total_items": expected_items, "percent": 0}
+    await cache_set(key, progress, PROGRESS_TTL)
+
+    async with SessionLocal() as db:
+        try:
+            result = await db.execute(
+                select(models.Location.id)
+                .where(models.Location.warehouse_id == warehouse_id)
+                .order_by(models.Location.id)
+            )
+            location_ids = result.scalars().all()
+
+            processed = 0
+            for i in range(0, len(location_ids), SNAPSHOT_LOCATION_CHUNK):
+                chunk = location_ids[i:i + SNAPSHOT_LOCATION_CHUNK]
+                result = await db.execute(build_snapshot_statement(opname_id, warehouse_id, tenant_id, chunk))
+                processed = result.scalar() or 0
+                await db.commit()
+
+                progress.update(
+                    processed_items=processed,
+                    percent=min(99, round(processed * 100 / expected_items)) if expected_items else 99
+                )
+                await cache_set(key, progress, PROGRESS_TTL)
+
+            await db.execute(
+                update(models_opname.StockOpname)
+                .where(models_opname.StockOpname.id == opname_id)
+                .values(status=models_opname.OpnameStatus.SCHEDULED.value)
+            )
+            await db.commit()
+            progress.update(status="completed", processed_items=processed, total_items=processed, percent=100)
+        except Exception as e:
+            logger.error(f"Opname snapshot {opname_id} failed: {e}")
+            await db.rollback()
+            # Drop the chunks committed before the failure
+            await db.execute(
+                delete(models_opname.StockOpnameDetail)
+                .where(models_opname.StockOpnameDetail.opname_id == opname_id)
+                .execution_options(synchronize_session=False)
+            )
+            await db.execute(
+                update(models_opname.StockOpname)
+                .where(models_opname.StockOpname.id == opname_id)
+                .values(
+                    status=models_opname.OpnameStatus.CANCELLED.value,
+                    total_items=0,
+                    total_system_value=0,
+                    notes=func.concat(func.coalesce(models_opname.StockOpname.notes, ""), f"\n[Snapshot failed] {e}")
+                )
+            )
+            await db.commit()
+            progress.update(status="failed", error=str(e))
+
+    await cache_set(key, progress, PROGRESS_TTL)
@@ -0,0 +1,284 @@
+"""
+Payroll Engine
+
+Set-based payroll calculation for a period:
+
+1. load_payroll_inputs: ONE query returns every active employee with the
+   overtime of the period already summed (LEFT JOIN on a grouped attendance
+   subquery) instead of one SUM query per employee.
+2. compute_payslips: the tenant's compiled payroll rules (services.payroll_rules)
+   evaluate gross, allowances, tax and BPJS for all employees at once on
+   NumPy arrays.
+3. store_payslips: bulk INSERT of the payslips in chunks, reporting progress
+   to Redis, inside the caller's transaction.
+
+Large runs go through run_payroll_job (background task). A period can only
+have one run in progress: the run row is created in DRAFT status under a
+row lock on the period, and is moved to CALCULATED (or CANCELLED on failure)
+when the job ends. A DRAFT run whose job died with the process (no running
+progress after PAYROLL_START_GRACE, or older than PAYROLL_RUN_TIMEOUT) is
+cancelled by the next start_payroll_run of the period.
+"""
+from typing import Dict, List, Optional
+import logging
+import uuid
+from datetime import datetime
+import numpy as np
+from sqlalchemy import func, insert, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from models import models_hr
+from database import SessionLocal
+from connections.redis_utils import cache_get, cache_set
+from services.payroll_rules import PayrollPlan, compile_rules, get_payroll_plan
+
+logger = logging.getLogger(__name__)
+
+# Above this many employees the run goes to a background job
+PAYROLL_SYNC_LIMIT = 2000
+# Payslips per INSERT (and per progress update)
+PAYSLIP_CHUNK = 1000
+PROGRESS_TTL = 86400
+# Seconds a queued run may go without job progress, and a run may stay in DRAFT at most
+PAYROLL_START_GRACE = 300
+PAYROLL_RUN_TIMEOUT = 3600
+
+
+class PayrollInProgressError(Exception):
+    """Raised when the period already has a run being calculated."""
+
+
+def _progress_key(run_id: uuid.UUID) -> str:
+    return f"payroll:run:{run_id}"
+
+
+async def load_payroll_inputs(db: AsyncSession, tenant_id: uuid.UUID, period) -> Dict[str, np.ndarray]:
+    """Active employees with their base salary and period overtime, in one query."""
+    attendance = models_hr.Attendance
+    employee = models_hr.Employee
+
+    overtime = select(
+        attendance.employee_id,
+        func.sum(attendance.overtime_minutes).label("overtime_minutes")
+    ).where(
+        attendance.tenant_id == tenant_id,
+        attendance.date >= period.start_date,
+        attendance.date <= period.end_date
+    ).group_by(attendance.employee_id).subquery()
+
+    result = await db.execute(
+        select(
+            employee.id,
+            func.coalesce(employee.base_salary, 0),
+            func.coalesce(overtime.c.overtime_minutes, 0),
+            employee.marital_status
+        ).outerjoin(overtime, overtime.c.employee_id == employee.id)
+        .where(
+            employee.tenant_id == tenant_id,
+            employee.status == models_hr.EmployeeStatus.ACTIVE
+        ).order_by(employee.id)
+    )
+    rows = result.all()
+    return {
+        "employee_id": np.array([row[0] for row in rows], dtype=object),
+        "base_salary": np.array([row[1] for row in rows], dtype=np.float64),
+        "overtime_minutes": np.array([row[2] for row in rows], dtype=np.float64),
+        "marital_status": np.array([row[3].value if row[3] else None for row in rows], dtype=object)
+    }
+
+
+async def count_payroll_employees(db: AsyncSession, tenant_id: uuid.UUID) -> int:
+    result = await db.execute(
+        select(func.count(models_hr.Employee.id)).where(
+            models_hr.Employee.tenant_id == tenant_id,
+            models_hr.Employee.status == models_hr.EmployeeStatus.ACTIVE
+        )
+    )
+    return result.scalar() or 0
+
+
+def compute_payslips(inputs: Dict[str, np.ndarray], plan: Optional[PayrollPlan] = None) -> Dict[str, np.ndarray]:
+    """Vectorized salary components for every employee (unrounded)."""
+    return (plan or compile_rules(None)).evaluate(inputs)
+
+
+def payroll_totals(payslips: Dict[str, np.ndarray]) -> Dict:
+    return {
+        "total_employees": int(len(payslips["employee_id"])),
+        "total_gross": round(float(payslips["gross_pay"].sum()), 2),
+        "total_deductions": round(float(payslips["total_deductions"].sum()), 2),
+        "total_net": round(float(payslips["net_pay"].sum()), 2)
+    }
+
+
+MONEY_FIELDS = [
+    "base_salary", "allowances", "overtime_pay", "gross_pay", "tax_deduction",
+    "bpjs_kes_deduction", "bpjs_tk_deduction", "other_deductions", "total_deductions", "net_pay"
+]
+
+
+def _breakdown(detail: Optional[Dict[str, np.ndarray]], count: int) -> List[Optional[Dict]]:
+    """{code: array} -> one {code: amount} dict per employee (None when there are no components)."""
+    if not detail:
+        return [None] * count
+    codes = list(detail.keys())
+    values = np.round(np.column_stack([detail[code] for code in codes]), 2).tolist()
+    return [dict(zip(codes, row)) for row in values]
+
+
+def payslip_rows(payslips: Dict[str, np.ndarray]) -> List[Dict]:
+    """Column arrays -> list of row dicts with amounts rounded to cents."""
+    count = len(payslips["employee_id"])
+    columns = {field: np.round(payslips[field], 2).tolist() for field in MONEY_FIELDS}
+    overtime_minutes = payslips["overtime_minutes"].tolist()
+    earnings = _breakdown(payslips.get("allowance_detail"), count)
+    deductions = _breakdown(payslips.get("contribution_detail"), count)
+    return [
+        {
+            "employee_id": employee_id,
+            "overtime_minutes": int(overtime_minutes[i]),
+            "earnings_detail": earnings[i],
+            "deductions_detail": deductions[i],
+            **{field: columns[field][i] for field in MONEY_FIELDS}
+        }
+        for i, employee_id in enumerate(payslips["employee_id"].tolist())
+    ]
+
+
+async def preview_payroll(db: AsyncSession, tenant_id: uuid.UUID, period) -> Dict:
+    """Dry run: calculate the period without writing anything."""
+    plan = await get_payroll_plan(db, tenant_id)
+    payslips = compute_payslips(await load_payroll_inputs(db, tenant_id, period), plan)
+    return {**payroll_totals(payslips), "payslips": payslip_rows(payslips)}
+
+
+def run_is_stale(run_date: Optional[datetime], progress: Optional[Dict], now: datetime) -> bool:
+    """Whether a DRAFT run has no live job: no running progress past the grace period, or timed out."""
+    age = (now - run_date).total_seconds() if run_date else PAYROLL_RUN_TIMEOUT
+    if age >= PAYROLL_RUN_TIMEOUT:
+        return True
+    running = progress is not None and progress.get("status") == "running"
+    return not running and age >= PAYROLL_START_GRACE
+
+
+async def start_payroll_run(db: AsyncSession, tenant_id: uuid.UUID, period_id: uuid.UUID, user_id: uuid.UUID):
+    """
+    Lock the period and create its run in DRAFT (calculating) status. Does not commit.
+
+    Stale DRAFT runs of the period (see run_is_stale) are cancelled first.
+
+    Raises:
+        PayrollInProgressError: another run of the period is still calculating.
+    """
+    await db.execute(
+        select(models_hr.PayrollPeriod.id)
+        .where(models_hr.PayrollPeriod.id == period_id)
+        .with_for_update()
+    )
+    result = await db.execute(
+        select(models_hr.PayrollRun).where(
+            models_hr.PayrollRun.payroll_period_id == period_id,
+            models_hr.PayrollRun.status == models_hr.PayrollStatus.DRAFT
+        )
+    )
+    now = datetime.utcnow()
+    for draft in result.scalars().all():
+        progress = await get_payroll_progress(draft.id)
+        if not run_is_stale(draft.run_date, progress, now):
+            raise PayrollInProgressError("A payroll run for this period is already in progress")
+        logger.warning(f"Cancelling stale payroll run {draft.id}")
+        draft.status = models_hr.PayrollStatus.CANCELLED
+        draft.notes = "Calculation abandoned: the job stopped before finishing"
+        await cache_set(
+            _progress_key(draft.id),
+            {**(progress or {"processed": 0, "total": 0, "percent": 0}), "status": "failed", "error": draft.notes},
+            PROGRESS_TTL
+        )
+
+    payroll_run = models_hr.PayrollRun(
+        tenant_id=tenant_id,
+        payroll_period_id=period_id,
+        run_by=user_id,
+        status=models_hr.PayrollStatus.DRAFT
+    )
+    db.add(payroll_run)
+    await db.flush()
+    return payroll_run
+
+
+async def store_payslips(
+    db: AsyncSession,
+    tenant_id: uuid.UUID,
+    run_id: uuid.UUID,
+    payslips: Dict[str, np.ndarray],
+    progress: Optional[Dict] = None
+) -> Dict:
+    """Bulk-insert payslips and set the run totals / CALCULATED status. Does not commit."""
+    rows = payslip_rows(payslips)
+    now = datetime.utcnow()
+    for row in rows:
+        row.pop("overtime_minutes")
+        row.update(id=uuid.uuid4(), tenant_id=tenant_id, payroll_run_id=run_id, created_at=now)
+
+    for i in range(0, len(rows), PAYSLIP_CHUNK):
+        await db.execute(insert(models_hr.Payslip), rows[i:i + PAYSLIP_CHUNK])
+        if progress is not None:
+            processed = min(i + PAYSLIP_CHUNK, len(rows))
+            progress.update(processed=processed, percent=min(99, round(processed * 100 / len(rows))))
+            await cache_set(_progress_key(run_id), progress, PROGRESS_TTL)
+
+    totals = payroll_totals(payslips)
+    result = await db.execute(
+        update(models_hr.PayrollRun)
+        .where(
+            models_hr.PayrollRun.id == run_id,
+            models_hr.PayrollRun.status == models_hr.PayrollStatus.DRAFT
+        )
+        .values(status=models_hr.PayrollStatus.CALCULATED, **totals)
+    )
+    # Cancelled as stale while this job was still running: roll the payslips back
+    if result.rowcount == 0:
+        raise PayrollInProgressError(f"Payroll run {run_id} is no longer in progress")
+    return totals
+
+
+async def calculate_payroll(db: AsyncSession, tenant_id: uuid.UUID, run_id: uuid.UUID, period, progress: Optional[Dict] = None) -> Dict:
+    """Load, compute and store a run in the caller's transaction."""
+    plan = await get_payroll_plan(db, tenant_id)
+    payslips = compute_payslips(await load_payroll_inputs(db, tenant_id, period), plan)
+    if progress is not None:
+        progress["total"] = int(len(payslips["employee_id"]))
+    return await store_payslips(db, tenant_id, run_id, payslips, progress)
+
+
+async def get_payroll_progress(run_id: uuid.UUID) -> Optional[dict]:
+    return await cache_get(_progress_key(run_id))
+
+
+async def run_payroll_job(run_id: uuid.UUID, period_id: uuid.UUID, tenant_id: uuid.UUID):
+    """
+    Background job: calculate the whole run in one transaction (all payslips
+    or none), publishing progress after every inserted chunk.
+    """
+    key = _progress_key(run_id)
+    progress = {"status": "running", "processed": 0, "total": 0, "percent": 0}
+    await cache_set(key, progress, PROGRESS_TTL)
+
+    async with SessionLocal() as db:
+        try:
+            period = await db.get(models_hr.PayrollPeriod, period_id)
+            totals = await calculate_payroll(db, tenant_id, run_id, period, progress)
+            await db.commit()
+            progress.update(status="completed", processed=totals["total_employees"], percent=100)
+        except Exception as e:
+            logger.error(f"Payroll run {run_id} failed: {e}")
+            await db.rollback()
+            await db.execute(
+                update(models_hr.PayrollRun)
+                .where(models_hr.PayrollRun.id == run_id)
+                .values(status=models_hr.PayrollStatus.CANCELLED, notes=f"Calculation failed: {e}")
+            )
+            await db.commit()
+            progress.update(status="failed", error=str(e))
+
+    await cache_set(key, progress, PROGRESS_TTL)
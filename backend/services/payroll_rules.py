@@ -0,0 +1,211 @@
+"""
+Payroll Rule Engine
+
+Per-tenant payroll rules (PayrollRuleSet.rules, JSON) are compiled ONCE into
+a PayrollPlan: bracket tables become NumPy arrays, allowances and
+contributions become coefficient vectors. The plan is then evaluated on the
+arrays of all employees at once - a progressive PPh21 table costs one
+searchsorted over the whole payroll, not a loop per employee.
+
+Rules format (every key optional, defaults reproduce the original flat
+calculation: 173 h/month, overtime x1.5, 5% tax, BPJS 1% + 2% of base):
+
+    {
+      "hours_per_month": 173,
+      "overtime_multiplier": 1.5,
+      "allowances": [
+        {"code": "TRANSPORT", "amount": 500000},          # fixed
+        {"code": "POSITION", "rate": 0.05, "taxable": true}  # % of base
+      ],
+      "tax": {
+        "type": "progressive",                             # or "flat" with "rate"
+        "annualize": true,
+        "ptkp": {"default": 54000000, "MARRIED": 58500000},  # by marital status
+        "brackets": [
+          {"up_to": 60000000, "rate": 0.05},
+          {"up_to": 250000000, "rate": 0.15},
+          {"up_to": null, "rate": 0.25}
+        ]
+      },
+      "contributions": [
+        {"code": "BPJS_KES", "rate": 0.01, "cap": 12000000, "field": "bpjs_kes_deduction"},
+        {"code": "BPJS_TK", "rate": 0.02, "field": "bpjs_tk_deduction"}
+      ]
+    }
+
+Compiled plans are cached per (tenant, rule set version).
+"""
+from typing import Dict, List, Optional, Tuple
+import uuid
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from models import models_hr
+
+DEFAULT_RULES: Dict = {
+    "hours_per_month": 173,
+    "overtime_multiplier": 1.5,
+    "allowances": [],
+    "tax": {"type": "flat", "rate": 0.05},
+    "contributions": [
+        {"code": "BPJS_KES", "rate": 0.01, "field": "bpjs_kes_deduction"},
+        {"code": "BPJS_TK", "rate": 0.02, "field": "bpjs_tk_deduction"}
+    ]
+}
+
+CONTRIBUTION_FIELDS = {"bpjs_kes_deduction", "bpjs_tk_deduction", "other_deductions"}
+CONTRIBUTION_BASES = {"base_salary", "gross_pay"}
+
+
+class PayrollPlan:
+    """A compiled rule set; evaluate() works on whole-payroll arrays."""
+
+    def __init__(self, rules: Dict):
+        rules = {**DEFAULT_RULES, **(rules or {})}
+
+        self.hours_per_month = float(rules["hours_per_month"])
+        self.overtime_multiplier = float(rules["overtime_multiplier"])
+        if self.hours_per_month <= 0:
+            raise ValueError("hours_per_month must be positive")
+
+        # Allowances: gross += fixed + rate * base, split by taxability
+        self.allowance_codes = [a["code"] for a in rules["allowances"]]
+        self.allowance_amounts = np.array([float(a.get("amount") or 0) for a in rules["allowances"]], dtype=np.float64)
+        self.allowance_rates = np.array([float(a.get("rate") or 0) for a in rules["allowances"]], dtype=np.float64)
+        self.allowance_taxable = np.array([bool(a.get("taxable", True)) for a in rules["allowances"]], dtype=bool)
+
+        # Tax
+        tax = rules["tax"]
+        self.tax_type = tax.get("type", "flat")
+        if self.tax_type == "flat":
+            self.tax_rate = float(tax.get("rate", 0))
+        elif self.tax_type == "progressive":
+            self.annualize = bool(tax.get("annualize", True))
+            self.ptkp = {key: float(value) for key, value in (tax.get("ptkp") or {}).items()}
+            self.bracket_lowers, self.bracket_rates, self.bracket_base_tax = self._compile_brackets(tax.get("brackets") or [])
+        else:
+            raise ValueError(f"Unknown tax type {self.tax_type}")
+
+        # Contributions: rate * min(basis, cap)
+        self.contributions = []
+        for c in rules["contributions"]:
+            field = c.get("field", "other_deductions")
+            basis = c.get("basis", "base_salary")
+            if field not in CONTRIBUTION_FIELDS:
+                raise ValueError(f"Unknown contribution field {field}")
+            if basis not in CONTRIBUTION_BASES:
+                raise ValueError(f"Unknown contribution basis {basis}")
+            cap = c.get("cap")
+            self.contributions.append((c["code"], float(c["rate"]), float(cap) if cap else np.inf, basis, field))
+
+    @staticmethod
+    def _compile_brackets(brackets: List[Dict]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Bracket list -> lower bounds, rates and the tax accumulated below each bound."""
+        if not brackets:
+            raise ValueError("Progressive tax needs at least one bracket")
+        lowers, rates = [0.0], []
+        for i, bracket in enumerate(brackets):
+            rates.append(float(bracket["rate"]))
+            up_to = bracket.get("up_to")
+            if up_to is None:
+                if i != len(brackets) - 1:
+                    raise ValueError("Only the last bracket may be open-ended")
+                break
+            if float(up_to) <= lowers[-1]:
+                raise ValueError("Bracket limits must increase")
+            lowers.append(float(up_to))
+        if brackets[-1].get("up_to") is not None:
+            rates.append(rates[-1])  # above the last limit keep the last rate
+
+        lowers = np.array(lowers)
+        rates = np.array(rates)
+        base_tax = np.concatenate([[0.0], np.cumsum(np.diff(lowers) * rates[:-1])])
+        return lowers, rates, base_tax
+
+    def progressive_tax(self, taxable: np.ndarray) -> np.ndarray:
+        taxable = np.maximum(taxable, 0)
+        idx = np.searchsorted(self.bracket_lowers, taxable, side="right") - 1
+        return self.bracket_base_tax[idx] + (taxable - self.bracket_lowers[idx]) * self.bracket_rates[idx]
+
+    def _ptkp(self, marital_status: np.ndarray) -> np.ndarray:
+        default = self.ptkp.get("default", 0.0)
+        return np.array([self.ptkp.get(status, default) for status in marital_status], dtype=np.float64)
+
+    def evaluate(self, inputs: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Salary components for every employee (unrounded arrays)."""
+        base_salary = inputs["base_salary"]
+        count = len(base_salary)
+
+        overtime_pay = inputs["overtime_minutes"] / 60 * (base_salary / self.hours_per_month) * self.overtime_multiplier
+
+        # employees x allowances matrix
+        allowance_matrix = self.allowance_amounts[None, :] + base_salary[:, None] * self.allowance_rates[None, :]
+        allowances = allowance_matrix.sum(axis=1)
+        taxable_allowances = allowance_matrix[:, self.allowance_taxable].sum(axis=1)
+        gross_pay = base_salary + overtime_pay + allowances
+
+        deductions = {field: np.zeros(count) for field in CONTRIBUTION_FIELDS}
+        contribution_detail = {}
+        for code, rate, cap, basis, field in self.contributions:
+            source = base_salary if basis == "base_salary" else gross_pay
+            amount = np.minimum(source, cap) * rate
+            deductions[field] += amount
+            contribution_detail[code] = amount
+
+        taxable_gross = base_salary + overtime_pay + taxable_allowances
+        if self.tax_type == "flat":
+            tax_deduction = taxable_gross * self.tax_rate
+        else:
+            ptkp = self._ptkp(inputs.get("marital_status", np.full(count, None, dtype=object)))
+            if self.annualize:
+                tax_deduction = self.progressive_tax(taxable_gross * 12 - ptkp) / 12
+            else:
+                tax_deduction = self.progressive_tax(taxable_gross - ptkp)
+
+        total_deductions = tax_deduction + sum(deductions.values())
+        return {
+            "employee_id": inputs["employee_id"],
+            "base_salary": base_salary,
+            "overtime_minutes": inputs["overtime_minutes"],
+            "overtime_pay": overtime_pay,
+            "allowances": allowances,
+            "gross_pay": gross_pay,
+            "tax_deduction": tax_deduction,
+            "bpjs_kes_deduction": deductions["bpjs_kes_deduction"],
+            "bpjs_tk_deduction": deductions["bpjs_tk_deduction"],
+            "other_deductions": deductions["other_deductions"],
+            "total_deductions": total_deductions,
+            "net_pay": gross_pay - total_deductions,
+            "allowance_detail": dict(zip(self.allowance_codes, allowance_matrix.T)),
+            "contribution_detail": contribution_detail
+        }
+
+
+def compile_rules(rules: Optional[Dict]) -> PayrollPlan:
+    """Validate and compile a rule set. Raises ValueError / KeyError on bad rules."""
+    return PayrollPlan(rules)
+
+
+_plans: Dict[Tuple[uuid.UUID, int], PayrollPlan] = {}
+_default_plan = compile_rules(None)
+
+
+async def get_payroll_plan(db: AsyncSession, tenant_id: uuid.UUID) -> PayrollPlan:
+    """The tenant's compiled plan (defaults when no rule set is stored)."""
+    result = await db.execute(
+        select(models_hr.PayrollRuleSet.version, models_hr.PayrollRuleSet.rules)
+        .where(models_hr.PayrollRuleSet.tenant_id == tenant_id)
+    )
+    row = result.one_or_none()
+    if row is None:
+        return _default_plan
+
+    key = (tenant_id, row.version)
+    plan = _plans.get(key)
+    if plan is None:
+        plan = compile_rules(row.rules)
+        # Keep one compiled version per tenant
+        for stale in [k for k in _plans if k[0] == tenant_id]:
+            del _plans[stale]
+        _plans[key] = plan
+    return plan
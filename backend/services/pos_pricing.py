@@ -0,0 +1,260 @@
+"""
+POS Pricing Engine
+
+Prices, promos and the sales tax of a tenant are loaded ONCE into an
+in-memory PricingSnapshot (three queries) and reused by every sale:
+
+- prices: active products -> suggested_selling_price (the client's unit
+  price is ignored).
+- promos: active promos by code. A promo applies to the whole order or,
+  with product_ids, to the matching lines only. Non-stackable promos cannot
+  be combined with any other promo.
+- tax: the tenant's active sales tax code (models_tax.TaxCode of type PPN,
+  VAT, GST or SALES_TAX); DEFAULT_TAX_RATE when none is configured.
+
+evaluate() prices all lines of a sale with all of its promos in one pass on
+NumPy arrays (promos x lines scope matrix); discounts are spread over the
+lines in scope and tax is computed per line on the discounted amount.
+
+Snapshots are versioned per tenant: invalidate_pricing() bumps a Redis
+counter on promo, product or tax changes and every worker reloads when the
+counter moves (one Redis GET per sale, no DB reads). Snapshots older than
+SNAPSHOT_MAX_AGE seconds are reloaded anyway, which also bounds staleness
+while Redis is down.
+"""
+from typing import Dict, List, Optional, Tuple
+import logging
+import time
+import uuid
+from datetime import datetime
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from models.models_manufacturing import Product
+from models.models_pos import Promo, PromoType
+from models.models_tax import TaxCode, TaxType
+from connections.redis_utils import get_redis, tenant_key
+
+logger = logging.getLogger(__name__)
+
+# Used when the tenant has no active sales tax code
+DEFAULT_TAX_RATE = 10.0
+SNAPSHOT_MAX_AGE = 300
+# Preference order when a tenant has several active sales tax codes
+SALES_TAX_TYPES = [TaxType.PPN, TaxType.VAT, TaxType.GST, TaxType.SALES_TAX]
+VERSION_KEY = "pos:pricing:version"
+
+
+class PricingError(ValueError):
+    """Raised for a sale that cannot be priced (unknown product, invalid promo)."""
+
+
+def _money(value: float) -> float:
+    return round(float(value), 2)
+
+
+class PricingSnapshot:
+    """One tenant's prices, promos and sales tax at a given version."""
+
+    def __init__(self, version, products: List, promos: List, tax_codes: List):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.prices: Dict[str, Tuple[str, float]] = {
+            str(p.id): (p.name, float(p.suggested_selling_price or 0)) for p in products
+        }
+        self.promos: Dict[str, Dict] = {
+            p.code.upper(): {
+                "id": p.id,
+                "code": p.code,
+                "name": p.name,
+                "promo_type": p.promo_type or PromoType.PERCENTAGE,
+                "value": float(p.value or 0),
+                "min_order": float(p.min_order or 0),
+                "max_discount": p.max_discount,
+                "start_date": p.start_date,
+                "end_date": p.end_date,
+                "is_stackable": bool(p.is_stackable),
+                "product_ids": {str(pid) for pid in p.product_ids} if p.product_ids else None,
+                "usage_limit": p.usage_limit,
+                "per_customer_limit": p.per_customer_limit
+            }
+            for p in promos
+        }
+        self.tax = self._sales_tax(tax_codes)
+
+    @staticmethod
+    def _sales_tax(tax_codes: List) -> Dict:
+        ranked = sorted(
+            (t for t in tax_codes if t.tax_type in SALES_TAX_TYPES),
+            key=lambda t: (SALES_TAX_TYPES.index(t.tax_type), t.code)
+        )
+        if not ranked:
+            return {"id": None, "code": None, "rate": DEFAULT_TAX_RATE}
+        return {"id": ranked[0].id, "code": ranked[0].code, "rate": float(ranked[0].rate)}
+
+    def promo_error(self, promo: Optional[Dict], order_amount: float, now: datetime) -> Optional[str]:
+        """Why the promo cannot be used for this order amount (None when it can)."""
+        if promo is None:
+            return "Promo code not found"
+        if promo["start_date"] and promo["start_date"] > now:
+            return "Promo not yet active"
+        if promo["end_date"] and promo["end_date"] < now:
+            return "Promo has expired"
+        if order_amount < promo["min_order"]:
+            return f"Minimum order amount is {promo['min_order']}"
+        return None
+
+    def resolve_promos(self, codes: List[str], order_amount: float, now: datetime) -> List[Dict]:
+        promos = []
+        for code in dict.fromkeys(c.upper() for c in codes if c):
+            promo = self.promos.get(code)
+            error = self.promo_error(promo, order_amount, now)
+            if error:
+                raise PricingError(f"{code}: {error}")
+            promos.append(promo)
+        if len(promos) > 1:
+            exclusive = [p["code"] for p in promos if not p["is_stackable"]]
+            if exclusive:
+                raise PricingError(f"Promo {exclusive[0]} cannot be combined with other promos")
+        return promos
+
+    def evaluate(self, items: List[Dict], promo_codes: Optional[List[str]] = None, now: Optional[datetime] = None) -> Dict:
+        """
+        Price a sale.
+
+        Args:
+            items: [{"product_id", "quantity"}]
+            promo_codes: codes entered at the till (any order, duplicates ignored)
+
+        Returns:
+            Dict with lines (name, unit_price, subtotal, discount, tax per line),
+            subtotal, discount, tax, total, promos and tax_code.
+        """
+        if not items:
+            raise PricingError("Transaction has no items")
+        now = now or datetime.utcnow()
+        product_ids = [str(item["product_id"]) for item in items]
+        missing = [pid for pid in product_ids if pid not in self.prices]
+        if missing:
+            raise PricingError(f"Unknown or inactive product {missing[0]}")
+
+        quantity = np.array([float(item["quantity"]) for item in items], dtype=np.float64)
+        unit_price = np.array([self.prices[pid][1] for pid in product_ids], dtype=np.float64)
+        line_subtotal = quantity * unit_price
+        subtotal = float(line_subtotal.sum())
+
+        promos = self.resolve_promos(promo_codes or [], subtotal, now)
+        line_discount = np.zeros(len(items))
+        promo_discounts = []
+        if promos:
+            # promos x lines: 1 where the promo applies to the line
+            scope = np.array([
+                [1.0 if p["product_ids"] is None or pid in p["product_ids"] else 0.0 for pid in product_ids]
+                for p in promos
+            ]).reshape(len(promos), len(items))
+            base = scope @ line_subtotal
+            value = np.array([p["value"] for p in promos])
+            kind = [p["promo_type"] for p in promos]
+            is_fixed = np.array([k == PromoType.FIXED for k in kind])
+            is_percentage = np.array([k == PromoType.PERCENTAGE for k in kind])
+            is_free_item = np.array([k == PromoType.FREE_ITEM for k in kind])
+            cap = np.array([p["max_discount"] if p["max_discount"] else np.inf for p in promos])
+
+            # FREE_ITEM: `value` units (at least one) of the cheapest line in scope
+            in_scope_price = np.where(scope > 0, unit_price[None, :], np.inf)
+            cheapest = in_scope_price.argmin(axis=1)
+            free_units = np.minimum(np.maximum(value, 1), quantity[cheapest])
+            free_value = np.where(np.isfinite(in_scope_price.min(axis=1)), unit_price[cheapest] * free_units, 0)
+
+            discount = np.where(is_fixed, value, 0) + np.where(is_percentage, base * value / 100, 0) \
+                + np.where(is_free_item, free_value, 0)
+            discount = np.minimum(np.minimum(discount, cap), base)
+
+            # Spread each promo over its lines in proportion to their subtotal
+            share = np.divide(scope * line_subtotal[None, :], base[:, None],
+                              out=np.zeros_like(scope), where=base[:, None] > 0)
+            line_discount = np.minimum((discount[:, None] * share).sum(axis=0), line_subtotal)
+            promo_discounts = discount.tolist()
+
+        rate = self.tax["rate"] / 100
+        line_tax = (line_subtotal - line_discount) * rate
+        discount_total = float(line_discount.sum())
+        tax_total = float(line_tax.sum())
+
+        subtotals, discounts, taxes = line_subtotal.tolist(), line_discount.tolist(), line_tax.tolist()
+        lines = [
+            {
+                "product_id": product_ids[i],
+                "name": self.prices[product_ids[i]][0],
+                "quantity": float(quantity[i]),
+                "unit_price": float(unit_price[i]),
+                "subtotal": _money(subtotals[i]),
+                "discount": _money(discounts[i]),
+                "tax": _money(taxes[i])
+            }
+            for i in range(len(items))
+        ]
+        return {
+            "lines": lines,
+            "subtotal": _money(subtotal),
+            "discount": _money(discount_total),
+            "tax": _money(tax_total),
+            "total": _money(subtotal - discount_total + tax_total),
+            "promos": [
+                {
+                    "id": p["id"], "code": p["code"], "name": p["name"], "discount": _money(d),
+                    "usage_limit": p["usage_limit"], "per_customer_limit": p["per_customer_limit"]
+                }
+                for p, d in zip(promos, promo_discounts)
+            ],
+            "tax_code": self.tax["code"],
+            "tax_rate": self.tax["rate"]
+        }
+
+
+async def load_snapshot(db: AsyncSession, tenant_id: uuid.UUID, version=None) -> PricingSnapshot:
+    products = await db.execute(
+        select(Product).where(Product.tenant_id == tenant_id, Product.is_active == True)
+    )
+    promos = await db.execute(
+        select(Promo).where(Promo.tenant_id == tenant_id, Promo.is_active == True)
+    )
+    tax_codes = await db.execute(
+        select(TaxCode).where(TaxCode.tenant_id == tenant_id, TaxCode.is_active == True)
+    )
+    return PricingSnapshot(version, products.scalars().all(), promos.scalars().all(), tax_codes.scalars().all())
+
+
+_snapshots: Dict[uuid.UUID, PricingSnapshot] = {}
+
+
+async def _current_version(tenant_id: uuid.UUID) -> Optional[str]:
+    try:
+        r = await get_redis()
+        return await r.get(tenant_key(str(tenant_id), VERSION_KEY)) or "0"
+    except Exception as e:
+        logger.error(f"Pricing version not available: {e}")
+        return None
+
+
+async def get_pricing_snapshot(db: AsyncSession, tenant_id: uuid.UUID) -> PricingSnapshot:
+    """The tenant's snapshot, reloaded when its version moved or it is too old."""
+    version = await _current_version(tenant_id)
+    snapshot = _snapshots.get(tenant_id)
+    fresh = snapshot is not None and time.monotonic() - snapshot.loaded_at <= SNAPSHOT_MAX_AGE
+    # Without Redis (version None) a snapshot is kept until it ages out
+    if fresh and (version is None or snapshot.version == version):
+        return snapshot
+    snapshot = await load_snapshot(db, tenant_id, version)
+    _snapshots[tenant_id] = snapshot
+    return snapshot
+
+
+async def invalidate_pricing(tenant_id: uuid.UUID):
+    """Call after committing promo, product price or tax code changes."""
+    _snapshots.pop(tenant_id, None)
+    try:
+        r = await get_redis()
+        await r.incr(tenant_key(str(tenant_id), VERSION_KEY))
+    except Exception as e:
+        logger.error(f"Pricing version bump failed: {e}")
@@ -0,0 +1,253 @@
+"""
+POS Offline Sync
+
+Sales recorded by a POS client while offline are uploaded as one batch and
+written in one database transaction:
+
+1. Idempotency: every sale carries a client-generated UUID, used as the
+   POSTransaction id. Sales already stored (one IN query) or repeated in the
+   batch are reported as duplicates and skipped; the tenant's sync advisory
+   lock keeps two uploads of the same queue from both inserting it.
+2. Pricing: all sales are priced from the tenant's pricing snapshot at their
+   own sale time, and their promos are redeemed (promo_redemptions). A sale
+   that cannot be priced or redeemed is rejected with its error; the rest
+   of the batch is still synced.
+3. Balances: the batch's customers are read once (locked), sales are
+   applied in sale order against running balances, then every customer is
+   updated with one UPDATE of the aggregated deltas.
+4. Writes: transactions, balance logs and promo redemptions are inserted
+   with one bulk INSERT each.
+"""
+from typing import Dict, List, Optional, Tuple
+import logging
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from sqlalchemy import case, func, insert, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from models.models_pos import (
+    POSTransaction, TransactionLog, PromoRedemption,
+    PaymentMethod, TransactionStatus, TransactionLogType
+)
+from models.models_sales import Customer
+from services import pos_pricing, promo_redemptions
+
+logger = logging.getLogger(__name__)
+
+MAX_SYNC_BATCH = 1000
+# Payments that add the amount to the customer's balance
+RECEIVED_PAYMENTS = [PaymentMethod.CASH, PaymentMethod.QRIS, PaymentMethod.STRIPE]
+
+
+def payment_method(value: Optional[str]) -> PaymentMethod:
+    try:
+        return PaymentMethod[(value or "CASH").upper()]
+    except KeyError:
+        return PaymentMethod.CASH
+
+
+def balance_entry(method: PaymentMethod, total: float, balance: float) -> Tuple[Optional[str], Optional[TransactionLogType], float]:
+    """(error, log type, balance after) of a customer's sale; no log type when the balance is unchanged."""
+    if method == PaymentMethod.CREDIT:
+        if balance < total:
+            return "Insufficient credit balance", None, balance
+        return None, TransactionLogType.DEBIT, balance - total
+    if method in RECEIVED_PAYMENTS:
+        return None, TransactionLogType.CREDIT, balance + total
+    return None, None, balance
+
+
+def sale_time(sale: Dict, now: datetime) -> datetime:
+    """When the sale happened, as naive UTC like the rest of the schema."""
+    created_at = sale.get("created_at")
+    if created_at is None:
+        return now
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return created_at
+
+
+def _result(sale: Dict, status: str, error: Optional[str] = None, total: Optional[float] = None) -> Dict:
+    return {"client_id": sale["client_id"], "status": status, "total": total, "error": error}
+
+
+async def _release(reservations: List):
+    for reservation in reservations:
+        await reservation.release()
+
+
+async def _existing_ids(db: AsyncSession, tenant_id: uuid.UUID, ids: List[uuid.UUID]) -> set:
+    """Ids already synced by this tenant; a collision with another tenant fails on the primary key."""
+    if not ids:
+        return set()
+    result = await db.execute(
+        select(POSTransaction.id).where(POSTransaction.tenant_id == tenant_id, POSTransaction.id.in_(ids))
+    )
+    return set(result.scalars().all())
+
+
+async def _lock_balances(db: AsyncSession, tenant_id: uuid.UUID, customer_ids: List[uuid.UUID]) -> Dict[uuid.UUID, float]:
+    if not customer_ids:
+        return {}
+    result = await db.execute(
+        select(Customer.id, Customer.current_balance)
+        .where(Customer.tenant_id == tenant_id, Customer.id.in_(customer_ids))
+        .with_for_update()
+    )
+    return {customer_id: balance or 0 for customer_id, balance in result.all()}
+
+
+def balance_update_statement(deltas: Dict[uuid.UUID, float]):
+    """One UPDATE adding each customer's net balance change."""
+    return (
+        update(Customer)
+        .where(Customer.id.in_(list(deltas)))
+        .values(current_balance=func.coalesce(Customer.current_balance, 0) + case(deltas, value=Customer.id, else_=0))
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def sync_transactions(db: AsyncSession, tenant_id: uuid.UUID, user_id: uuid.UUID, sales: List[Dict]) -> Dict:
+    """
+    Store a batch of offline sales (commits).
+
+    Args:
+        sales: [{"client_id", "customer_id", "items", "promo_code", "promo_codes",
+                 "payment_method", "payment_reference", "created_at"}]
+
+    Returns:
+        Dict with synced, duplicates and rejected counts and one result per sale
+        in batch order (status synced, duplicate or rejected).
+    """
+    now = datetime.utcnow()
+    await db.execute(select(func.pg_advisory_xact_lock(func.hashtext(f"pos_sync:{tenant_id}"))))
+    existing = await _existing_ids(db, tenant_id, [sale["client_id"] for sale in sales])
+
+    results: Dict[int, Dict] = {}
+    pending: List[Tuple[int, Dict, Dict]] = []
+    seen = set()
+    snapshot = await pos_pricing.get_pricing_snapshot(db, tenant_id)
+    for index, sale in enumerate(sales):
+        if sale["client_id"] in existing or sale["client_id"] in seen:
+            results[index] = _result(sale, "duplicate")
+            continue
+        seen.add(sale["client_id"])
+        codes = ([sale["promo_code"]] if sale.get("promo_code") else []) + (sale.get("promo_codes") or [])
+        try:
+            pricing = snapshot.evaluate(sale["items"], codes, now=sale_time(sale, now))
+        except pos_pricing.PricingError as e:
+            results[index] = _result(sale, "rejected", str(e))
+            continue
+        pending.append((index, sale, pricing))
+
+    balances = await _lock_balances(db, tenant_id, list({s["customer_id"] for _, s, _ in pending if s.get("customer_id")}))
+    opening = dict(balances)
+    transactions, logs, redemptions, reservations = [], [], [], []
+    # Promo uses of this batch per (promo, customer); their rows are inserted at the end
+    batch_uses: Dict[Tuple[uuid.UUID, uuid.UUID], int] = defaultdict(int)
+    # Balances are applied in the order the sales happened
+    pending.sort(key=lambda entry: (sale_time(entry[1], now), entry[0]))
+    for index, sale, pricing in pending:
+        method = payment_method(sale.get("payment_method"))
+        customer_id = sale.get("customer_id")
+        total = pricing["total"]
+        if customer_id and customer_id not in balances:
+            results[index] = _result(sale, "rejected", "Customer not found")
+            continue
+        if method == PaymentMethod.CREDIT and not customer_id:
+            results[index] = _result(sale, "rejected", "Customer required for credit payment")
+            continue
+        log_type, balance_after = None, None
+        if customer_id:
+            error, log_type, balance_after = balance_entry(method, total, balances[customer_id])
+            if error:
+                results[index] = _result(sale, "rejected", error)
+                continue
+        reservation = None
+        if pricing["promos"]:
+            try:
+                # A savepoint undoes database-path promo updates of a rejected sale
+                async with db.begin_nested():
+                    reservation = await promo_redemptions.reserve(
+                        db, tenant_id, pricing["promos"], customer_id, batch_uses
+                    )
+            except promo_redemptions.RedemptionError as e:
+                results[index] = _result(sale, "rejected", str(e))
+                continue
+            except Exception:
+                await _release(reservations)
+                raise
+            reservations.append(reservation)
+            if customer_id:
+                for promo_id in reservation.promo_ids:
+                    batch_uses[(promo_id, customer_id)] += 1
+
+        created_at = sale_time(sale, now)
+        transaction_id = sale["client_id"]
+        transactions.append({
+            "id": transaction_id,
+            "tenant_id": tenant_id,
+            "customer_id": customer_id,
+            "cashier_id": user_id,
+            "items": pricing["lines"],
+            "subtotal": pricing["subtotal"],
+            "discount": pricing["discount"],
+            "tax": pricing["tax"],
+            "total": total,
+            "payment_method": method,
+            "payment_reference": sale.get("payment_reference"),
+            "promo_id": pricing["promos"][0]["id"] if pricing["promos"] else None,
+            "promo_code": ",".join(p["code"] for p in pricing["promos"]) or None,
+            "status": TransactionStatus.COMPLETED,
+            "created_at": created_at,
+            "updated_at": now
+        })
+        if reservation:
+            redemptions += promo_redemptions.redemption_rows(reservation, transaction_id)
+        if log_type:
+            logs.append({
+                "id": uuid.uuid4(),
+                "tenant_id": tenant_id,
+                "customer_id": customer_id,
+                "transaction_id": transaction_id,
+                "log_type": log_type,
+                "amount": total,
+                "balance_before": balances[customer_id],
+                "balance_after": balance_after,
+                "description": (
+                    f"POS Purchase - {len(sale['items'])} items" if log_type == TransactionLogType.DEBIT
+                    else f"Payment received via {method.value}"
+                ),
+                "created_at": created_at,
+                "created_by": user_id
+            })
+            balances[customer_id] = balance_after
+        results[index] = _result(sale, "synced", total=total)
+
+    deltas = {
+        customer_id: balance - opening[customer_id]
+        for customer_id, balance in balances.items() if balance != opening[customer_id]
+    }
+    try:
+        if transactions:
+            await db.execute(insert(POSTransaction), transactions)
+        if logs:
+            await db.execute(insert(TransactionLog), logs)
+        if redemptions:
+            await db.execute(insert(PromoRedemption), redemptions)
+        if deltas:
+            await db.execute(balance_update_statement(deltas))
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        await _release(reservations)
+        raise
+
+    ordered = [results[index] for index in range(len(sales))]
+    return {
+        "synced": sum(1 for r in ordered if r["status"] == "synced"),
+        "duplicates": sum(1 for r in ordered if r["status"] == "duplicate"),
+        "rejected": sum(1 for r in ordered if r["status"] == "rejected"),
+        "results": ordered
+    }
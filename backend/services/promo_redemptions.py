@@ -0,0 +1,435 @@
+"""
+Promo Redemptions
+
+Promo usage limits are enforced without locking the promo row:
+
+1. Redis holds, per promo, a usage counter and a per-customer hash of
+   redemptions. One Lua script checks usage_limit and per_customer_limit of
+   every promo of a sale and increments them all, or none, atomically - a
+   flash sale cannot overshoot and concurrent sales never wait on each other.
+2. Counters are seeded on first use (or after they expire, COUNTER_TTL
+   after the last redemption) from pos_promos.usage_count plus unflushed
+   deltas, and from pos_promo_redemptions for the customers.
+3. Each redemption is also a PromoRedemption row inserted in the sale's own
+   transaction (the durable per-customer index). release() gives the
+   reservation back when that transaction fails.
+4. usage_count is not updated per sale: increments are accumulated in a
+   pending hash and flushed every USAGE_FLUSH_INTERVAL seconds with one
+   UPDATE for all promos.
+
+When Redis is unavailable, redemption falls back to a conditional UPDATE of
+usage_count (limit checked in the same statement) and a count of the
+customer's redemptions under an advisory lock. The promos redeemed that way
+are remembered and their Redis counters deleted once Redis is reachable
+again (first Redis reservation, then every flush for FALLBACK_SETTLE
+seconds so uses still uncommitted at the first reseed are picked up), so
+they reseed from the database with the fallback uses included.
+
+Bound of the fallback check: pending deltas live in Redis and cannot be
+read while it is down, so usage_count may lag the real uses by the
+redemptions of the last USAGE_FLUSH_INTERVAL seconds before the outage
+(plus any flush still failing); a promo can exceed usage_limit by at most
+that many uses, and only while Redis is unavailable.
+"""
+from typing import Dict, List, Optional, Set, Tuple
+import asyncio
+import logging
+import os
+import time
+import uuid
+from redis.exceptions import ResponseError
+from sqlalchemy import case, func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from models.models_pos import Promo, PromoRedemption
+from connections.redis_utils import get_redis, tenant_key
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+COUNTER_TTL = 24 * 3600
+USAGE_FLUSH_INTERVAL = float(os.getenv("POS_PROMO_FLUSH_INTERVAL", "5"))
+PENDING_KEY = "pos:promo:usage:pending"
+WALK_IN = ""
+# Seconds after its last fallback use that a promo's counters keep being reseeded
+FALLBACK_SETTLE = 60
+
+# KEYS: uses_1, customers_1, ..., uses_n, customers_n, pending
+# ARGV: customer, ttl, then promo_id, usage_limit, per_customer_limit per promo (0 = no limit)
+# Returns {0} when reserved, {-1} when a counter must be seeded, {-2, i} / {-3, i}
+# when promo i reached its usage limit / the customer's limit.
+RESERVE_SCRIPT = """
+local n = (#KEYS - 1) / 2
+local customer = ARGV[1]
+local ttl = tonumber(ARGV[2])
+for i = 1, n do
+    if redis.call('EXISTS', KEYS[2 * i - 1]) == 0 then
+        return {-1}
+    end
+end
+for i = 1, n do
+    local limit = tonumber(ARGV[3 * i + 1])
+    local per_customer = tonumber(ARGV[3 * i + 2])
+    if limit > 0 and tonumber(redis.call('GET', KEYS[2 * i - 1])) >= limit then
+        return {-2, i}
+    end
+    if customer ~= '' and per_customer > 0 then
+        local used = tonumber(redis.call('HGET', KEYS[2 * i], customer) or '0')
+        if used >= per_customer then
+            return {-3, i}
+        end
+    end
+end
+for i = 1, n do
+    redis.call('INCR', KEYS[2 * i - 1])
+    redis.call('EXPIRE', KEYS[2 * i - 1], ttl)
+    if customer ~= '' then
+        redis.call('HINCRBY', KEYS[2 * i], customer, 1)
+        redis.call('EXPIRE', KEYS[2 * i], ttl)
+    end
+    redis.call('HINCRBY', KEYS[#KEYS], ARGV[3 * i], 1)
+end
+return {0}
+"""
+
+# KEYS: uses, customers. ARGV: ttl, uses, then customer, count pairs
+SEED_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[1])
+redis.call('DEL', KEYS[2])
+for i = 3, #ARGV, 2 do
+    redis.call('HSET', KEYS[2], ARGV[i], ARGV[i + 1])
+end
+if #ARGV > 2 then
+    redis.call('EXPIRE', KEYS[2], ARGV[1])
+end
+return 1
+"""
+
+# KEYS: uses_1, customers_1, ..., pending. ARGV: customer, promo ids
+RELEASE_SCRIPT = """
+local n = (#KEYS - 1) / 2
+for i = 1, n do
+    if redis.call('EXISTS', KEYS[2 * i - 1]) == 1 then
+        redis.call('DECR', KEYS[2 * i - 1])
+    end
+    if ARGV[1] ~= '' and redis.call('HEXISTS', KEYS[2 * i], ARGV[1]) == 1 then
+        redis.call('HINCRBY', KEYS[2 * i], ARGV[1], -1)
+    end
+    redis.call('HINCRBY', KEYS[#KEYS], ARGV[i + 1], -1)
+end
+return 0
+"""
+
+
+class RedemptionError(ValueError):
+    """Raised when a promo has no use left for the sale."""
+
+
+def _uses_key(tenant_id, promo_id) -> str:
+    return tenant_key(str(tenant_id), f"pos:promo:{promo_id}:uses")
+
+
+def _customers_key(tenant_id, promo_id) -> str:
+    return tenant_key(str(tenant_id), f"pos:promo:{promo_id}:customers")
+
+
+def _limit_message(promo: Dict, per_customer: bool) -> str:
+    if per_customer:
+        return f"{promo['code']}: Promo usage limit per customer reached"
+    return f"{promo['code']}: Promo usage limit reached"
+
+
+def reserve_arguments(tenant_id: uuid.UUID, promos: List[Dict], customer_id: Optional[uuid.UUID]):
+    """KEYS and ARGV of RESERVE_SCRIPT for a sale."""
+    keys, args = [], [str(customer_id) if customer_id else WALK_IN, COUNTER_TTL]
+    for promo in promos:
+        keys += [_uses_key(tenant_id, promo["id"]), _customers_key(tenant_id, promo["id"])]
+        args += [str(promo["id"]), promo.get("usage_limit") or 0, promo.get("per_customer_limit") or 0]
+    return keys + [PENDING_KEY], args
+
+
+class Reservation:
+    """Promo uses taken by one sale; release() when the sale is not committed."""
+
+    def __init__(self, tenant_id: uuid.UUID, promo_ids: List[uuid.UUID], customer_id: Optional[uuid.UUID], in_redis: bool):
+        self.tenant_id = tenant_id
+        self.promo_ids = promo_ids
+        self.customer_id = customer_id
+        self.in_redis = in_redis
+
+    async def release(self):
+        # Database-path reservations roll back with the sale's transaction
+        if not self.in_redis or not self.promo_ids:
+            return
+        keys = []
+        for promo_id in self.promo_ids:
+            keys += [_uses_key(self.tenant_id, promo_id), _customers_key(self.tenant_id, promo_id)]
+        try:
+            r = await get_redis()
+            await r.eval(
+                RELEASE_SCRIPT, len(keys) + 1, *keys, PENDING_KEY,
+                str(self.customer_id) if self.customer_id else WALK_IN,
+                *[str(promo_id) for promo_id in self.promo_ids]
+            )
+        except Exception as e:
+            logger.error(f"Promo reservation release failed: {e}")
+
+
+# ==================== SEEDING ====================
+
+# (tenant_id, promo_id) redeemed through the database fallback: last fallback
+# use (monotonic), and those whose counters were not dropped since
+_fallback_uses: Dict[Tuple[uuid.UUID, uuid.UUID], float] = {}
+_undropped: Set[Tuple[uuid.UUID, uuid.UUID]] = set()
+
+
+def _record_fallback(tenant_id: uuid.UUID, promo_ids: List[uuid.UUID]):
+    now = time.monotonic()
+    for promo_id in promo_ids:
+        _fallback_uses[(tenant_id, promo_id)] = now
+        _undropped.add((tenant_id, promo_id))
+
+
+async def drop_fallback_counters(r, settled_only: bool = False) -> int:
+    """
+    Delete the Redis counters of promos redeemed through the database
+    fallback so the next reservation reseeds them from the database.
+
+    settled_only=False drops only promos not dropped since their last
+    fallback use; True drops every remembered promo and forgets those past
+    FALLBACK_SETTLE. Returns the number of promos dropped.
+    """
+    promos = list(_fallback_uses) if settled_only else list(_undropped)
+    if not promos:
+        return 0
+    keys = []
+    for tenant_id, promo_id in promos:
+        keys += [_uses_key(tenant_id, promo_id), _customers_key(tenant_id, promo_id)]
+    await r.delete(*keys)
+    _undropped.difference_update(promos)
+    if settled_only:
+        expired = time.monotonic() - FALLBACK_SETTLE
+        for promo in promos:
+            if _fallback_uses.get(promo, 0) <= expired:
+                _fallback_uses.pop(promo, None)
+    return len(promos)
+
+
+async def _seed_counters(r, db: AsyncSession, tenant_id: uuid.UUID, promo_ids: List[uuid.UUID]):
+    """Load usage and per-customer counts of the promos into Redis (keys already present are kept)."""
+    usage = await db.execute(select(Promo.id, Promo.usage_count).where(Promo.id.in_(promo_ids)))
+    usage_count = {promo_id: count or 0 for promo_id, count in usage.all()}
+    pending = await r.hmget(PENDING_KEY, [str(promo_id) for promo_id in promo_ids])
+    customers = await db.execute(
+        select(PromoRedemption.promo_id, PromoRedemption.customer_id, func.count())
+        .where(PromoRedemption.promo_id.in_(promo_ids), PromoRedemption.customer_id.isnot(None))
+        .group_by(PromoRedemption.promo_id, PromoRedemption.customer_id)
+    )
+    per_customer: Dict[uuid.UUID, List] = {}
+    for promo_id, customer_id, count in customers.all():
+        per_customer.setdefault(promo_id, []).extend([str(customer_id), count])
+
+    pipe = r.pipeline(transaction=False)
+    for promo_id, delta in zip(promo_ids, pending):
+        uses = usage_count.get(promo_id, 0) + int(delta or 0)
+        pipe.eval(
+            SEED_SCRIPT, 2, _uses_key(tenant_id, promo_id), _customers_key(tenant_id, promo_id),
+            COUNTER_TTL, uses, *per_customer.get(promo_id, [])
+        )
+    await pipe.execute()
+
+
+# ==================== REDEMPTION ====================
+
+async def _reserve_in_redis(db: AsyncSession, tenant_id: uuid.UUID, promos: List[Dict], customer_id: Optional[uuid.UUID]):
+    r = await get_redis()
+    await drop_fallback_counters(r)
+    keys, args = reserve_arguments(tenant_id, promos, customer_id)
+    result = await r.eval(RESERVE_SCRIPT, len(keys), *keys, *args)
+    if result[0] == -1:
+        await _seed_counters(r, db, tenant_id, [promo["id"] for promo in promos])
+        result = await r.eval(RESERVE_SCRIPT, len(keys), *keys, *args)
+    if result[0] == -1:
+        raise RedemptionError("Promo usage could not be checked, try again")
+    if result[0] < 0:
+        raise RedemptionError(_limit_message(promos[result[1] - 1], per_customer=result[0] == -3))
+
+
+async def _reserve_in_db(
+    db: AsyncSession,
+    tenant_id: uuid.UUID,
+    promos: List[Dict],
+    customer_id: Optional[uuid.UUID],
+    unsaved_uses: Dict[Tuple[uuid.UUID, uuid.UUID], int]
+):
+    for promo in promos:
+        if customer_id and promo.get("per_customer_limit"):
+            await db.execute(select(func.pg_advisory_xact_lock(func.hashtext(f"pos_promo:{promo['id']}:{customer_id}"))))
+            used = await db.execute(
+                select(func.count()).select_from(PromoRedemption).where(
+                    PromoRedemption.promo_id == promo["id"],
+                    PromoRedemption.customer_id == customer_id
+                )
+            )
+            if used.scalar() + unsaved_uses.get((promo["id"], customer_id), 0) >= promo["per_customer_limit"]:
+                raise RedemptionError(_limit_message(promo, per_customer=True))
+        result = await db.execute(
+            update(Promo)
+            .where(
+                Promo.id == promo["id"],
+                Promo.usage_limit.is_(None) | (func.coalesce(Promo.usage_count, 0) < Promo.usage_limit)
+            )
+            .values(usage_count=func.coalesce(Promo.usage_count, 0) + 1)
+            .returning(Promo.id)
+        )
+        if result.first() is None:
+            raise RedemptionError(_limit_message(promo, per_customer=False))
+    _record_fallback(tenant_id, [promo["id"] for promo in promos])
+
+
+async def reserve(
+    db: AsyncSession,
+    tenant_id: uuid.UUID,
+    promos: List[Dict],
+    customer_id: Optional[uuid.UUID] = None,
+    unsaved_uses: Optional[Dict[Tuple[uuid.UUID, uuid.UUID], int]] = None
+) -> Reservation:
+    """
+    Take one use of every promo of a sale, all or none.
+
+    Args:
+        promos: [{"id", "code", "usage_limit", "per_customer_limit"}]
+        unsaved_uses: {(promo_id, customer_id): uses} reserved by the caller
+            whose PromoRedemption rows are not flushed yet (batch writes);
+            the database fallback adds them to the customer's stored count
+
+    Raises:
+        RedemptionError: a promo has no use left, for everyone or for the customer
+    """
+    in_redis = True
+    if promos:
+        try:
+            await _reserve_in_redis(db, tenant_id, promos, customer_id)
+        except RedemptionError:
+            raise
+        except Exception as e:
+            logger.error(f"Promo counters not available, checking in database: {e}")
+            in_redis = False
+            await _reserve_in_db(db, tenant_id, promos, customer_id, unsaved_uses or {})
+    return Reservation(tenant_id, [promo["id"] for promo in promos], customer_id, in_redis)
+
+
+def redemption_rows(reservation: Reservation, transaction_id: uuid.UUID) -> List[Dict]:
+    """PromoRedemption rows of a reservation, for a bulk insert."""
+    return [
+        {
+            "id": uuid.uuid4(),
+            "tenant_id": reservation.tenant_id,
+            "promo_id": promo_id,
+            "customer_id": reservation.customer_id,
+            "transaction_id": transaction_id
+        }
+        for promo_id in reservation.promo_ids
+    ]
+
+
+async def redeem(
+    db: AsyncSession,
+    tenant_id: uuid.UUID,
+    transaction_id: uuid.UUID,
+    promos: List[Dict],
+    customer_id: Optional[uuid.UUID] = None
+) -> Reservation:
+    """reserve() and add the PromoRedemption rows to the session (does not commit)."""
+    reservation = await reserve(db, tenant_id, promos, customer_id)
+    db.add_all([PromoRedemption(**row) for row in redemption_rows(reservation, transaction_id)])
+    return reservation
+
+
+async def usage_error(db: AsyncSession, tenant_id: uuid.UUID, promo, customer_id: Optional[uuid.UUID] = None) -> Optional[str]:
+    """Why the promo has no use left (None when it has), without taking a use."""
+    uses, used_by_customer = None, None
+    try:
+        r = await get_redis()
+        uses = await r.get(_uses_key(tenant_id, promo.id))
+        if customer_id and uses is not None:
+            used_by_customer = int(await r.hget(_customers_key(tenant_id, promo.id), str(customer_id)) or 0)
+    except Exception as e:
+        logger.error(f"Promo counters not available: {e}")
+    uses = int(uses) if uses is not None else (promo.usage_count or 0)
+    if promo.usage_limit and uses >= promo.usage_limit:
+        return "Promo usage limit reached"
+    if customer_id and promo.per_customer_limit:
+        if used_by_customer is None:
+            result = await db.execute(
+                select(func.count()).select_from(PromoRedemption).where(
+                    PromoRedemption.promo_id == promo.id,
+                    PromoRedemption.customer_id == customer_id
+                )
+            )
+            used_by_customer = result.scalar()
+        if used_by_customer >= promo.per_customer_limit:
+            return "Promo usage limit per customer reached"
+    return None
+
+
+# ==================== USAGE FLUSH ====================
+
+def usage_flush_statement(deltas: Dict[str, int]):
+    """One UPDATE adding each promo's pending uses to usage_count."""
+    by_id = {uuid.UUID(promo_id): delta for promo_id, delta in deltas.items()}
+    return (
+        update(Promo)
+        .where(Promo.id.in_(list(by_id)))
+        .values(usage_count=func.coalesce(Promo.usage_count, 0) + case(by_id, value=Promo.id, else_=0))
+    )
+
+
+async def flush_usage() -> int:
+    """Write pending uses to pos_promos.usage_count. Returns the number of promos updated."""
+    try:
+        r = await get_redis()
+        await drop_fallback_counters(r, settled_only=True)
+        # Each flush takes the pending hash under its own name, so replicas never share one
+        flushing = f"{PENDING_KEY}:flushing:{uuid.uuid4()}"
+        try:
+            await r.rename(PENDING_KEY, flushing)
+        except ResponseError:
+            return 0  # nothing pending
+        deltas = {promo_id: int(delta) for promo_id, delta in (await r.hgetall(flushing)).items() if int(delta)}
+    except Exception as e:
+        logger.error(f"Promo usage flush skipped: {e}")
+        return 0
+
+    try:
+        if deltas:
+            async with SessionLocal() as db:
+                await db.execute(usage_flush_statement(deltas))
+                await db.commit()
+        await r.delete(flushing)
+    except Exception as e:
+        logger.error(f"Promo usage flush failed, {len(deltas)} promos requeued: {e}")
+        try:
+            pipe = r.pipeline(transaction=True)
+            for promo_id, delta in deltas.items():
+                pipe.hincrby(PENDING_KEY, promo_id, delta)
+            pipe.delete(flushing)
+            await pipe.execute()
+        except Exception as e:
+            logger.error(f"Promo usage requeue failed, {flushing} kept: {e}")
+        return 0
+    return len(deltas)
+
+
+async def run_usage_flusher():
+    """Background loop started from the app lifespan."""
+    try:
+        while True:
+            await asyncio.sleep(USAGE_FLUSH_INTERVAL)
+            await flush_usage()
+    except asyncio.CancelledError:
+        await flush_usage()
+        raise
@@ -0,0 +1,52 @@
+"""
+Unit tests for terminal attendance ingestion.
+Tests cover: folding buffered events per employee and day
+
+Pure in-memory tests - no API server required.
+"""
+import uuid
+from datetime import datetime
+
+from services.attendance_ingest import fold_events, CHECK_IN, CHECK_OUT
+
+
+def event(employee_id, event_type, hour, day=18):
+    return {"employee_id": employee_id, "event_type": event_type, "timestamp": datetime(2026, 10, day, hour, 0)}
+
+
+class TestFoldEvents:
+    """Tests for fold_events."""
+
+    def test_keeps_earliest_check_in_and_latest_check_out(self):
+        emp = uuid.uuid4()
+        folded = fold_events([
+            event(emp, CHECK_IN, 8),
+            event(emp, CHECK_IN, 7),
+            event(emp, CHECK_OUT, 16),
+            event(emp, CHECK_OUT, 17),
+        ])
+
+        entry = folded[(emp, datetime(2026, 10, 18).date())]
+        assert entry[CHECK_IN]["timestamp"].hour == 7
+        assert entry[CHECK_OUT]["timestamp"].hour == 17
+
+    def test_groups_by_employee_and_day(self):
+        a, b = uuid.uuid4(), uuid.uuid4()
+        folded = fold_events([
+            event(a, CHECK_IN, 7, day=17),
+            event(a, CHECK_IN, 7, day=18),
+            event(b, CHECK_IN, 7, day=18),
+        ])
+
+        assert len(folded) == 3
+
+    def test_replayed_events_fold_to_one(self):
+        emp = uuid.uuid4()
+        events = [event(emp, CHECK_IN, 7), event(emp, CHECK_OUT, 17)]
+
+        folded = fold_events(events + events)
+
+        assert len(folded) == 1
+        entry = next(iter(folded.values()))
+        assert entry[CHECK_IN]["timestamp"].hour == 7
+        assert entry[CHECK_OUT]["timestamp"].hour == 17
@@ -0,0 +1,52 @@
+"""
+Unit tests for the biometric worker pool.
+Tests cover: busy queue (503), job timeout (504), recovery from a broken pool
+
+Pure in-memory tests - no API server required.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from fastapi import HTTPException
+
+from routers.hr import _encode_face_or_raise
+from services import biometric_pool
+
+
+@pytest.fixture
+def thread_pool(monkeypatch):
+    """Jobs run in threads so tests control them without spawning workers."""
+    pool = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(biometric_pool, "_pool", pool)
+    monkeypatch.setattr(biometric_pool, "_pending", 0)
+    yield pool
+    pool.shutdown(wait=True)
+
+
+class TestPoolErrors:
+    """Pool errors mapped to HTTP responses"""
+
+    async def test_full_queue_returns_503(self, monkeypatch):
+        monkeypatch.setattr(biometric_pool, "_pending", biometric_pool.FACE_POOL_MAX_PENDING)
+        with pytest.raises(HTTPException) as error:
+            await _encode_face_or_raise("image")
+        assert error.value.status_code == 503
+        assert error.value.headers == {"Retry-After": "1"}
+
+    async def test_slow_job_returns_504(self, monkeypatch, thread_pool):
+        monkeypatch.setattr(biometric_pool, "FACE_ENCODE_TIMEOUT", 0.05)
+        monkeypatch.setattr(biometric_pool, "_encode_face_job", lambda image, side: time.sleep(0.3))
+        with pytest.raises(HTTPException) as error:
+            await _encode_face_or_raise("image")
+        assert error.value.status_code == 504
+
+    async def test_broken_pool_is_dropped(self, monkeypatch, thread_pool):
+        def crash(image, side):
+            raise BrokenProcessPool("worker died")
+
+        monkeypatch.setattr(biometric_pool, "_encode_face_job", crash)
+        with pytest.raises(biometric_pool.BiometricBusyError):
+            await biometric_pool.encode_face("image")
+        assert biometric_pool._pool is None
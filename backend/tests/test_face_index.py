@@ -0,0 +1,73 @@
+"""
+Unit tests for the vectorized face matching index.
+Tests cover: nearest match, threshold, top-k ordering, upsert, binary encoding
+
+Pure in-memory tests - no API server required.
+"""
+import uuid
+
+import numpy as np
+
+from services.face_index import FaceIndex, encode_embedding, decode_embedding, EMBEDDING_SIZE
+
+
+def make_index(count, seed=0):
+    rng = np.random.default_rng(seed)
+    embeddings = rng.normal(0, 0.1, (count, EMBEDDING_SIZE)).astype(np.float32)
+    employees = [
+        {"id": uuid.uuid4(), "first_name": f"Emp{i}", "last_name": "Test"}
+        for i in range(count)
+    ]
+    return FaceIndex(employees, embeddings), embeddings
+
+
+class TestFaceIndex:
+    """Tests for FaceIndex.match / upsert."""
+
+    def test_matches_nearest_employee(self):
+        index, embeddings = make_index(50)
+        probe = embeddings[17] + 0.001
+
+        matches = index.match(probe)
+
+        assert len(matches) == 1
+        assert matches[0]["id"] == index.employees[17]["id"]
+        assert matches[0]["distance"] < 0.05
+
+    def test_rejects_faces_above_threshold(self):
+        index, embeddings = make_index(10)
+        probe = embeddings[3] + 1.0
+
+        assert index.match(probe, threshold=0.6) == []
+
+    def test_top_k_sorted_by_distance(self):
+        index, embeddings = make_index(20)
+        probe = embeddings[5]
+
+        matches = index.match(probe, top_k=3, threshold=10)
+
+        assert len(matches) == 3
+        assert matches[0]["id"] == index.employees[5]["id"]
+        distances = [m["distance"] for m in matches]
+        assert distances == sorted(distances)
+
+    def test_upsert_adds_and_replaces(self):
+        index, _ = make_index(0)
+        employee = {"id": uuid.uuid4(), "first_name": "New", "last_name": "Hire"}
+        first = np.full(EMBEDDING_SIZE, 0.1, np.float32)
+        second = np.full(EMBEDDING_SIZE, -0.1, np.float32)
+
+        index.upsert(employee, first)
+        index.upsert(employee, second)
+
+        assert len(index) == 1
+        assert index.match(second)[0]["id"] == employee["id"]
+        assert index.match(first) == []
+
+    def test_binary_round_trip(self):
+        encoding = np.linspace(-1, 1, EMBEDDING_SIZE)
+
+        data = encode_embedding(encoding)
+
+        assert len(data) == EMBEDDING_SIZE * 4
+        assert np.allclose(decode_embedding(data), encoding, atol=1e-6)
@@ -0,0 +1,108 @@
+"""
+Unit tests for the FEFO allocation planner.
+Tests cover: FEFO split across batches, pinned batches, shortages,
+row locks of pinned and open lines
+
+Pure in-memory tests - no API server required.
+"""
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+
+from sqlalchemy.dialects import postgresql
+
+from services.fefo_allocator import lock_candidate_batches, plan_allocations
+
+
+def make_batch(product_id, qty, expires=None):
+    return SimpleNamespace(
+        id=uuid.uuid4(),
+        tenant_id=uuid.uuid4(),
+        product_id=product_id,
+        batch_number=f"B-{uuid.uuid4().hex[:6]}",
+        location_id=uuid.uuid4(),
+        quantity_on_hand=qty,
+        expiration_date=expires
+    )
+
+
+class FakeSession:
+    """Returns the given batches for each query, in order."""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.statements = []
+
+    async def execute(self, statement):
+        self.statements.append(str(statement.compile(dialect=postgresql.asyncpg.dialect())))
+        rows = self.results.pop(0)
+        return SimpleNamespace(scalars=lambda: SimpleNamespace(all=lambda: rows))
+
+
+class TestPlanAllocations:
+    """Tests for plan_allocations (batches arrive already FEFO-ordered)."""
+
+    def test_splits_line_across_batches_in_order(self):
+        product = uuid.uuid4()
+        first = make_batch(product, 5, datetime(2026, 1, 1))
+        second = make_batch(product, 10, datetime(2026, 6, 1))
+
+        allocations, shortages = plan_allocations(
+            [{"product_id": product, "quantity": 8}], [first, second]
+        )
+
+        assert shortages == []
+        assert [(a["batch_id"], a["quantity"]) for a in allocations] == [(first.id, 5), (second.id, 3)]
+
+    def test_pinned_line_served_before_fefo_lines(self):
+        product = uuid.uuid4()
+        early = make_batch(product, 5, datetime(2026, 1, 1))
+        late = make_batch(product, 5, datetime(2026, 6, 1))
+        lines = [
+            {"product_id": product, "quantity": 6},
+            {"product_id": product, "quantity": 4, "batch_id": early.id},
+        ]
+
+        allocations, shortages = plan_allocations(lines, [early, late])
+
+        assert shortages == []
+        pinned = [a for a in allocations if a["line_index"] == 1]
+        assert pinned == [a for a in allocations if a["batch_id"] == early.id and a["quantity"] == 4]
+        assert sum(a["quantity"] for a in allocations if a["line_index"] == 0) == 6
+
+    def test_reports_shortage(self):
+        product = uuid.uuid4()
+        batch = make_batch(product, 3)
+
+        _, shortages = plan_allocations([{"product_id": product, "quantity": 5}], [batch])
+
+        assert len(shortages) == 1
+        assert shortages[0]["short_by"] == 2
+
+    def test_pinned_batch_of_other_product_is_short(self):
+        batch = make_batch(uuid.uuid4(), 10)
+
+        allocations, shortages = plan_allocations(
+            [{"product_id": uuid.uuid4(), "quantity": 1, "batch_id": batch.id}], [batch]
+        )
+
+        assert allocations == []
+        assert len(shortages) == 1
+
+
+class TestLockCandidateBatches:
+    """Pinned batches wait for their lock, open lines skip locked batches"""
+
+    async def test_pinned_batches_are_not_skipped(self):
+        product = uuid.uuid4()
+        pinned = make_batch(product, 5, datetime(2026, 9, 1))
+        earlier = make_batch(product, 5, datetime(2026, 7, 1))
+        db = FakeSession([pinned], [pinned, earlier])
+        lines = [
+            {"product_id": product, "quantity": 5, "batch_id": pinned.id},
+            {"product_id": product, "quantity": 5}
+        ]
+        batches = await lock_candidate_batches(db, lines)
+        assert db.statements[0].endswith("FOR UPDATE")
+        assert db.statements[1].endswith("FOR UPDATE SKIP LOCKED")
+        assert [b.id for b in batches] == [earlier.id, pinned.id]
@@ -0,0 +1,104 @@
+"""
+Unit tests for fleet booking conflicts.
+Tests cover: exclusion constraints and generated period column DDL,
+overlap and availability queries, constraint violation mapping
+
+Pure in-memory tests - no API server required.
+"""
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+
+from sqlalchemy import create_mock_engine, select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateTable
+
+import models
+from database import Base
+from services import fleet_bookings
+
+START = datetime(2026, 5, 4, 8, 0)
+END = datetime(2026, 5, 4, 12, 0)
+
+
+def compile_pg(statement) -> str:
+    return str(statement.compile(dialect=postgresql.asyncpg.dialect()))
+
+
+class FakeSession:
+    """Records the compiled SQL of every executed statement; returns no rows."""
+
+    def __init__(self):
+        self.statements = []
+
+    async def execute(self, statement):
+        self.statements.append(compile_pg(statement))
+        return SimpleNamespace(scalars=lambda: SimpleNamespace(all=lambda: []))
+
+
+class TestSchema:
+    """DDL of vehicle_bookings"""
+
+    def test_period_and_exclusion_constraints(self):
+        ddl = compile_pg(CreateTable(models.VehicleBooking.__table__))
+        assert "period TSRANGE GENERATED ALWAYS AS (tsrange(start_datetime, end_datetime, '[)')) STORED" in ddl
+        for owner in ("vehicle", "driver"):
+            assert (
+                f"CONSTRAINT excl_vehicle_bookings_{owner}_period EXCLUDE USING gist "
+                f"({owner}_id WITH =, period WITH &&) WHERE (status IN ('PENDING', 'APPROVED', 'IN_USE'))"
+            ) in ddl
+
+    def test_create_all_creates_btree_gist_first(self):
+        statements = []
+        engine = create_mock_engine(
+            "postgresql+asyncpg://", lambda sql, *args, **kwargs: statements.append(str(sql.compile(dialect=engine.dialect)))
+        )
+        Base.metadata.create_all(engine, checkfirst=False)
+        extension = statements.index("CREATE EXTENSION IF NOT EXISTS btree_gist")
+        bookings = next(i for i, sql in enumerate(statements) if "CREATE TABLE vehicle_bookings" in sql)
+        assert extension < bookings
+
+
+class TestQueries:
+    """Range overlap queries"""
+
+    def test_overlap_uses_range_operator_and_active_statuses(self):
+        sql = compile_pg(select(models.VehicleBooking.id).where(fleet_bookings.overlaps(START, END)))
+        assert "vehicle_bookings.period && tsrange(" in sql
+        assert "vehicle_bookings.status IN" in sql
+
+    async def test_available_vehicles_is_one_not_exists_query(self):
+        db = FakeSession()
+        await fleet_bookings.available_vehicles(db, uuid.uuid4(), START, END)
+
+        assert len(db.statements) == 1
+        sql = db.statements[0]
+        assert sql.startswith("SELECT vehicles.")
+        assert "NOT (EXISTS (SELECT" in sql
+        assert "vehicle_bookings.vehicle_id = vehicles.id" in sql
+        assert "vehicle_bookings.period && tsrange(" in sql
+        assert "vehicles.status NOT IN" in sql
+
+
+class TestConflicts:
+    """Constraint violations and 409 payload"""
+
+    def test_exclusion_violation_names_owner(self):
+        error = IntegrityError("INSERT", {}, Exception(
+            'conflicting key value violates exclusion constraint "excl_vehicle_bookings_driver_period"'
+        ))
+        assert fleet_bookings.exclusion_violation(error) == "driver"
+        other = IntegrityError("INSERT", {}, Exception('duplicate key value violates unique constraint "x"'))
+        assert fleet_bookings.exclusion_violation(other) is None
+
+    def test_conflict_detail_flags_vehicle_and_driver(self):
+        vehicle_id, driver_id = uuid.uuid4(), uuid.uuid4()
+        booking = SimpleNamespace(
+            id=uuid.uuid4(), code="BK-2026-0001", status=models.BookingStatus.APPROVED,
+            start_datetime=START, end_datetime=END, vehicle_id=uuid.uuid4(), driver_id=driver_id
+        )
+        detail = fleet_bookings.conflict_detail([booking], vehicle_id, driver_id)
+        assert detail["conflicts"][0]["status"] == "APPROVED"
+        assert detail["conflicts"][0]["vehicle"] is False
+        assert detail["conflicts"][0]["driver"] is True
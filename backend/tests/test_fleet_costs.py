@@ -0,0 +1,73 @@
+"""
+Unit tests for fleet cost rollups.
+Tests cover: per-write deltas, derived cost per km and fuel efficiency,
+month windows, rollup upsert and backfill SQL
+
+Pure in-memory tests - no API server required.
+"""
+import uuid
+from datetime import date
+from types import SimpleNamespace
+
+from sqlalchemy.dialects import postgresql
+
+from services import fleet_costs
+
+
+def compile_pg(statement) -> str:
+    return str(statement.compile(dialect=postgresql.asyncpg.dialect()))
+
+
+class TestDeltas:
+    """Amounts added to a vehicle's month by each write"""
+
+    def test_fuel_log_with_and_without_distance(self):
+        first = SimpleNamespace(total_cost=500000, liters=40, distance_traveled=None)
+        later = SimpleNamespace(total_cost=450000, liters=30, distance_traveled=360)
+        assert fleet_costs.fuel_log_delta(first) == {
+            "fuel_cost": 500000, "fuel_liters": 40, "fuel_count": 1, "distance_km": 0, "distance_liters": 0
+        }
+        assert fleet_costs.fuel_log_delta(later)["distance_liters"] == 30
+
+    def test_maintenance_and_expense(self):
+        assert fleet_costs.maintenance_log_delta(SimpleNamespace(total_cost=1200)) == {
+            "maintenance_cost": 1200, "maintenance_count": 1
+        }
+        assert fleet_costs.expense_delta(SimpleNamespace(amount=75)) == {"expense_cost": 75, "expense_count": 1}
+
+
+class TestReads:
+    """Derived metrics and month windows"""
+
+    def test_derived_metrics(self):
+        row = dict.fromkeys(fleet_costs.COST_COLUMNS, 0)
+        row.update(fuel_cost=600, maintenance_cost=300, expense_cost=100, distance_km=500, distance_liters=40)
+        metrics = fleet_costs.derived_metrics(row)
+        assert metrics["total_cost"] == 1000
+        assert metrics["cost_per_km"] == 2.0
+        assert metrics["fuel_efficiency"] == 12.5
+
+    def test_derived_metrics_without_distance(self):
+        metrics = fleet_costs.derived_metrics({**dict.fromkeys(fleet_costs.COST_COLUMNS, 0), "expense_cost": 50})
+        assert metrics["cost_per_km"] is None and metrics["fuel_efficiency"] is None
+
+    def test_months_back_crosses_year(self):
+        assert fleet_costs.months_back(date(2026, 2, 10), 1) == date(2026, 2, 1)
+        assert fleet_costs.months_back(date(2026, 2, 10), 3) == date(2025, 12, 1)
+
+
+class TestStatements:
+    """Rollup SQL"""
+
+    def test_upsert_increments_only_given_columns(self):
+        sql = compile_pg(fleet_costs.rollup_upsert(uuid.uuid4(), uuid.uuid4(), date(2026, 5, 17), {"expense_cost": 5, "expense_count": 1}))
+        assert "ON CONFLICT ON CONSTRAINT uq_vehicle_cost_rollups_vehicle_month DO UPDATE" in sql
+        assert "expense_cost = (vehicle_cost_rollups.expense_cost + excluded.expense_cost)" in sql
+        assert "fuel_cost =" not in sql
+
+    def test_backfill_groups_all_sources(self):
+        sql = compile_pg(fleet_costs.backfill_statement(uuid.uuid4()))
+        assert sql.count("UNION ALL") == 2
+        for column in fleet_costs.COST_COLUMNS:
+            assert f"sum(cost_sources.{column})" in sql
+        assert "GROUP BY cost_sources.vehicle_id, cost_sources.month" in sql
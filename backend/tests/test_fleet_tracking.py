@@ -0,0 +1,192 @@
+"""
+Unit tests for fleet live tracking.
+Tests cover: position enrichment from the metadata cache, buffered GPS
+history flush and requeue (whole and partial), time buckets, streamed
+polyline encoding, vectorized journey simulation step, haversine distances
+and ETAs
+
+Pure in-memory tests - no API server required.
+"""
+from datetime import datetime
+
+import numpy as np
+import pytest
+from pymongo.errors import BulkWriteError
+
+from services import fleet_geo, fleet_positions, gps_history, journey_simulation
+
+
+class FakeCollection:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.failed_indexes = []
+        self.batches = []
+
+    async def create_index(self, keys, **kwargs):
+        pass
+
+    async def bulk_write(self, operations, ordered=True):
+        if self.fail:
+            raise ConnectionError("mongo down")
+        self.batches.append(list(operations))
+        if self.failed_indexes:
+            raise BulkWriteError({"writeErrors": [
+                {"index": index, "code": 11000, "errmsg": "E11000 duplicate key"} for index in self.failed_indexes
+            ]})
+
+
+def ping(vehicle_id, minute, second=0):
+    return {
+        "tenant_id": "t1", "vehicle_id": vehicle_id, "booking_id": None,
+        "lat": -6.2, "lng": 106.8, "speed": 40, "heading": 90,
+        "timestamp": datetime(2026, 5, 1, 8, minute, second)
+    }
+
+
+@pytest.fixture
+def history(monkeypatch):
+    collection = FakeCollection()
+
+    async def fake_mongo_db():
+        return {gps_history.HISTORY_COLLECTION: collection}
+
+    monkeypatch.setattr(gps_history, "get_mongo_db", fake_mongo_db)
+    monkeypatch.setattr(gps_history, "HISTORY_FLUSH_SIZE", 10_000)
+    gps_history._buffer.clear()
+    yield collection
+    gps_history._buffer.clear()
+
+
+class TestEnrichPositions:
+    """Tests for enrich_positions."""
+
+    def test_joins_vehicle_and_booking(self):
+        meta = {
+            "vehicles": {"v1": {"vehicle_plate": "B 1 AA", "vehicle_brand": "Toyota", "vehicle_model": "Avanza", "vehicle_type": "MPV"}},
+            "bookings": {"b1": {"driver_name": "Budi", "destination": "Bandung"}}
+        }
+        positions = [
+            {"vehicle_id": "v1", "booking_id": "b1", "lat": -6.2, "lng": 106.8, "distance_km": 1.5},
+            {"vehicle_id": "v2", "booking_id": None, "lat": -6.3, "lng": 106.9}
+        ]
+
+        enriched = fleet_positions.enrich_positions(positions, meta)
+
+        assert enriched[0]["vehicle_plate"] == "B 1 AA"
+        assert enriched[0]["driver_name"] == "Budi"
+        assert enriched[0]["distance_km"] == 1.5
+        assert enriched[1]["vehicle_plate"] is None
+        assert enriched[1]["destination"] is None
+
+
+class TestHistoryBuffer:
+    """Tests for the buffered GPS history writer."""
+
+    async def test_flush_writes_one_operation_per_bucket(self, history):
+        gps_history.enqueue_history([ping("v1", m) for m in range(5)])
+        gps_history.enqueue_history([ping("v1", 12), ping("v2", 1)])
+
+        written = await gps_history.flush_history()
+
+        assert written == 7
+        assert len(history.batches) == 1
+        assert len(history.batches[0]) == 3  # v1 08:00, v1 08:10, v2 08:00
+        assert gps_history.pending_history() == 0
+
+    async def test_failed_flush_requeues(self, history):
+        history.fail = True
+        gps_history.enqueue_history([ping("v1", 1), ping("v1", 2)])
+
+        assert await gps_history.flush_history() == 0
+        assert gps_history.pending_history() == 2
+
+        history.fail = False
+        assert await gps_history.flush_history() == 2
+
+    async def test_partial_failure_requeues_only_failed_buckets(self, history):
+        history.failed_indexes = [1]
+        gps_history.enqueue_history([ping("v1", 1), ping("v1", 2), ping("v2", 1), ping("v1", 12)])
+
+        assert await gps_history.flush_history() == 3
+        assert [(p["vehicle_id"], p["timestamp"].minute) for p in gps_history._buffer] == [("v2", 1)]
+
+        history.failed_indexes = []
+        assert await gps_history.flush_history() == 1
+        assert len(history.batches[-1]) == 1
+
+    def test_buffer_drops_oldest_when_full(self, history, monkeypatch):
+        monkeypatch.setattr(gps_history, "HISTORY_MAX_BUFFER", 3)
+        gps_history.enqueue_history([{"n": i} for i in range(5)])
+
+        assert [p["n"] for p in gps_history._buffer] == [2, 3, 4]
+
+
+class TestBucketsAndPolyline:
+    """Tests for history bucketing and route encoding."""
+
+    def test_group_into_buckets_sorts_points(self):
+        buckets = gps_history.group_into_buckets([ping("v1", 9, 30), ping("v1", 3), ping("v1", 10)])
+
+        assert sorted(k[2].minute for k in buckets) == [0, 10]
+        first = buckets[("t1", "v1", datetime(2026, 5, 1, 8, 0))]
+        assert [p["t"].minute for p in first] == [3, 9]
+
+    def test_polyline_reference_and_streaming(self):
+        points = [{"lat": 38.5, "lng": -120.2}, {"lat": 40.7, "lng": -120.95}, {"lat": 43.252, "lng": -126.453}]
+
+        whole, _ = gps_history.encode_polyline(points)
+        head, previous = gps_history.encode_polyline(points[:1])
+        tail, _ = gps_history.encode_polyline(points[1:], previous)
+
+        assert whole == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+        assert head + tail == whole
+
+
+class TestJourneySimulation:
+    """Vectorized step of all journeys"""
+
+    def test_simulated_speed_derived_from_vehicle_id(self):
+        vehicle_id = "00000000-0000-0000-0000-00000000002a"
+        speeds = journey_simulation.simulated_speeds([vehicle_id, vehicle_id.upper()])
+        assert speeds.tolist() == [50 + 42 % 40, 50 + 42 % 40]
+
+    def test_step_moves_by_speed_and_snaps_arrivals(self):
+        journeys = {
+            "lat": np.array([0.0, -6.2]),
+            "lng": np.array([0.0, 106.8]),
+            "dest_lat": np.array([0.0, -6.2005]),
+            "dest_lng": np.array([1.0, 106.8005])
+        }
+        moved = journey_simulation.step_journeys(journeys, np.array([60.0, 60.0]), 60)
+        assert moved["arrived"].tolist() == [False, True]
+        # 1 km along the equator
+        assert fleet_geo.haversine_km(0, 0, moved["lat"][0], moved["lng"][0]) == pytest.approx(1.0)
+        assert moved["lat"][1] == -6.2005 and moved["lng"][1] == 106.8005
+
+
+class TestGeo:
+    """Haversine distance and ETAs"""
+
+    def test_haversine_reference_distances(self):
+        # Jakarta (Monas) - Bandung (Gedung Sate), ~118 km great-circle
+        distances = fleet_geo.haversine_km(
+            np.array([-6.1754, 0.0]), np.array([106.8272, 0.0]),
+            np.array([-6.9025, 0.0]), np.array([107.6187, 1.0])
+        )
+        assert distances[0] == pytest.approx(118.5, abs=1)
+        assert distances[1] == pytest.approx(111.195, abs=0.01)
+
+    def test_estimate_etas_uses_speed_and_default(self):
+        origin = np.array([0.0, 0.0, 0.0])
+        etas = fleet_geo.estimate_etas(
+            lat=np.array([0.0, 0.0, 0.0]), lng=np.array([0.5, 0.5, 1.0]),
+            origin_lat=origin, origin_lng=origin,
+            dest_lat=origin, dest_lng=np.array([1.0, 1.0, 1.0]),
+            speed_kmh=np.array([60.0, 0.0, 60.0])
+        )
+        half = 111.195 / 2
+        assert etas["remaining_km"].tolist() == pytest.approx([half, half, 0.0], abs=0.01)
+        assert etas["progress"].tolist() == pytest.approx([0.5, 0.5, 1.0])
+        assert etas["eta_minutes"].tolist() == pytest.approx(
+            [half, half / fleet_geo.DEFAULT_SPEED_KMH * 60, 0.0], abs=0.01
+        )
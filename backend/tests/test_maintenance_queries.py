@@ -0,0 +1,129 @@
+"""
+Unit tests for the maintenance list endpoints and scheduler.
+Tests cover: schedules, work orders and assets are listed with a constant
+number of queries (no per-row lookups), joined fields, pagination,
+scheduler work order numbering
+
+Pure in-memory tests - no API server required (SQLite via aiosqlite).
+"""
+import uuid
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+import models
+from models.models_maintenance import (
+    Asset, MaintenanceType, MaintenanceWorkOrder, MaintenanceWorkOrderTask,
+    MaintenanceWorkOrderCost, MaintenanceSchedule
+)
+from routers.maintenance import list_assets, list_schedules, list_work_orders
+
+TABLES = [
+    models.User.__table__, Asset.__table__, MaintenanceType.__table__, MaintenanceWorkOrder.__table__,
+    MaintenanceWorkOrderTask.__table__, MaintenanceWorkOrderCost.__table__, MaintenanceSchedule.__table__
+]
+
+
+@pytest.fixture
+async def session():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(lambda sync_conn: models.Base.metadata.create_all(sync_conn, tables=TABLES))
+
+    statements = []
+    event.listen(engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    async with AsyncSession(engine, expire_on_commit=False) as db:
+        db.statements = statements
+        yield db
+    await engine.dispose()
+
+
+async def seed(db, tenant_id, count):
+    user = models.User(id=uuid.uuid4(), username=f"tech-{uuid.uuid4().hex[:6]}", email=f"{uuid.uuid4().hex[:6]}@x.io",
+                       password_hash="x", tenant_id=tenant_id)
+    mtype = MaintenanceType(id=uuid.uuid4(), tenant_id=tenant_id, code="PM", name="Preventive")
+    db.add_all([user, mtype])
+    for i in range(count):
+        asset = Asset(id=uuid.uuid4(), tenant_id=tenant_id, code=f"EQP-{i:03d}", name=f"Pump {i}")
+        wo = MaintenanceWorkOrder(id=uuid.uuid4(), tenant_id=tenant_id, code=f"WO-{i:04d}", asset_id=asset.id,
+                                  type_id=mtype.id, title="Service", assigned_to=user.id)
+        db.add_all([
+            asset, wo,
+            MaintenanceWorkOrderTask(work_order_id=wo.id, description="Check seals", is_completed=True),
+            MaintenanceWorkOrderTask(work_order_id=wo.id, description="Grease"),
+            MaintenanceWorkOrderCost(work_order_id=wo.id, description="Labor", amount=100.0),
+            MaintenanceSchedule(tenant_id=tenant_id, asset_id=asset.id, type_id=mtype.id, title="Monthly PM",
+                                next_due=date.today() + timedelta(days=i))
+        ])
+    await db.commit()
+
+
+async def count_queries(db, call):
+    db.statements.clear()
+    response = await call()
+    return len(db.statements), response
+
+
+class TestConstantQueryCount:
+    """The list endpoints must not issue one query per row."""
+
+    @pytest.mark.parametrize("endpoint", [list_schedules, list_work_orders, list_assets])
+    async def test_query_count_independent_of_rows(self, session, endpoint):
+        small, large = SimpleNamespace(tenant_id=uuid.uuid4()), SimpleNamespace(tenant_id=uuid.uuid4())
+        await seed(session, small.tenant_id, 2)
+        await seed(session, large.tenant_id, 25)
+
+        kwargs = {"skip": 0, "limit": 100, "db": session}
+        if endpoint is list_work_orders:
+            kwargs["status"] = None
+        small_count, small_rows = await count_queries(session, lambda: endpoint(current_user=small, **kwargs))
+        large_count, large_rows = await count_queries(session, lambda: endpoint(current_user=large, **kwargs))
+
+        assert (len(small_rows), len(large_rows)) == (2, 25)
+        assert small_count == large_count == 1
+
+    async def test_work_order_joined_fields(self, session):
+        user = SimpleNamespace(tenant_id=uuid.uuid4())
+        await seed(session, user.tenant_id, 3)
+
+        rows = await list_work_orders(status=None, skip=0, limit=2, db=session, current_user=user)
+
+        assert len(rows) == 2
+        assert rows[0].asset_name.startswith("Pump")
+        assert rows[0].type_name == "Preventive"
+        assert rows[0].assigned_name.startswith("tech-")
+        assert (rows[0].total_cost, rows[0].task_count, rows[0].completed_tasks) == (100.0, 2, 1)
+
+    async def test_schedule_pagination(self, session):
+        user = SimpleNamespace(tenant_id=uuid.uuid4())
+        await seed(session, user.tenant_id, 5)
+
+        rows = await list_schedules(skip=3, limit=10, db=session, current_user=user)
+
+        assert [r.asset_code for r in rows] == ["EQP-003", "EQP-004"]
+
+
+class TestScheduledWorkOrders:
+    """Tests for the preventive maintenance work order builder."""
+
+    def test_codes_continue_per_tenant(self):
+        from datetime import datetime
+        from services.maintenance_scheduler import build_work_orders
+
+        tenant_a, tenant_b = uuid.uuid4(), uuid.uuid4()
+        schedules = [
+            SimpleNamespace(id=uuid.uuid4(), tenant_id=tenant, asset_id=uuid.uuid4(), type_id=None,
+                            title="PM", description=None, next_due=date(2026, 3, 1))
+            for tenant in (tenant_a, tenant_b, tenant_a)
+        ]
+        counts = {tenant_a: 7}
+
+        rows = build_work_orders(schedules, counts, datetime(2026, 3, 1, 8, 0))
+
+        assert [r["code"] for r in rows] == ["WO-2026-0008", "WO-2026-0001", "WO-2026-0009"]
+        assert counts == {tenant_a: 9, tenant_b: 1}
+        assert all(r["status"] == "SCHEDULED" for r in rows)
+        assert rows[0]["scheduled_date"] == datetime(2026, 3, 1)
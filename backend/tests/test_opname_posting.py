@@ -0,0 +1,70 @@
+"""
+Unit tests for opname count posting.
+Tests cover: batched count submission - per-device sequence numbers,
+cross-device ordering by count time and conflict reporting
+
+Pure in-memory tests - no API server required.
+"""
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from sqlalchemy.dialects import postgresql
+
+from services import opname_posting
+
+
+class FakeSession:
+    """Returns the given rows for each statement, in order."""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.statements = []
+
+    async def execute(self, statement):
+        self.statements.append(str(statement.compile(dialect=postgresql.asyncpg.dialect())))
+        rows = self.results.pop(0)
+        return SimpleNamespace(
+            all=lambda: [SimpleNamespace(id=row) for row in rows],
+            scalars=lambda: SimpleNamespace(all=lambda: rows)
+        )
+
+
+def line(detail_id, seq, minute):
+    return {
+        "detail_id": detail_id, "counted_qty": 5, "seq": seq,
+        "counted_at": datetime(2026, 5, 1, 8, minute, tzinfo=timezone(timedelta(hours=7)))
+    }
+
+
+class TestApplyCountBatch:
+    """Tests for apply_count_batch."""
+
+    async def test_cross_device_update_compares_count_time(self):
+        detail_id = uuid.uuid4()
+        db = FakeSession([detail_id])
+
+        result = await opname_posting.apply_count_batch(db, uuid.uuid4(), "scanner-a", [line(detail_id, 1, 0)], uuid.uuid4())
+
+        assert result["applied"] == 1 and result["conflicts"] == []
+        update_sql = db.statements[0]
+        assert "stock_opname_details.count_seq < submitted.seq" in update_sql
+        assert "stock_opname_details.counted_at < submitted.counted_at" in update_sql
+        assert "IS DISTINCT FROM" in update_sql
+        assert len(db.statements) == 1
+
+    async def test_older_line_than_other_device_is_a_conflict(self):
+        newer, replayed = uuid.uuid4(), uuid.uuid4()
+        db = FakeSession([], [newer])
+
+        result = await opname_posting.apply_count_batch(
+            db, uuid.uuid4(), "scanner-a", [line(newer, 3, 5), line(replayed, 2, 4)], uuid.uuid4()
+        )
+
+        assert result["applied"] == 0
+        assert result["skipped"] == 2
+        assert result["conflicts"] == [newer]
+        assert result["acknowledged_seq"] == 3
+
+    def test_client_time_is_naive_utc(self):
+        assert opname_posting._client_time(line(uuid.uuid4(), 1, 30)["counted_at"]) == datetime(2026, 5, 1, 1, 30)
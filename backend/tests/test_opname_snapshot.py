@@ -0,0 +1,88 @@
+"""
+Unit tests for the opname snapshot background job.
+Tests cover: chunked snapshot commits and cleanup of committed chunks
+when a later chunk fails
+
+Pure in-memory tests - no API server required.
+"""
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from services import opname_snapshot
+
+
+class FakeSession:
+    """Fails on the snapshot statement of chunk number `fail_on_chunk`."""
+
+    def __init__(self, location_ids, fail_on_chunk):
+        self.location_ids = location_ids
+        self.fail_on_chunk = fail_on_chunk
+        self.chunks = 0
+        self.statements = []
+        self.commits = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement):
+        sql = str(statement.compile(dialect=postgresql.asyncpg.dialect()))
+        if "INSERT INTO stock_opname_details" in sql:
+            self.chunks += 1
+            if self.chunks == self.fail_on_chunk:
+                raise RuntimeError("connection lost")
+        self.statements.append(sql)
+        return SimpleNamespace(
+            scalar=lambda: self.chunks,
+            scalars=lambda: SimpleNamespace(all=lambda: self.location_ids)
+        )
+
+    async def commit(self):
+        self.commits += 1
+
+    async def rollback(self):
+        pass
+
+
+@pytest.fixture
+def progress(monkeypatch):
+    published = []
+
+    async def fake_cache_set(key, value, ttl):
+        published.append(dict(value))
+
+    monkeypatch.setattr(opname_snapshot, "cache_set", fake_cache_set)
+    monkeypatch.setattr(opname_snapshot, "SNAPSHOT_LOCATION_CHUNK", 1)
+    return published
+
+
+class TestRunSnapshotJob:
+    """Tests for run_snapshot_job."""
+
+    async def test_failed_chunk_removes_committed_details(self, monkeypatch, progress):
+        session = FakeSession([uuid.uuid4(), uuid.uuid4(), uuid.uuid4()], fail_on_chunk=2)
+        monkeypatch.setattr(opname_snapshot, "SessionLocal", lambda: session)
+
+        await opname_snapshot.run_snapshot_job(uuid.uuid4(), uuid.uuid4(), uuid.uuid4(), expected_items=3)
+
+        cleanup = session.statements[-2:]
+        assert cleanup[0].startswith("DELETE FROM stock_opname_details")
+        assert "stock_opname_details.opname_id = " in cleanup[0]
+        assert cleanup[1].startswith("UPDATE stock_opnames SET")
+        assert "total_items=" in cleanup[1] and "status=" in cleanup[1]
+        assert progress[-1]["status"] == "failed"
+
+    async def test_completed_job_keeps_details(self, monkeypatch, progress):
+        session = FakeSession([uuid.uuid4(), uuid.uuid4()], fail_on_chunk=None)
+        monkeypatch.setattr(opname_snapshot, "SessionLocal", lambda: session)
+
+        await opname_snapshot.run_snapshot_job(uuid.uuid4(), uuid.uuid4(), uuid.uuid4(), expected_items=2)
+
+        assert not any(sql.startswith("DELETE") for sql in session.statements)
+        assert progress[-1]["status"] == "completed"
+        assert session.commits == 3
@@ -0,0 +1,132 @@
+"""
+Unit tests for the set-based payroll engine.
+Tests cover: vectorized components match the per-employee formula, totals, row rounding,
+stale DRAFT runs left by a dead background job
+
+Pure in-memory tests - no API server required.
+"""
+import uuid
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from models import models_hr
+from services import payroll_engine
+from services.payroll_engine import compute_payslips, payroll_totals, payslip_rows
+
+NOW = datetime(2026, 6, 25, 9, 0)
+
+
+def make_inputs(salaries, overtime):
+    return {
+        "employee_id": np.array([uuid.uuid4() for _ in salaries], dtype=object),
+        "base_salary": np.array(salaries, dtype=np.float64),
+        "overtime_minutes": np.array(overtime, dtype=np.float64)
+    }
+
+
+class TestComputePayslips:
+    """Tests for compute_payslips / payroll_totals."""
+
+    def test_matches_per_employee_formula(self):
+        payslips = compute_payslips(make_inputs([5_000_000, 8_650_000], [120, 0]))
+
+        base, minutes = 5_000_000, 120
+        overtime_pay = (minutes / 60) * (base / 173) * 1.5
+        gross = base + overtime_pay
+        deductions = gross * 0.05 + base * 0.01 + base * 0.02
+
+        assert payslips["overtime_pay"][0] == pytest.approx(overtime_pay)
+        assert payslips["gross_pay"][0] == pytest.approx(gross)
+        assert payslips["net_pay"][0] == pytest.approx(gross - deductions)
+        assert payslips["overtime_pay"][1] == 0
+
+    def test_totals(self):
+        payslips = compute_payslips(make_inputs([1000, 2000, 3000], [0, 0, 0]))
+
+        totals = payroll_totals(payslips)
+
+        assert totals["total_employees"] == 3
+        assert totals["total_gross"] == 6000
+        assert totals["total_net"] == pytest.approx(6000 * 0.92)
+
+    def test_rows_are_rounded(self):
+        rows = payslip_rows(compute_payslips(make_inputs([1234.567], [7])))
+
+        assert len(rows) == 1
+        assert rows[0]["overtime_minutes"] == 7
+        assert rows[0]["gross_pay"] == round(rows[0]["gross_pay"], 2)
+
+
+class FakeSession:
+    """Returns the given DRAFT runs for the run query; records added rows."""
+
+    def __init__(self, drafts):
+        self.drafts = drafts
+        self.added = []
+
+    async def execute(self, statement):
+        return SimpleNamespace(scalars=lambda: SimpleNamespace(all=lambda: self.drafts))
+
+    def add(self, row):
+        self.added.append(row)
+
+    async def flush(self):
+        pass
+
+
+@pytest.fixture
+def job_progress(monkeypatch):
+    """Progress records by run id; cache writes go to the same dict."""
+    records = {}
+
+    async def fake_progress(run_id):
+        return records.get(run_id)
+
+    async def fake_cache_set(key, value, ttl):
+        records[key] = value
+
+    monkeypatch.setattr(payroll_engine, "get_payroll_progress", fake_progress)
+    monkeypatch.setattr(payroll_engine, "cache_set", fake_cache_set)
+    return records
+
+
+class TestStaleRuns:
+    """Tests for run_is_stale / start_payroll_run."""
+
+    def test_run_is_stale(self):
+        running = {"status": "running"}
+        grace = timedelta(seconds=payroll_engine.PAYROLL_START_GRACE)
+        timeout = timedelta(seconds=payroll_engine.PAYROLL_RUN_TIMEOUT)
+
+        # Just queued: the job may not have published progress yet
+        assert not payroll_engine.run_is_stale(NOW - timedelta(seconds=5), None, NOW)
+        assert payroll_engine.run_is_stale(NOW - grace, None, NOW)
+        assert not payroll_engine.run_is_stale(NOW - grace, running, NOW)
+        assert payroll_engine.run_is_stale(NOW - grace, {"status": "failed"}, NOW)
+        # A killed job leaves its last "running" record behind
+        assert payroll_engine.run_is_stale(NOW - timeout, running, NOW)
+        assert payroll_engine.run_is_stale(None, None, NOW)
+
+    async def test_start_cancels_stale_draft(self, job_progress):
+        stale = SimpleNamespace(id=uuid.uuid4(), run_date=datetime.utcnow() - timedelta(hours=2),
+                                status=models_hr.PayrollStatus.DRAFT, notes=None)
+        db = FakeSession([stale])
+
+        run = await payroll_engine.start_payroll_run(db, uuid.uuid4(), uuid.uuid4(), uuid.uuid4())
+
+        assert stale.status == models_hr.PayrollStatus.CANCELLED
+        assert job_progress[payroll_engine._progress_key(stale.id)]["status"] == "failed"
+        assert db.added == [run]
+        assert run.status == models_hr.PayrollStatus.DRAFT
+
+    async def test_start_rejects_live_draft(self, job_progress):
+        live = SimpleNamespace(id=uuid.uuid4(), run_date=datetime.utcnow() - timedelta(minutes=10),
+                               status=models_hr.PayrollStatus.DRAFT, notes=None)
+        job_progress[live.id] = {"status": "running"}
+
+        with pytest.raises(payroll_engine.PayrollInProgressError):
+            await payroll_engine.start_payroll_run(FakeSession([live]), uuid.uuid4(), uuid.uuid4(), uuid.uuid4())
+        assert live.status == models_hr.PayrollStatus.DRAFT
@@ -0,0 +1,87 @@
+"""
+Unit tests for the compiled payroll rule engine.
+Tests cover: progressive brackets, PTKP by marital status, contribution caps,
+allowance taxability, rule validation
+
+Pure in-memory tests - no API server required.
+"""
+import uuid
+
+import numpy as np
+import pytest
+
+from services.payroll_rules import compile_rules
+
+
+def make_inputs(salaries, statuses=None):
+    return {
+        "employee_id": np.array([uuid.uuid4() for _ in salaries], dtype=object),
+        "base_salary": np.array(salaries, dtype=np.float64),
+        "overtime_minutes": np.zeros(len(salaries)),
+        "marital_status": np.array(statuses or [None] * len(salaries), dtype=object)
+    }
+
+
+BRACKETS = [
+    {"up_to": 1000, "rate": 0.05},
+    {"up_to": 5000, "rate": 0.15},
+    {"up_to": None, "rate": 0.25}
+]
+
+
+class TestProgressiveTax:
+    """Tests for bracket compilation and evaluation."""
+
+    def test_brackets_accumulate(self):
+        plan = compile_rules({"tax": {"type": "progressive", "annualize": False, "brackets": BRACKETS}, "contributions": []})
+        tax = plan.progressive_tax(np.array([0, 500, 1000, 3000, 10000], dtype=np.float64))
+        assert tax.tolist() == pytest.approx([0, 25, 50, 350, 1900])
+
+    def test_ptkp_by_marital_status(self):
+        plan = compile_rules({
+            "tax": {
+                "type": "progressive", "annualize": False, "brackets": BRACKETS,
+                "ptkp": {"default": 1000, "MARRIED": 2000}
+            },
+            "contributions": []
+        })
+        result = plan.evaluate(make_inputs([3000, 3000], ["SINGLE", "MARRIED"]))
+        assert result["tax_deduction"].tolist() == pytest.approx([50 + 1000 * 0.15, 50])
+
+    def test_bad_brackets_rejected(self):
+        with pytest.raises(ValueError):
+            compile_rules({"tax": {"type": "progressive", "brackets": [{"up_to": 5000, "rate": 0.1}, {"up_to": 1000, "rate": 0.2}]}})
+        with pytest.raises(ValueError):
+            compile_rules({"tax": {"type": "progressive", "brackets": []}})
+
+
+class TestComponents:
+    """Tests for contributions and allowances."""
+
+    def test_contribution_cap(self):
+        plan = compile_rules({
+            "tax": {"type": "flat", "rate": 0},
+            "contributions": [{"code": "BPJS_KES", "rate": 0.01, "cap": 12_000_000, "field": "bpjs_kes_deduction"}]
+        })
+        result = plan.evaluate(make_inputs([5_000_000, 20_000_000]))
+        assert result["bpjs_kes_deduction"].tolist() == pytest.approx([50_000, 120_000])
+        assert result["contribution_detail"]["BPJS_KES"].tolist() == pytest.approx([50_000, 120_000])
+
+    def test_non_taxable_allowance(self):
+        plan = compile_rules({
+            "allowances": [
+                {"code": "MEAL", "amount": 100, "taxable": False},
+                {"code": "POSITION", "rate": 0.1}
+            ],
+            "tax": {"type": "flat", "rate": 0.1},
+            "contributions": []
+        })
+        result = plan.evaluate(make_inputs([1000]))
+        assert result["allowances"][0] == pytest.approx(200)
+        assert result["gross_pay"][0] == pytest.approx(1200)
+        assert result["tax_deduction"][0] == pytest.approx(110)
+        assert result["net_pay"][0] == pytest.approx(1090)
+
+    def test_unknown_field_rejected(self):
+        with pytest.raises(ValueError):
+            compile_rules({"contributions": [{"code": "X", "rate": 0.1, "field": "bonus"}]})
@@ -0,0 +1,111 @@
+"""
+Unit tests for the POS pricing engine.
+Tests cover: catalog prices, promo types and product scope, promo stacking
+rules, per-line discount allocation and tax, sales tax code selection
+
+Pure in-memory tests - no API server required.
+"""
+import uuid
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from models.models_pos import PromoType
+from models.models_tax import TaxType
+from services import pos_pricing
+from services.pos_pricing import PricingError, PricingSnapshot
+
+NOW = datetime(2026, 6, 1, 12, 0)
+COFFEE = uuid.uuid4()
+CAKE = uuid.uuid4()
+
+
+def product(product_id, name, price):
+    return SimpleNamespace(id=product_id, name=name, suggested_selling_price=price)
+
+
+def promo(code, promo_type=PromoType.PERCENTAGE, value=10, **kwargs):
+    fields = dict(
+        id=uuid.uuid4(), code=code, name=code, promo_type=promo_type, value=value,
+        min_order=0, max_discount=None, start_date=None, end_date=None,
+        is_stackable=False, product_ids=None, usage_limit=None, per_customer_limit=1
+    )
+    fields.update(kwargs)
+    return SimpleNamespace(**fields)
+
+
+def tax_code(code, tax_type, rate):
+    return SimpleNamespace(id=uuid.uuid4(), code=code, tax_type=tax_type, rate=rate)
+
+
+def snapshot(promos=(), tax_codes=()):
+    products = [product(COFFEE, "Coffee", 20000), product(CAKE, "Cake", 15000)]
+    return PricingSnapshot("1", products, list(promos), list(tax_codes))
+
+
+def sale(*lines):
+    return [{"product_id": pid, "quantity": qty} for pid, qty in lines]
+
+
+class TestPrices:
+    """Catalog prices and tax"""
+
+    def test_lines_priced_from_catalog_with_default_tax(self):
+        result = snapshot().evaluate(sale((COFFEE, 2), (CAKE, 1)), now=NOW)
+        assert [line["unit_price"] for line in result["lines"]] == [20000, 15000]
+        assert result["subtotal"] == 55000
+        assert result["tax"] == 5500
+        assert result["total"] == 60500
+        assert result["tax_rate"] == pos_pricing.DEFAULT_TAX_RATE
+
+    def test_sales_tax_code_replaces_default(self):
+        codes = [tax_code("PPH23", TaxType.PPH23, 2), tax_code("PPN11", TaxType.PPN, 11)]
+        result = snapshot(tax_codes=codes).evaluate(sale((COFFEE, 1)), now=NOW)
+        assert result["tax_code"] == "PPN11"
+        assert result["tax"] == 2200
+
+    def test_unknown_product_rejected(self):
+        with pytest.raises(PricingError):
+            snapshot().evaluate(sale((uuid.uuid4(), 1)), now=NOW)
+
+
+class TestPromos:
+    """Promo types, scope and stacking"""
+
+    def test_percentage_capped_and_spread_over_lines(self):
+        pricing = snapshot([promo("TEN", max_discount=4000)])
+        result = pricing.evaluate(sale((COFFEE, 2), (CAKE, 1)), ["ten"], now=NOW)
+        assert result["discount"] == 4000
+        assert sum(line["discount"] for line in result["lines"]) == pytest.approx(4000)
+        assert result["tax"] == 5100
+
+    def test_product_scoped_free_item(self):
+        pricing = snapshot([promo("FREECAKE", PromoType.FREE_ITEM, 1, product_ids=[str(CAKE)])])
+        result = pricing.evaluate(sale((COFFEE, 1), (CAKE, 2)), ["FREECAKE"], now=NOW)
+        assert result["discount"] == 15000
+        assert [line["discount"] for line in result["lines"]] == [0, 15000]
+
+    def test_stackable_promos_combine(self):
+        pricing = snapshot([
+            promo("FIVE", PromoType.FIXED, 5000, is_stackable=True),
+            promo("TEN", value=10, is_stackable=True)
+        ])
+        result = pricing.evaluate(sale((COFFEE, 1)), ["FIVE", "TEN"], now=NOW)
+        assert result["discount"] == 7000
+        assert [p["code"] for p in result["promos"]] == ["FIVE", "TEN"]
+
+    def test_exclusive_promo_cannot_be_combined(self):
+        pricing = snapshot([promo("FIVE", PromoType.FIXED, 5000, is_stackable=True), promo("TEN")])
+        with pytest.raises(PricingError, match="cannot be combined"):
+            pricing.evaluate(sale((COFFEE, 1)), ["FIVE", "TEN"], now=NOW)
+
+    def test_expired_and_minimum_order(self):
+        pricing = snapshot([
+            promo("OLD", end_date=NOW - timedelta(days=1)),
+            promo("BIG", min_order=100000)
+        ])
+        with pytest.raises(PricingError, match="expired"):
+            pricing.evaluate(sale((COFFEE, 1)), ["OLD"], now=NOW)
+        with pytest.raises(PricingError, match="Minimum order"):
+            pricing.evaluate(sale((COFFEE, 1)), ["BIG"], now=NOW)
@@ -0,0 +1,61 @@
+"""
+Unit tests for offline POS sync.
+Tests cover: payment method parsing, running balance entries, sale time
+normalization, aggregated balance update
+
+Pure in-memory tests - no API server required.
+"""
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.dialects import postgresql
+
+from models.models_pos import PaymentMethod, TransactionLogType
+from services import pos_sync
+
+NOW = datetime(2026, 6, 1, 12, 0)
+
+
+def compile_pg(statement) -> str:
+    return str(statement.compile(dialect=postgresql.asyncpg.dialect()))
+
+
+class TestBalances:
+    """Balance changes of a customer's sales"""
+
+    def test_payment_method_defaults_to_cash(self):
+        assert pos_sync.payment_method("qris") == PaymentMethod.QRIS
+        assert pos_sync.payment_method("voucher") == PaymentMethod.CASH
+        assert pos_sync.payment_method(None) == PaymentMethod.CASH
+
+    def test_credit_debits_and_payments_credit(self):
+        assert pos_sync.balance_entry(PaymentMethod.CREDIT, 30, 100) == (None, TransactionLogType.DEBIT, 70)
+        assert pos_sync.balance_entry(PaymentMethod.CASH, 30, 100) == (None, TransactionLogType.CREDIT, 130)
+
+    def test_running_balance_rejects_overdraft(self):
+        balance = 50
+        outcomes = []
+        for method, total in [(PaymentMethod.CREDIT, 40), (PaymentMethod.CREDIT, 20), (PaymentMethod.CASH, 20), (PaymentMethod.CREDIT, 20)]:
+            error, _, balance = pos_sync.balance_entry(method, total, balance)
+            outcomes.append(error)
+        assert outcomes == [None, "Insufficient credit balance", None, None]
+        assert balance == 10
+
+    def test_one_update_for_all_customers(self):
+        deltas = {uuid.uuid4(): -40.0, uuid.uuid4(): 25.5}
+        sql = compile_pg(pos_sync.balance_update_statement(deltas))
+        assert sql.startswith("UPDATE sales_customers SET current_balance=(coalesce(sales_customers.current_balance,")
+        assert "CASE sales_customers.id WHEN" in sql
+        assert "sales_customers.id IN (" in sql
+
+
+class TestSaleTime:
+    """Offline sale timestamps"""
+
+    def test_aware_time_converted_to_naive_utc(self):
+        jakarta = timezone(timedelta(hours=7))
+        sale = {"created_at": datetime(2026, 6, 1, 18, 30, tzinfo=jakarta)}
+        assert pos_sync.sale_time(sale, NOW) == datetime(2026, 6, 1, 11, 30)
+
+    def test_missing_time_is_sync_time(self):
+        assert pos_sync.sale_time({"created_at": None}, NOW) == NOW
@@ -0,0 +1,154 @@
+"""
+Unit tests for promo redemptions.
+Tests cover: reservation script arguments, usage flush statement,
+redemption index DDL, limit messages, database fallback with unsaved uses,
+Redis counters dropped after fallback uses
+
+Pure in-memory tests - no API server required.
+"""
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex
+
+from models.models_pos import PromoRedemption
+from services import promo_redemptions
+
+TENANT = uuid.uuid4()
+CUSTOMER = uuid.uuid4()
+
+
+def compile_pg(statement) -> str:
+    return str(statement.compile(dialect=postgresql.asyncpg.dialect()))
+
+
+class FakeSession:
+    """Stores no PromoRedemption rows; every conditional usage UPDATE succeeds."""
+
+    def __init__(self):
+        self.statements = []
+
+    async def execute(self, statement):
+        self.statements.append(statement)
+        return SimpleNamespace(scalar=lambda: 0, first=lambda: ("promo",))
+
+
+class FakeRedis:
+    """Every reservation succeeds; records deleted keys."""
+
+    def __init__(self):
+        self.deleted = []
+
+    async def eval(self, script, numkeys, *args):
+        return [0]
+
+    async def delete(self, *keys):
+        self.deleted.append(list(keys))
+
+
+@pytest.fixture(autouse=True)
+def fallback_state():
+    promo_redemptions._fallback_uses.clear()
+    promo_redemptions._undropped.clear()
+    yield
+    promo_redemptions._fallback_uses.clear()
+    promo_redemptions._undropped.clear()
+
+
+@pytest.fixture
+def redis_down(monkeypatch):
+    async def unavailable():
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(promo_redemptions, "get_redis", unavailable)
+
+
+def promo(code, usage_limit=None, per_customer_limit=1):
+    return {"id": uuid.uuid4(), "code": code, "usage_limit": usage_limit, "per_customer_limit": per_customer_limit}
+
+
+class TestReserveArguments:
+    """KEYS and ARGV layout of the reservation script"""
+
+    def test_keys_per_promo_then_pending(self):
+        promos = [promo("FLASH", 500), promo("TEN", None, None)]
+        keys, args = promo_redemptions.reserve_arguments(TENANT, promos, CUSTOMER)
+        assert len(keys) == 2 * len(promos) + 1
+        assert keys[0] == f"tenant:{TENANT}:pos:promo:{promos[0]['id']}:uses"
+        assert keys[1] == f"tenant:{TENANT}:pos:promo:{promos[0]['id']}:customers"
+        assert keys[-1] == promo_redemptions.PENDING_KEY
+        assert args[:2] == [str(CUSTOMER), promo_redemptions.COUNTER_TTL]
+        # ARGV[3i], ARGV[3i+1], ARGV[3i+2] in the script (1-based)
+        assert args[2:] == [str(promos[0]["id"]), 500, 1, str(promos[1]["id"]), 0, 0]
+
+    def test_walk_in_sale_has_no_customer(self):
+        _, args = promo_redemptions.reserve_arguments(TENANT, [promo("FLASH")], None)
+        assert args[0] == promo_redemptions.WALK_IN
+
+
+class TestUsageFlush:
+    """Pending uses written with one UPDATE"""
+
+    def test_one_update_for_all_promos(self):
+        deltas = {str(uuid.uuid4()): 120, str(uuid.uuid4()): -1}
+        sql = compile_pg(promo_redemptions.usage_flush_statement(deltas))
+        assert sql.startswith("UPDATE pos_promos SET usage_count=(coalesce(pos_promos.usage_count,")
+        assert "CASE pos_promos.id WHEN" in sql
+        assert "pos_promos.id IN (" in sql
+
+
+class TestRedemptionIndex:
+    """pos_promo_redemptions lookups by promo and customer"""
+
+    def test_promo_customer_index(self):
+        index = next(i for i in PromoRedemption.__table__.indexes if i.name == "ix_pos_promo_redemptions_promo_customer")
+        assert compile_pg(CreateIndex(index)).endswith("(promo_id, customer_id)")
+
+    def test_limit_messages_name_the_promo(self):
+        flash = promo("FLASH")
+        assert promo_redemptions._limit_message(flash, per_customer=False) == "FLASH: Promo usage limit reached"
+        assert promo_redemptions._limit_message(flash, per_customer=True) == "FLASH: Promo usage limit per customer reached"
+
+
+class TestDatabaseFallback:
+    """Reservations checked in the database while Redis is down"""
+
+    async def test_unsaved_batch_uses_count_toward_customer_limit(self, redis_down):
+        flash = promo("FLASH", per_customer_limit=1)
+        reservation = await promo_redemptions.reserve(FakeSession(), TENANT, [flash], CUSTOMER, {})
+        assert reservation.in_redis is False
+        with pytest.raises(promo_redemptions.RedemptionError, match="per customer"):
+            await promo_redemptions.reserve(FakeSession(), TENANT, [flash], CUSTOMER, {(flash["id"], CUSTOMER): 1})
+
+    async def test_counters_dropped_when_redis_returns(self, redis_down, monkeypatch):
+        flash = promo("FLASH", usage_limit=100)
+        await promo_redemptions.reserve(FakeSession(), TENANT, [flash], CUSTOMER)
+
+        redis = FakeRedis()
+
+        async def available():
+            return redis
+
+        monkeypatch.setattr(promo_redemptions, "get_redis", available)
+        await promo_redemptions.reserve(FakeSession(), TENANT, [flash], CUSTOMER)
+        await promo_redemptions.reserve(FakeSession(), TENANT, [flash], CUSTOMER)
+
+        assert redis.deleted == [[
+            promo_redemptions._uses_key(TENANT, flash["id"]),
+            promo_redemptions._customers_key(TENANT, flash["id"])
+        ]]
+
+    async def test_flush_redrops_until_settled(self, redis_down, monkeypatch):
+        flash = promo("FLASH", usage_limit=100)
+        await promo_redemptions.reserve(FakeSession(), TENANT, [flash], CUSTOMER)
+        redis = FakeRedis()
+
+        assert await promo_redemptions.drop_fallback_counters(redis, settled_only=True) == 1
+        assert await promo_redemptions.drop_fallback_counters(redis) == 0
+        assert await promo_redemptions.drop_fallback_counters(redis, settled_only=True) == 1
+
+        monkeypatch.setattr(promo_redemptions, "FALLBACK_SETTLE", 0)
+        assert await promo_redemptions.drop_fallback_counters(redis, settled_only=True) == 1
+        assert await promo_redemptions.drop_fallback_counters(redis, settled_only=True) == 0
@@ -2,15 +2,52 @@
 Mini-ERP ML Service
 Face Recognition, Fingerprint, Vision/OCR, Object Detection
 """
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+from pydantic import BaseModel
+from typing import List, Optional
+import asyncio
+import logging
 import uvicorn
 import os
 
+from app.recognition.batching import MicroBatcher, QueueFullError
+from app.recognition.face import (
+    load_models, models_loaded, encode_batch, get_gallery, FaceModelsUnavailable,
+    EMBEDDING_SIZE, MATCH_THRESHOLD
+)
+
+logger = logging.getLogger(__name__)
+
+# Concurrent face requests are grouped into one forward pass
+face_batcher = MicroBatcher(
+    encode_batch,
+    max_batch=int(os.getenv("FACE_MAX_BATCH", 16)),
+    max_wait_ms=float(os.getenv("FACE_MAX_WAIT_MS", 10)),
+    max_queue=int(os.getenv("FACE_MAX_QUEUE", 256))
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm model cache: load dlib models before accepting traffic
+    try:
+        await asyncio.to_thread(load_models)
+    except FaceModelsUnavailable as e:
+        logger.warning(str(e))
+    await face_batcher.start()
+
+    yield
+
+    await face_batcher.stop()
+
+
 app = FastAPI(
     title="Mini-ERP ML Service",
     description="Machine Learning services for Face Recognition, Fingerprint, Vision/OCR, Object Detection",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS
@@ -33,7 +70,10 @@ async def health_check():
             "fingerprint",
             "ocr",
             "object_detection"
-        ]
+        ],
+        "face_models_loaded": models_loaded(),
+        "face_batches": face_batcher.batches,
+        "face_avg_batch_size": round(face_batcher.avg_batch_size, 2)
     }
 
 @app.get("/")
@@ -42,39 +82,103 @@ async def root():
 
 # ========== FACE RECOGNITION ==========
 
+class GalleryFace(BaseModel):
+    id: str
+    encoding: List[float]
+    label: Optional[str] = None
+
+
+async def _encode_upload(image: UploadFile) -> list:
+    """Run one uploaded image through the micro-batcher."""
+    if not models_loaded():
+        raise HTTPException(status_code=503, detail="Face models not loaded")
+    try:
+        return await face_batcher.submit(await image.read())
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @app.post("/api/recognize/face")
-async def recognize_face(image: UploadFile = File(...)):
+async def recognize_face(
+    image: UploadFile = File(...),
+    gallery_id: str = Form(...),
+    top_k: int = Form(1),
+    threshold: Optional[float] = Form(None)
+):
     """
-    Recognize face from uploaded image
-    Uses: face_recognition / DeepFace (FREE)
+    Recognize faces in an uploaded image against a gallery of known faces
+    Uses: face_recognition (dlib, FREE), batched with concurrent requests
     """
-    try:
-        # TODO: Implement face recognition
-        # from app.recognition.face import recognize
-        # result = await recognize(image)
-        
-        return {
-            "success": True,
-            "message": "Face recognition - TODO",
-            "faces": [],
-            "confidence": 0.0
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    # Checked before the image is queued for encoding
+    gallery = get_gallery(gallery_id)
+    if gallery is None:
+        raise HTTPException(status_code=404, detail="Gallery not found")
+    faces = await _encode_upload(image)
+
+    results = []
+    for face in faces:
+        matches = gallery.match(
+            face["encoding"],
+            top_k=max(1, top_k),
+            threshold=threshold if threshold is not None else MATCH_THRESHOLD
+        )
+        results.append({"location": face["location"], "matches": matches})
+
+    best = next((r["matches"][0] for r in results if r["matches"]), None)
+    return {
+        "success": best is not None,
+        "message": "Face recognized" if best else ("Face not recognized" if faces else "No face detected"),
+        "faces": results,
+        "confidence": best["confidence"] if best else 0.0
+    }
+
 
 @app.post("/api/encode/face")
 async def encode_face(image: UploadFile = File(...)):
     """
     Encode face for storage (e.g., employee enrollment)
+    Returns the encoding of the largest face
     """
-    try:
-        return {
-            "success": True,
-            "message": "Face encoding - TODO",
-            "encoding": None
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    faces = await _encode_upload(image)
+    if not faces:
+        return {"success": False, "message": "No face detected", "encoding": None, "face_count": 0}
+    return {
+        "success": True,
+        "message": "Face encoded",
+        "encoding": faces[0]["encoding"].tolist(),
+        "location": faces[0]["location"],
+        "face_count": len(faces)
+    }
+
+
+@app.put("/api/galleries/{gallery_id}")
+async def replace_gallery(gallery_id: str, faces: List[GalleryFace]):
+    """Load or replace a gallery (e.g. all registered employees of a tenant)"""
+    if any(len(f.encoding) != EMBEDDING_SIZE for f in faces):
+        raise HTTPException(status_code=400, detail=f"Encodings must have {EMBEDDING_SIZE} values")
+    get_gallery(gallery_id, create=True).replace([f.model_dump() for f in faces])
+    return {"success": True, "gallery_id": gallery_id, "count": len(faces)}
+
+
+@app.post("/api/galleries/{gallery_id}/faces")
+async def upsert_gallery_face(gallery_id: str, face: GalleryFace):
+    """Add or update one known face"""
+    if len(face.encoding) != EMBEDDING_SIZE:
+        raise HTTPException(status_code=400, detail=f"Encodings must have {EMBEDDING_SIZE} values")
+    gallery = get_gallery(gallery_id, create=True)
+    gallery.upsert(face.id, face.encoding, face.label)
+    return {"success": True, "gallery_id": gallery_id, "count": len(gallery)}
+
+
+@app.delete("/api/galleries/{gallery_id}/faces/{face_id}")
+async def delete_gallery_face(gallery_id: str, face_id: str):
+    """Remove one known face"""
+    gallery = get_gallery(gallery_id)
+    if gallery is None or not gallery.remove(face_id):
+        raise HTTPException(status_code=404, detail="Face not found")
+    return {"success": True, "gallery_id": gallery_id, "count": len(gallery)}
 
 # ========== FINGERPRINT RECOGNITION ==========
 
@@ -0,0 +1,3 @@
+"""
+Recognition modules for the ML service (face encoding and matching).
+"""
@@ -0,0 +1,206 @@
+"""
+Face encoding and matching (CPU, dlib via face_recognition)
+
+- load_models(): imports the dlib detector / landmark / ResNet models once and
+  runs a warm-up pass so the first real request does not pay for it.
+- encode_batch(): decodes and downscales a list of images, detects faces with
+  HOG per image, then computes the descriptors of ALL faces of ALL images in
+  one batched ResNet forward pass. Used by the MicroBatcher.
+- FaceGallery: per-gallery (e.g. per-tenant) N x 128 matrix of known faces;
+  matching is one vectorized distance computation with top-k and a threshold.
+"""
+from typing import Dict, List, Optional
+import logging
+import os
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_SIZE = 128
+MATCH_THRESHOLD = float(os.getenv("FACE_MATCH_THRESHOLD", "0.6"))
+# Longest image side fed to the HOG detector
+MAX_IMAGE_SIDE = int(os.getenv("FACE_MAX_IMAGE_SIDE", "640"))
+UPSAMPLE_TIMES = int(os.getenv("FACE_UPSAMPLE_TIMES", "1"))
+
+_models = None
+
+
+class FaceModelsUnavailable(Exception):
+    """Raised when face_recognition / dlib are not installed."""
+
+
+def load_models():
+    """Load (once) and warm up the dlib models. Returns the face_recognition api module."""
+    global _models
+    if _models is not None:
+        return _models
+    try:
+        import dlib
+        from face_recognition import api
+    except ImportError as e:
+        raise FaceModelsUnavailable(f"Face models not available: {e}")
+
+    # Warm-up: one detection and one descriptor on a blank image
+    blank = np.zeros((150, 150, 3), dtype=np.uint8)
+    api.face_detector(blank, 0)
+    shape = api.pose_predictor_68_point(blank, dlib.rectangle(0, 0, 149, 149))
+    api.face_encoder.compute_face_descriptor(blank, shape, 1)
+
+    _models = api
+    logger.info("Face models loaded")
+    return _models
+
+
+def models_loaded() -> bool:
+    return _models is not None
+
+
+def decode_image(image_bytes: bytes):
+    """Decode image bytes to a downscaled RGB array."""
+    import cv2
+
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Could not decode image")
+
+    height, width = image.shape[:2]
+    scale = MAX_IMAGE_SIDE / max(height, width)
+    if scale < 1:
+        image = cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+        scale_back = 1 / scale
+    else:
+        scale_back = 1.0
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB), scale_back
+
+
+def _location(rect, scale_back: float) -> Dict:
+    return {
+        "top": int(rect.top() * scale_back),
+        "right": int(rect.right() * scale_back),
+        "bottom": int(rect.bottom() * scale_back),
+        "left": int(rect.left() * scale_back)
+    }
+
+
+def encode_batch(images: List[bytes]) -> List:
+    """
+    Encode every face of every image with one batched descriptor pass.
+
+    Returns:
+        One entry per image: a list of {"location", "encoding"} sorted by face
+        size (largest first), or a ValueError for an undecodable image.
+    """
+    import dlib
+    api = load_models()
+
+    results: List = [None] * len(images)
+    batch_images = []
+    batch_shapes = []
+    owners = []  # (image index, [face rects], scale_back)
+
+    for i, image_bytes in enumerate(images):
+        try:
+            rgb, scale_back = decode_image(image_bytes)
+        except ValueError as e:
+            results[i] = e
+            continue
+
+        rects = sorted(api.face_detector(rgb, UPSAMPLE_TIMES), key=lambda r: r.area(), reverse=True)
+        if not rects:
+            results[i] = []
+            continue
+
+        shapes = dlib.full_object_detections()
+        for rect in rects:
+            shapes.append(api.pose_predictor_68_point(rgb, rect))
+        batch_images.append(rgb)
+        batch_shapes.append(shapes)
+        owners.append((i, rects, scale_back))
+
+    if batch_images:
+        descriptors = api.face_encoder.compute_face_descriptor(batch_images, batch_shapes, 1)
+        for (i, rects, scale_back), faces in zip(owners, descriptors):
+            results[i] = [
+                {"location": _location(rect, scale_back), "encoding": np.asarray(descriptor, dtype=np.float32)}
+                for rect, descriptor in zip(rects, faces)
+            ]
+    return results
+
+
+class FaceGallery:
+    """Known faces of one gallery as a single float32 matrix."""
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.labels: List[Optional[str]] = []
+        self.matrix = np.empty((0, EMBEDDING_SIZE), np.float32)
+        self._positions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def replace(self, entries: List[Dict]):
+        """Replace the whole gallery with [{"id", "encoding", "label"}]."""
+        ids = [str(e["id"]) for e in entries]
+        labels = [e.get("label") for e in entries]
+        matrix = np.asarray([e["encoding"] for e in entries], dtype=np.float32).reshape(-1, EMBEDDING_SIZE)
+        with self._lock:
+            self.ids, self.labels, self.matrix = ids, labels, matrix
+            self._positions = {face_id: i for i, face_id in enumerate(ids)}
+
+    def upsert(self, face_id: str, encoding, label: Optional[str] = None):
+        vector = np.asarray(encoding, dtype=np.float32).reshape(1, EMBEDDING_SIZE)
+        with self._lock:
+            position = self._positions.get(face_id)
+            if position is not None:
+                self.matrix[position] = vector
+                self.labels[position] = label
+            else:
+                self._positions[face_id] = len(self.ids)
+                self.ids.append(face_id)
+                self.labels.append(label)
+                self.matrix = np.vstack([self.matrix, vector])
+
+    def remove(self, face_id: str) -> bool:
+        with self._lock:
+            position = self._positions.pop(face_id, None)
+            if position is None:
+                return False
+            self.matrix = np.delete(self.matrix, position, axis=0)
+            del self.ids[position]
+            del self.labels[position]
+            self._positions = {fid: i for i, fid in enumerate(self.ids)}
+            return True
+
+    def match(self, encoding, top_k: int = 1, threshold: float = MATCH_THRESHOLD) -> List[Dict]:
+        """Up to top_k known faces within threshold, nearest first."""
+        with self._lock:
+            matrix, ids, labels = self.matrix, self.ids, self.labels
+        if not len(ids):
+            return []
+        distances = np.linalg.norm(matrix - np.asarray(encoding, dtype=np.float32), axis=1)
+        k = min(top_k, len(distances))
+        nearest = np.argpartition(distances, k - 1)[:k]
+        nearest = nearest[np.argsort(distances[nearest])]
+        return [
+            {
+                "id": ids[i],
+                "label": labels[i],
+                "distance": float(distances[i]),
+                "confidence": round(max(0.0, 1 - float(distances[i])), 4)
+            }
+            for i in nearest if distances[i] <= threshold
+        ]
+
+
+_galleries: Dict[str, FaceGallery] = {}
+
+
+def get_gallery(gallery_id: str, create: bool = False) -> Optional[FaceGallery]:
+    gallery = _galleries.get(gallery_id)
+    if gallery is None and create:
+        gallery = _galleries[gallery_id] = FaceGallery()
+    return gallery
@@ -0,0 +1,69 @@
+"""
+Face encoding throughput benchmark
+
+Fires N concurrent requests at /api/encode/face (or /api/recognize/face) and
+reports throughput, latency percentiles and the average micro-batch size the
+service formed. Compare runs with FACE_MAX_BATCH=1 (no batching) against the
+default to see the effect of batching.
+
+Run with: docker compose exec ml-service python -m benchmarks.bench_face_throughput --image face.jpg
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+async def run(args):
+    with open(args.image, "rb") as f:
+        image = f.read()
+
+    endpoint = "/api/recognize/face" if args.gallery else "/api/encode/face"
+    data = {"gallery_id": args.gallery} if args.gallery else None
+    latencies = []
+    failures = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=60) as client:
+        before = (await client.get("/health")).json()
+
+        async def one():
+            nonlocal failures
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(endpoint, files={"image": ("face.jpg", image, "image/jpeg")}, data=data)
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    failures += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(args.requests)))
+        elapsed = time.perf_counter() - started
+
+        after = (await client.get("/health")).json()
+
+    batches = after.get("face_batches", 0) - before.get("face_batches", 0)
+    latencies.sort()
+    print(f"endpoint      {endpoint}")
+    print(f"requests      {args.requests} (concurrency {args.concurrency}, failures {failures})")
+    print(f"throughput    {args.requests / elapsed:.1f} req/s")
+    print(f"latency p50   {statistics.median(latencies) * 1000:.0f} ms")
+    print(f"latency p95   {latencies[int(len(latencies) * 0.95) - 1] * 1000:.0f} ms")
+    if batches:
+        print(f"avg batch     {args.requests / batches:.1f} images")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--image", required=True, help="JPEG/PNG containing a face")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--gallery", help="Benchmark /api/recognize/face against this gallery id")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()